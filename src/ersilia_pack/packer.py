@@ -4,6 +4,8 @@ import shutil
 import argparse
 import datetime
 import json
+import subprocess
+import tempfile
 import urllib.request
 import uuid
 
@@ -13,7 +15,8 @@ from .parsers import (
   YAMLInstallParser,
 )
 from .utils import logger, run_command
-from .templates.default import generic_example_output_file
+from .templates.default import generic_example_input_file, generic_example_output_file
+from .templates.footprint import FootprintStore, PeakRss
 
 root = os.path.dirname(os.path.abspath(__file__))
 
@@ -182,6 +185,23 @@ class FastApiAppPacker(object):
     files = [
       ("run_uvicorn.py", os.path.join(self.bundle_dir, "run_uvicorn.py")),
       ("utils.py", os.path.join(app_dir, "utils.py")),
+      ("runner.py", os.path.join(app_dir, "runner.py")),
+      ("pool.py", os.path.join(app_dir, "pool.py")),
+      ("batcher.py", os.path.join(app_dir, "batcher.py")),
+      ("chunking.py", os.path.join(app_dir, "chunking.py")),
+      ("cgroups.py", os.path.join(app_dir, "cgroups.py")),
+      ("footprint.py", os.path.join(app_dir, "footprint.py")),
+      ("scheduler.py", os.path.join(app_dir, "scheduler.py")),
+      ("sharedmem.py", os.path.join(app_dir, "sharedmem.py")),
+      ("hedging.py", os.path.join(app_dir, "hedging.py")),
+      ("retry.py", os.path.join(app_dir, "retry.py")),
+      ("jobstore.py", os.path.join(app_dir, "jobstore.py")),
+      ("affinity.py", os.path.join(app_dir, "affinity.py")),
+      ("warmup.py", os.path.join(app_dir, "warmup.py")),
+      ("strategy.py", os.path.join(app_dir, "strategy.py")),
+      ("coordinator.py", os.path.join(app_dir, "coordinator.py")),
+      ("passthrough.py", os.path.join(app_dir, "passthrough.py")),
+      ("taskio.py", os.path.join(app_dir, "taskio.py")),
       ("default.py", os.path.join(app_dir, "default.py")),
       ("exceptions/handlers.py", os.path.join(app_dir, "exceptions", "handlers.py")),
       ("exceptions/errors.py", os.path.join(app_dir, "exceptions", "errors.py")),
@@ -190,6 +210,7 @@ class FastApiAppPacker(object):
       ("routers/metadata.py", os.path.join(app_dir, "routers", "metadata.py")),
       ("routers/run.py", os.path.join(app_dir, "routers", "run.py")),
       ("routers/job.py", os.path.join(app_dir, "routers", "job.py")),
+      ("routers/apis.py", os.path.join(app_dir, "routers", "apis.py")),
       ("routers/docs.py", os.path.join(app_dir, "routers", "docs.py")),
       ("routers/health.py", os.path.join(app_dir, "routers", "health.py")),
     ]
@@ -249,14 +270,58 @@ class FastApiAppPacker(object):
 
   def _modify_python_exe(self):
     python_exe = self.install_writer.get_python_exe()
-    with open(os.path.join(self.bundle_dir, "model", "framework", "run.sh"), "r") as f:
-      lines = f.readlines()
-    lines = [l.rstrip(os.linesep) for l in lines]
-    for i, l in enumerate(lines):
-      if l.startswith("python"):
-        lines[i] = l.replace("python", python_exe)
-    with open(os.path.join(self.bundle_dir, "model", "framework", "run.sh"), "w") as f:
-      f.write(os.linesep.join(lines))
+    framework_dir = os.path.join(self.bundle_dir, "model", "framework")
+    sh_files = [
+      os.path.join(framework_dir, f"{api_name}.sh")
+      for api_name in self._get_api_names_from_sh()
+    ]
+    resident_sh = os.path.join(framework_dir, "resident", "run.sh")
+    if os.path.exists(resident_sh):
+      sh_files += [resident_sh]
+    for sh_file in sh_files:
+      with open(sh_file, "r") as f:
+        lines = f.readlines()
+      lines = [l.rstrip(os.linesep) for l in lines]
+      for i, l in enumerate(lines):
+        if l.startswith("python"):
+          lines[i] = l.replace("python", python_exe)
+      with open(sh_file, "w") as f:
+        f.write(os.linesep.join(lines))
+
+  def _seed_footprint(self):
+    # Measure the example run so the server plans workers from real memory use
+    # instead of the model's size on disk until it has its own measurements.
+    framework_dir = os.path.join(self.bundle_dir, "model", "framework")
+    input_file = os.path.join(framework_dir, "examples", generic_example_input_file)
+    if not os.path.exists(input_file):
+      api_name = self._get_api_names_from_sh()[0]
+      input_file = os.path.join(
+        framework_dir, "examples", f"{api_name}_{generic_example_input_file}"
+      )
+    if not os.path.exists(input_file):
+      logger.warning("No example input found, memory footprint not seeded")
+      return
+    with tempfile.TemporaryDirectory() as tmp:
+      output_file = os.path.join(tmp, generic_example_output_file)
+      run_sh = os.path.join(framework_dir, "run.sh")
+      app_dir = os.path.join(self.bundle_dir, "app")
+      proc = subprocess.Popen([
+        "bash",
+        run_sh,
+        framework_dir,
+        input_file,
+        output_file,
+        app_dir,
+      ])
+      with PeakRss(proc.pid) as rss:
+        code = proc.wait()
+    if code != 0:
+      logger.warning(f"Example run exited with {code}, memory footprint not seeded")
+      return
+    FootprintStore(os.path.join(self.bundle_dir, "footprint.json")).record(
+      self.model_id, rss.peak
+    )
+    logger.debug(f"Example run peaked at {rss.peak / 2**20:.1f} MiB")
 
   def _write_api_schema(self):
     # This is a dropin method. It should be more sophisticated
@@ -335,6 +400,7 @@ class FastApiAppPacker(object):
     self._write_install_file()
     self._install_packages()
     self._modify_python_exe()
+    self._seed_footprint()
     self._write_api_schema()
     self._write_status_file()
 
@@ -7,13 +7,14 @@ from .utils import find_free_port, logger
 
 
 class BundleServer(object):
-  def __init__(self, bundle_path, host, port):
+  def __init__(self, bundle_path, host, port, peers=None):
     self.bundle_path = os.path.abspath(bundle_path)
     self._resolve_bundle_path()
     self.host = host
     if port is None:
       port = find_free_port(self.host)
     self.port = port
+    self.peers = peers or []
 
   def _resolve_bundle_path(self):
     subfolders = os.listdir(self.bundle_path)
@@ -36,7 +37,11 @@ class BundleServer(object):
       "--port",
       str(self.port),
     ]
-    subprocess.run(cmd, check=True)
+    env = dict(os.environ)
+    if self.peers:
+      logger.info("Coordinating peers: {0}".format(", ".join(self.peers)))
+      env["COORDINATOR_PEERS"] = ",".join(self.peers)
+    subprocess.run(cmd, check=True, env=env)
     logger.info("App served successfully")
 
 
@@ -60,8 +65,15 @@ def main():
     type=int,
     help="An integer for the port",
   )
+  parser.add_argument(
+    "--peers",
+    default=None,
+    type=str,
+    help="Comma-separated URLs of bundle servers of the same model to shard batches across",
+  )
   args = parser.parse_args()
-  bs = BundleServer(args.bundle_path, args.host, args.port)
+  peers = [url.strip() for url in (args.peers or "").split(",") if url.strip()]
+  bs = BundleServer(args.bundle_path, args.host, args.port, peers)
   bs.serve()
 
 
@@ -0,0 +1,147 @@
+import contextlib, glob, os, re, psutil
+
+from .default import THREAD_LIMITS, CPU_PINNING, THREADS_PER_WORKER, logger
+
+# Torch sizes its intra-op pool from OMP_NUM_THREADS (and MKL_NUM_THREADS).
+THREAD_ENV_VARS = (
+  "OMP_NUM_THREADS",
+  "MKL_NUM_THREADS",
+  "OPENBLAS_NUM_THREADS",
+  "NUMEXPR_NUM_THREADS",
+  "VECLIB_MAXIMUM_THREADS",
+)
+NODE_ROOT = "/sys/devices/system/node"
+
+
+def allowed_cpus():
+  try:
+    return sorted(os.sched_getaffinity(0))
+  except AttributeError:
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpulist(text):
+  """Parse a kernel CPU list such as `0-3,8-11`."""
+  cpus = []
+  for part in text.strip().split(","):
+    if "-" in part:
+      first, last = part.split("-")
+      cpus.extend(range(int(first), int(last) + 1))
+    elif part:
+      cpus.append(int(part))
+  return cpus
+
+
+def numa_nodes(root=NODE_ROOT):
+  """CPUs of each NUMA node, or [] where the topology is not exposed."""
+  paths = glob.glob(os.path.join(root, "node[0-9]*", "cpulist"))
+  paths.sort(key=lambda p: int(re.search(r"node(\d+)", p).group(1)))
+  nodes = []
+  for path in paths:
+    try:
+      with open(path) as f:
+        nodes.append(parse_cpulist(f.read()))
+    except (OSError, ValueError):
+      return []
+  return nodes
+
+
+def cpu_sets(n_sets, cpus=None, nodes=None, n_cpus=None):
+  """Split `cpus` into `n_sets` disjoint sets of near-equal size.
+
+  CPUs are taken node by node, so a set stays on one NUMA node whenever the
+  node's CPUs divide evenly. Only the first `n_cpus` are used, e.g. to match a
+  CPU quota smaller than the affinity mask. With more sets than CPUs, sets
+  share CPUs.
+  """
+  cpus = allowed_cpus() if cpus is None else list(cpus)
+  nodes = numa_nodes() if nodes is None else nodes
+  allowed = set(cpus)
+  ordered = [cpu for node in nodes for cpu in node if cpu in allowed]
+  seen = set(ordered)
+  ordered += [cpu for cpu in cpus if cpu not in seen]
+  if n_cpus:
+    ordered = ordered[: max(1, n_cpus)]
+  n_sets = max(1, n_sets)
+  if n_sets >= len(ordered):
+    return [[ordered[i % len(ordered)]] for i in range(n_sets)]
+  size, extra = divmod(len(ordered), n_sets)
+  sets, start = [], 0
+  for i in range(n_sets):
+    end = start + size + (i < extra)
+    sets.append(ordered[start:end])
+    start = end
+  return sets
+
+
+class Placement:
+  """Gives each model run a CPU set and a matching thread count.
+
+  `n_cpus` of the allowed CPUs are split into `n_sets` sets, one per concurrent
+  run, and each run takes the set with the fewest runs on it. The counters live in
+  shared memory created from `context`, so the API process and its pool
+  workers see the same ones. Children get the `THREAD_ENV_VARS` set to the size
+  of their set (or `threads`) unless the server's environment already sets
+  them. With `pin`, they are also bound to their set right after they start.
+  """
+
+  def __init__(
+    self,
+    n_sets,
+    context,
+    pin=CPU_PINNING,
+    threads=THREADS_PER_WORKER,
+    limit=THREAD_LIMITS,
+    n_cpus=None,
+  ):
+    self.sets = cpu_sets(n_sets, n_cpus=n_cpus)
+    self.pin = pin
+    self.threads = threads
+    self.limit = limit
+    self._busy = context.Array("i", len(self.sets))
+
+  @contextlib.contextmanager
+  def assign(self):
+    lock = self._busy.get_lock()
+    with lock:
+      idx = min(range(len(self.sets)), key=self._busy.__getitem__)
+      self._busy[idx] += 1
+    try:
+      yield self.sets[idx]
+    finally:
+      with lock:
+        self._busy[idx] -= 1
+
+  def env(self, cpus=None):
+    """Environment for a child running on `cpus` (a typical set if None)."""
+    if not self.limit:
+      return None
+    threads = self.threads or len(cpus or self.sets[0])
+    env = dict(os.environ)
+    for var in THREAD_ENV_VARS:
+      env.setdefault(var, str(threads))
+    return env
+
+  def bind(self, pid, cpus):
+    if not self.pin:
+      return
+    try:
+      os.sched_setaffinity(pid, cpus)
+    except (AttributeError, OSError) as e:
+      logger.warning("Could not pin process %s: %s", pid, e)
+
+  def bind_tree(self, pid, cpus):
+    """Bind every thread of `pid` and of its descendants, e.g. of a resident
+    runner whose threads were started before this run got its set."""
+    if not self.pin:
+      return
+    try:
+      root = psutil.Process(pid)
+      procs = [root, *root.children(recursive=True)]
+      threads = [thread.id for proc in procs for thread in proc.threads()]
+    except psutil.Error as e:
+      logger.warning("Could not pin process %s: %s", pid, e)
+      return
+    for tid in threads:
+      with contextlib.suppress(AttributeError, OSError):
+        os.sched_setaffinity(tid, cpus)
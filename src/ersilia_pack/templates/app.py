@@ -1,4 +1,4 @@
-import sys
+import asyncio, sys
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -9,11 +9,24 @@ from .default import (
   ROOT,
   ENVIRONMENT,
   ALLOWED_ORIGINS,
+  LOADED_AT_STARTUP,
+  ASYNC_EXECUTION,
 )
 from .exceptions.handlers import register_exception_handlers
 from .middleware.rcontext import RequestContextMiddleware
-from .routers import docs, metadata, run, health, job
-from .utils import get_sync_metadata, create_limiter, init_redis
+from .routers import docs, metadata, run, health, job, apis
+from .utils import (
+  get_scheduler,
+  get_sync_metadata,
+  create_limiter,
+  init_redis,
+  close_async_redis,
+  micro_batcher,
+)
+from .runner import close_runners, close_async_runners
+from .pool import init_worker_pool, shutdown_worker_pool
+from .taskio import run_janitor
+from .warmup import mark_ready, warm_up
 
 sys.path.insert(0, ROOT)
 
@@ -43,6 +56,30 @@ if ENVIRONMENT == "prod":
 @app.on_event("startup")
 async def startup_event():
   init_redis()
+  # Sizes the CPU placement of the pools, so it comes first.
+  get_scheduler()
+  # Only the blocking path runs chunks in the process pool; spawn it up front then.
+  init_worker_pool(warm_up=not ASYNC_EXECUTION)
+  app.state.janitor = asyncio.ensure_future(run_janitor())
+  if LOADED_AT_STARTUP:
+    # Served meanwhile, but reported NOT_READY until the model is warm.
+    app.state.warmup = asyncio.ensure_future(warm_up())
+  else:
+    mark_ready()
+  app.state.job_rescan = asyncio.ensure_future(job.rescan_jobs())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+  app.state.janitor.cancel()
+  app.state.job_rescan.cancel()
+  if LOADED_AT_STARTUP:
+    app.state.warmup.cancel()
+  micro_batcher.close()
+  shutdown_worker_pool()
+  close_runners()
+  await close_async_runners()
+  await close_async_redis()
 
 
 register_exception_handlers(app)
@@ -51,5 +88,6 @@ app.add_middleware(RequestContextMiddleware)
 app.include_router(metadata.router)
 app.include_router(run.router)
 app.include_router(job.router)
+app.include_router(apis.router)
 app.include_router(docs.router)
 app.include_router(health.router)
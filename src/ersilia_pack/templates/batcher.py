@@ -0,0 +1,154 @@
+import collections, contextlib, threading, time
+from concurrent.futures import Future, InvalidStateError
+from functools import partial
+
+from .default import MAX_BATCH_SIZE, MAX_WAIT_TIME, MAX_BATCH_DELAY, cprint
+
+Entry = collections.namedtuple("Entry", "inputs future queued deadline cancelled")
+
+
+class AllSet:
+  """Set once every one of `tokens` is set."""
+
+  def __init__(self, tokens):
+    self.tokens = tokens
+
+  def is_set(self):
+    return all(token.is_set() for token in self.tokens)
+
+
+class MicroBatcher:
+  """Merges the inputs of concurrent small requests into a single model run.
+
+  Requests are queued per key until `max_batch_size` inputs are waiting or the
+  oldest request has waited `max_wait_time` seconds.
+  `run_batch(key, inputs, deadline, cancelled)` must return a future resolving
+  to `(results, header)`, whose rows are then handed back to every request in
+  submission order. A batch gets the latest deadline of its requests and is
+  cancelled once all of them are, as it still serves the others until then.
+  If a batch of several requests fails, each request is run again on its own,
+  so an input the model fails on only fails its own request.
+  """
+
+  def __init__(
+    self,
+    run_batch,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_time=min(MAX_WAIT_TIME, MAX_BATCH_DELAY / 1000),
+  ):
+    self.run_batch = run_batch
+    self.max_batch_size = max(1, max_batch_size)
+    self.max_wait_time = max(0.0, max_wait_time)
+    self._cond = threading.Condition()
+    self._queues = {}
+    self._thread = None
+    self._closed = False
+
+  def accepts(self, inputs):
+    return 0 < len(inputs) <= self.max_batch_size
+
+  def submit(self, key, inputs, deadline=None, cancelled=None):
+    """Queue the inputs of one request; `deadline` is a `time.monotonic()`
+    value and `cancelled` anything with `is_set()`, both optional."""
+    future = Future()
+    with self._cond:
+      if self._closed:
+        raise RuntimeError("Micro-batcher is closed")
+      if self._thread is None:
+        self._thread = threading.Thread(
+          target=self._loop, name="ersilia-batcher", daemon=True
+        )
+        self._thread.start()
+      entry = Entry(list(inputs), future, time.monotonic(), deadline, cancelled)
+      self._queues.setdefault(key, []).append(entry)
+      self._cond.notify()
+    return future
+
+  def close(self):
+    with self._cond:
+      self._closed = True
+      self._cond.notify()
+
+  def _loop(self):
+    while True:
+      with self._cond:
+        while True:
+          if self._closed:
+            return
+          key, entries, timeout = self._next_batch()
+          if entries:
+            break
+          self._cond.wait(timeout)
+      self._dispatch(key, entries)
+
+  def _next_batch(self):
+    now, timeout = time.monotonic(), None
+    for key, queue in self._queues.items():
+      if not queue:
+        continue
+      size = sum(len(entry.inputs) for entry in queue)
+      waited = now - queue[0].queued
+      if size >= self.max_batch_size or waited >= self.max_wait_time:
+        return key, self._take(queue), None
+      remaining = self.max_wait_time - waited
+      timeout = remaining if timeout is None else min(timeout, remaining)
+    return None, None, timeout
+
+  def _take(self, queue):
+    entries, size = [], 0
+    while queue and (not entries or size + len(queue[0].inputs) <= self.max_batch_size):
+      entry = queue.pop(0)
+      entries.append(entry)
+      size += len(entry.inputs)
+    return entries
+
+  def _dispatch(self, key, entries):
+    inputs = [x for entry in entries for x in entry.inputs]
+    cprint(f"Micro-batch of {len(entries)} requests ({len(inputs)} inputs)", fg="blue")
+    deadlines = [entry.deadline for entry in entries]
+    deadline = None if None in deadlines else max(deadlines)
+    tokens = [entry.cancelled for entry in entries]
+    cancelled = None if None in tokens else AllSet(tokens)
+    try:
+      batch_future = self.run_batch(key, inputs, deadline, cancelled)
+    except Exception as e:
+      self._fail(entries, e)
+      return
+    batch_future.add_done_callback(partial(self._scatter, key, entries))
+
+  @staticmethod
+  def _fail(entries, exc):
+    for entry in entries:
+      with contextlib.suppress(InvalidStateError):
+        entry.future.set_exception(exc)
+
+  def _retry_apart(self, key, entries, exc):
+    cprint(
+      f"Micro-batch of {len(entries)} requests failed ({exc}), retrying them apart",
+      fg="yellow",
+    )
+    for entry in entries:
+      gone = entry.cancelled is not None and entry.cancelled.is_set()
+      if gone or entry.future.done():
+        self._fail([entry], exc)
+      else:
+        self._dispatch(key, [entry])
+
+  def _scatter(self, key, entries, batch_future):
+    try:
+      results, header = batch_future.result()
+      expected = sum(len(entry.inputs) for entry in entries)
+      if len(results) != expected:
+        raise ValueError(f"Micro-batch returned {len(results)} rows for {expected}")
+    except BaseException as e:
+      if len(entries) > 1:
+        self._retry_apart(key, entries, e)
+      else:
+        self._fail(entries, e)
+      return
+    offset = 0
+    for entry in entries:
+      size = len(entry.inputs)
+      with contextlib.suppress(InvalidStateError):
+        entry.future.set_result((results[offset : offset + size], header))
+      offset += size
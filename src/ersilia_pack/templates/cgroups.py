@@ -0,0 +1,131 @@
+import os
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PROC_CGROUP = "/proc/self/cgroup"
+V1_UNLIMITED = 2**60  # v1 reports "no limit" as a page-aligned LONG_MAX
+
+
+def _read(path):
+  try:
+    with open(path, "r") as f:
+      return f.read().strip()
+  except OSError:
+    return None
+
+
+def _read_int(path):
+  value = _read(path)
+  if value is None or value == "max":
+    return None
+  try:
+    return int(value)
+  except ValueError:
+    return None
+
+
+def _read_stat(path, field):
+  contents = _read(path)
+  if not contents:
+    return 0
+  for line in contents.splitlines():
+    name, _, value = line.partition(" ")
+    if name == field:
+      return int(value)
+  return 0
+
+
+def _own_paths(proc_cgroup):
+  """Map each controller (or "" for the v2 unified hierarchy) to our cgroup path."""
+  paths = {}
+  for line in (_read(proc_cgroup) or "").splitlines():
+    parts = line.split(":", 2)
+    if len(parts) != 3:
+      continue
+    _, controllers, path = parts
+    for controller in controllers.split(",") if controllers else [""]:
+      paths[controller] = path.lstrip("/")
+  return paths
+
+
+def _candidates(base, path):
+  # Inside a container the namespaced path is usually "/" while the host path in
+  # /proc/self/cgroup does not exist, so fall back to the mount root.
+  if path:
+    yield os.path.join(base, path)
+  yield base
+
+
+def _first_existing(base, path, filename):
+  for folder in _candidates(base, path):
+    if os.path.exists(os.path.join(folder, filename)):
+      return folder
+  return None
+
+
+def _v2_limits(root, path):
+  folder = _first_existing(root, path, "cgroup.controllers")
+  if folder is None:
+    return None
+  cpu = None
+  cpu_max = _read(os.path.join(folder, "cpu.max"))
+  if cpu_max:
+    quota, _, period = cpu_max.partition(" ")
+    if quota != "max" and period:
+      cpu = int(quota) / int(period)
+  usage = _read_int(os.path.join(folder, "memory.current"))
+  if usage is not None:
+    usage -= _read_stat(os.path.join(folder, "memory.stat"), "inactive_file")
+  return {
+    "version": 2,
+    "cpu_limit": cpu,
+    "memory_limit": _read_int(os.path.join(folder, "memory.max")),
+    "memory_usage": usage,
+  }
+
+
+def _v1_limits(root, paths):
+  cpu = None
+  for name in ("cpu", "cpu,cpuacct"):
+    folder = _first_existing(
+      os.path.join(root, name), paths.get("cpu", ""), "cpu.cfs_quota_us"
+    )
+    if folder is None:
+      continue
+    quota = _read_int(os.path.join(folder, "cpu.cfs_quota_us"))
+    period = _read_int(os.path.join(folder, "cpu.cfs_period_us"))
+    if quota and quota > 0 and period:
+      cpu = quota / period
+    break
+  limit = usage = None
+  folder = _first_existing(
+    os.path.join(root, "memory"), paths.get("memory", ""), "memory.limit_in_bytes"
+  )
+  if folder is not None:
+    limit = _read_int(os.path.join(folder, "memory.limit_in_bytes"))
+    if limit is not None and limit >= V1_UNLIMITED:
+      limit = None
+    usage = _read_int(os.path.join(folder, "memory.usage_in_bytes"))
+    if usage is not None:
+      usage -= _read_stat(os.path.join(folder, "memory.stat"), "total_inactive_file")
+  if cpu is None and limit is None and usage is None:
+    return None
+  return {"version": 1, "cpu_limit": cpu, "memory_limit": limit, "memory_usage": usage}
+
+
+def read_cgroup_limits(root=CGROUP_ROOT, proc_cgroup=PROC_CGROUP):
+  """Return the CPU and memory limits of the cgroup this process runs in.
+
+  `cpu_limit` is in cores and `memory_limit` / `memory_usage` in bytes, with
+  reclaimable page cache excluded from usage. Values are None when there is no
+  limit or no cgroup information (e.g. outside Linux).
+  """
+  paths = _own_paths(proc_cgroup)
+  limits = _v2_limits(root, paths.get("", "")) or _v1_limits(root, paths)
+  if limits is None:
+    return {
+      "version": None,
+      "cpu_limit": None,
+      "memory_limit": None,
+      "memory_usage": None,
+    }
+  return limits
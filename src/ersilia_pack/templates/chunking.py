@@ -0,0 +1,162 @@
+import heapq, importlib, itertools, math, threading, numpy
+
+from .default import CHUNK_MULTIPLIER, CHUNK_COST_DECAY, ADAPTIVE_CHUNKING, cprint
+from .default import CHUNK_FIXED_COST_FLOOR, ITEM_COST_FUNCTION
+
+
+class ChunkCostModel:
+  """Running per-model estimate of a chunk's wall time as `fixed + per_item * n`.
+
+  Every finished chunk is folded into exponentially decayed least-squares sums,
+  so the estimate follows the model as inputs and machine load change. Until
+  chunks of at least two different sizes have been seen the split between fixed
+  and per-item cost is unknown and `chunk_count` falls back to a fixed multiple
+  of the worker count.
+  """
+
+  def __init__(self, decay=CHUNK_COST_DECAY, multiplier=CHUNK_MULTIPLIER):
+    self.decay = decay
+    self.multiplier = multiplier
+    self._stats = {}
+    self._lock = threading.Lock()
+
+  def record(self, key, n_items, seconds):
+    if n_items <= 0 or seconds < 0:
+      return
+    with self._lock:
+      w, sn, st, snn, snt = self._stats.get(key, (0.0, 0.0, 0.0, 0.0, 0.0))
+      d = self.decay
+      self._stats[key] = (
+        d * w + 1,
+        d * sn + n_items,
+        d * st + seconds,
+        d * snn + n_items * n_items,
+        d * snt + n_items * seconds,
+      )
+
+  def estimate(self, key):
+    """Return `(fixed, per_item)` seconds, or None if not identifiable yet."""
+    with self._lock:
+      stats = self._stats.get(key)
+    if stats is None:
+      return None
+    w, sn, st, snn, snt = stats
+    den = w * snn - sn * sn
+    if den <= 1e-9 * w * snn:
+      return None
+    per_item = (w * snt - sn * st) / den
+    fixed = (st - per_item * sn) / w
+    if per_item < 0:
+      return st / w, 0.0
+    if fixed < 0:
+      return 0.0, snt / snn
+    return fixed, per_item
+
+  def mean(self, key):
+    """Decayed mean wall time of the recorded runs, or None."""
+    with self._lock:
+      stats = self._stats.get(key)
+    return stats[2] / stats[0] if stats else None
+
+  def chunk_count(self, key, n_items, num_workers):
+    """Chunk count minimising the estimated makespan of `n_items` on `num_workers`."""
+    n_items = max(1, n_items)
+    num_workers = max(1, num_workers)
+    estimate = self.estimate(key) if ADAPTIVE_CHUNKING else None
+    if estimate is None:
+      return min(n_items, num_workers * self.multiplier)
+    fixed, per_item = estimate
+    count = optimal_chunk_count(fixed, per_item, n_items, num_workers)
+    cprint(
+      f"Chunk cost for {key}: {fixed:.3f}s + {per_item * 1000:.3f}ms/item -> {count} chunks",
+      fg="blue",
+    )
+    return count
+
+
+def optimal_chunk_count(
+  fixed, per_item, n_items, num_workers, min_fixed=CHUNK_FIXED_COST_FLOOR
+):
+  """With list scheduling the makespan is about `(k * fixed + n * per_item) / W`
+  plus one straggling chunk `fixed + n * per_item / k`, which is minimal at
+  `k = sqrt(W * n * per_item / fixed)`. Fewer than `W` chunks leaves workers
+  idle, so the result is clamped to `[W, n]`.
+
+  A fit whose fixed cost comes out near zero (noisy timings, or the clamp in
+  `ChunkCostModel.estimate`) would ask for one chunk per item, so `fixed` is
+  raised to at least `min_fixed` seconds, which must be positive.
+  """
+  if min_fixed <= 0:
+    raise ValueError(f"Fixed chunk cost floor must be positive, got {min_fixed}")
+  fixed = max(fixed, min_fixed)
+  if per_item <= 0:
+    count = num_workers
+  else:
+    count = round(math.sqrt(num_workers * n_items * per_item / fixed))
+  return min(n_items, max(num_workers, count))
+
+
+chunk_costs = ChunkCostModel()
+
+
+def input_length(item):
+  return len(str(item))
+
+
+def load_item_cost(path=ITEM_COST_FUNCTION):
+  """Resolve the per-input cost function from a "module:function" path.
+
+  Defaults to the input's string length, a fair proxy for molecule size.
+  """
+  if not path:
+    return input_length
+  module, _, name = path.partition(":")
+  return getattr(importlib.import_module(module), name)
+
+
+item_cost = load_item_cost()
+
+
+def pack_chunks(data, num_chunks, cost=None):
+  """Partition `data` into `num_chunks` chunks of similar total cost.
+
+  Longest-processing-time first: inputs are taken from most to least costly and
+  each goes to the currently cheapest chunk. Returns the row indices of every
+  chunk, most costly chunk first so that it is dispatched first; rows within a
+  chunk keep their input order.
+  """
+  cost = cost or item_cost
+  num_chunks = max(1, min(num_chunks, len(data)))
+  costs = [cost(x) for x in data]
+  heap = [(0, i) for i in range(num_chunks)]
+  rows = [[] for _ in range(num_chunks)]
+  for idx in sorted(range(len(data)), key=costs.__getitem__, reverse=True):
+    load, chunk_idx = heap[0]
+    rows[chunk_idx].append(idx)
+    heapq.heapreplace(heap, (load + costs[idx], chunk_idx))
+  loads = dict((chunk_idx, load) for load, chunk_idx in heap)
+  order = sorted(range(num_chunks), key=lambda i: -loads[i])
+  return [sorted(rows[i]) for i in order if rows[i]]
+
+
+def contiguous_rows(sizes):
+  rows, start = [], 0
+  for size in sizes:
+    rows.append(range(start, start + size))
+    start += size
+  return rows
+
+
+def restore_order(rows, results):
+  """Put results concatenated in chunk order back into input order."""
+  if isinstance(results, numpy.ndarray):
+    index = numpy.fromiter(
+      itertools.chain.from_iterable(rows), dtype=numpy.intp, count=len(results)
+    )
+    restored = numpy.empty_like(results)
+    restored[index] = results
+    return restored
+  restored = [None] * len(results)
+  for idx, row in zip(itertools.chain.from_iterable(rows), results):
+    restored[idx] = row
+  return restored
@@ -0,0 +1,272 @@
+import contextlib, json, socket, threading, time, urllib.parse, numpy, orjson
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+
+from fastapi import status
+
+from .default import (
+  COORDINATOR_PEERS,
+  PEER_RETRIES,
+  PEER_HEALTH_TIMEOUT,
+  MAX_TIMEOUT,
+  DISCONNECT_POLL_INTERVAL,
+  ErrorMessages,
+  cprint,
+  logger,
+)
+from .exceptions.errors import AppException
+from .retry import RowError
+
+
+class PeerResponseError(Exception):
+  """A peer answered with a body that cannot be decoded."""
+
+
+# Unreachable or timed out peers, HTTP errors and malformed responses. Any other
+# error is a bug of our own and is not blamed on the peer.
+PEER_ERRORS = (OSError, HTTPException, PeerResponseError)
+# What decoding a malformed body raises.
+DECODE_ERRORS = (ValueError, KeyError, TypeError, IndexError)
+
+
+def weighted_shards(n_items, weights):
+  """Split `range(n_items)` into contiguous `(start, end)` ranges, one per
+  weight and sized in proportion to it (largest remainder rounding)."""
+  total = sum(weights)
+  exact = [n_items * w / total for w in weights]
+  sizes = [int(x) for x in exact]
+  by_remainder = sorted(range(len(weights)), key=lambda i: sizes[i] - exact[i])
+  for i in by_remainder[: n_items - sum(sizes)]:
+    sizes[i] += 1
+  shards, start = [], 0
+  for size in sizes:
+    shards.append((start, start + size))
+    start += size
+  return shards
+
+
+def decode_heavy(payload):
+  """`(array, header)` of a `/run?output_type=heavy` response body."""
+  header_line, _, body = payload.partition(b"\n")
+  try:
+    info = json.loads(header_line)
+    values = numpy.frombuffer(body, dtype=numpy.dtype(info["dtype"]))
+    return values.reshape(info["shape"]), info["dims"]
+  except DECODE_ERRORS as e:
+    raise PeerResponseError(f"Malformed heavy response: {e}") from e
+
+
+def decode_split(payload):
+  """`(rows, header)` of a `/run?orient=split` response body."""
+  try:
+    split = orjson.loads(payload)
+    rows = split["data"]
+    for i, error in enumerate(split.get("errors") or ()):
+      if error is not None:
+        rows[i] = RowError(error)
+    return rows, split["columns"]
+  except DECODE_ERRORS as e:
+    raise PeerResponseError(f"Malformed split response: {e}") from e
+
+
+class InFlight:
+  """Connections of the shard requests of one batch. Aborting shuts them down,
+  so the peers see a client disconnect and cancel their chunks."""
+
+  def __init__(self):
+    self._connections = set()
+    self._lock = threading.Lock()
+    self.aborted = False
+
+  def add(self, connection):
+    with self._lock:
+      if self.aborted:
+        raise ConnectionAbortedError("The batch was aborted")
+      self._connections.add(connection)
+
+  def discard(self, connection):
+    with self._lock:
+      self._connections.discard(connection)
+
+  def abort(self):
+    with self._lock:
+      self.aborted = True
+      connections = list(self._connections)
+    for connection in connections:
+      with contextlib.suppress(AttributeError, OSError):
+        connection.sock.shutdown(socket.SHUT_RDWR)
+
+
+class Peer:
+  """A bundle server serving the same model as the coordinator."""
+
+  def __init__(self, url):
+    self.url = url.rstrip("/")
+    self.failures = 0
+
+  def _request(self, path, body=None, timeout=MAX_TIMEOUT, in_flight=None):
+    url = urllib.parse.urlsplit(self.url + path)
+    connection_cls = HTTPSConnection if url.scheme == "https" else HTTPConnection
+    connection = connection_cls(url.hostname, url.port, timeout=timeout)
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    target = f"{url.path}?{url.query}" if url.query else url.path
+    try:
+      connection.connect()
+      if in_flight is not None:
+        in_flight.add(connection)
+      connection.request("GET" if body is None else "POST", target, body, headers)
+      response = connection.getresponse()
+      payload = response.read()
+    finally:
+      if in_flight is not None:
+        in_flight.discard(connection)
+      connection.close()
+    if response.status >= 400:
+      raise HTTPException(f"{self.url}{path} returned HTTP {response.status}")
+    return payload
+
+  def capacity(self):
+    """Free scheduler slots of the peer per `/healthz`, or None if not ready."""
+    payload = self._request("/healthz", timeout=PEER_HEALTH_TIMEOUT)
+    try:
+      health = orjson.loads(payload)
+      if not health["warmup"]["ready"]:
+        return None
+      scheduler = health["scheduler"]
+      return max(1.0, scheduler["limit"] - scheduler["in_use"] - scheduler["queued"])
+    except DECODE_ERRORS as e:
+      raise PeerResponseError(f"Malformed /healthz response: {e}") from e
+
+  def run(self, inputs, heavy, deadline, in_flight=None):
+    """Run `inputs` on the peer with what is left until `deadline` (a
+    `time.monotonic()` value) as both its request timeout and ours."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      raise TimeoutError("The request deadline passed")
+    body = orjson.dumps(inputs)
+    query = f"timeout={remaining:.3f}&" + (
+      "output_type=heavy" if heavy else "orient=split"
+    )
+    payload = self._request(f"/run?{query}", body, remaining, in_flight)
+    return decode_heavy(payload) if heavy else decode_split(payload)
+
+
+class Coordinator:
+  """Runs batches on peer bundle servers instead of the local model.
+
+  Each batch is split into contiguous shards, one per ready peer and sized by
+  the free slots it reports on `/healthz`. Shards of heavy requests travel in
+  the binary heavy format and all others as split JSON, so peers run the model
+  with the same I/O as a local run would. A shard whose peer fails
+  is sent to the ready peer with the most free slots that has not failed in
+  this batch, at most `retries` times. The shards are merged in input order.
+
+  Peers get the time left until the request deadline as their own timeout.
+  Past the deadline, or once the caller cancels, the shard requests in flight
+  are shut down so the peers stop working on them too. Health probes run on
+  their own executor, so they never queue behind long shard runs.
+  """
+
+  def __init__(self, urls, retries=PEER_RETRIES):
+    self.peers = [Peer(url) for url in urls]
+    self.retries = retries
+    self._executor = ThreadPoolExecutor(
+      max_workers=2 * len(self.peers), thread_name_prefix="peer"
+    )
+    self._probes = ThreadPoolExecutor(
+      max_workers=len(self.peers), thread_name_prefix="peer-probe"
+    )
+    self._lock = threading.Lock()
+
+  def _probe(self, peer):
+    try:
+      return peer.capacity()
+    except PEER_ERRORS as e:
+      logger.warning("Peer %s is unreachable: %s", peer.url, e)
+      return None
+
+  def capacities(self):
+    return dict(zip(self.peers, self._probes.map(self._probe, self.peers)))
+
+  def run(self, data, heavy, deadline=None, cancelled=None):
+    """Return `(results, header)` of `data` computed by the peers.
+
+    With `heavy`, results come back as one typed array. `deadline` is a
+    `time.monotonic()` value (`MAX_TIMEOUT` from now by default) and
+    `cancelled` an optional `threading.Event` set once the client is gone.
+    """
+    if not data:
+      return [], None
+    if deadline is None:
+      deadline = time.monotonic() + MAX_TIMEOUT
+    ready = {p: c for p, c in self.capacities().items() if c is not None}
+    if not ready:
+      raise AppException(status.HTTP_503_SERVICE_UNAVAILABLE, ErrorMessages.NO_PEERS)
+    peers = list(ready)
+    shards = weighted_shards(len(data), [ready[p] for p in peers])
+    cprint(
+      "Sharding {} inputs across peers: {}".format(
+        len(data), ", ".join(f"{p.url}={e - s}" for p, (s, e) in zip(peers, shards))
+      ),
+      fg="blue",
+    )
+    pending, tries, failed, outputs = {}, {}, set(), {}
+    in_flight = InFlight()
+
+    def submit(idx, peer):
+      start, end = shards[idx]
+      future = self._executor.submit(
+        peer.run, data[start:end], heavy, deadline, in_flight
+      )
+      pending[future] = (idx, peer)
+
+    try:
+      for idx, peer in enumerate(peers):
+        if shards[idx][1] > shards[idx][0]:
+          tries[idx] = 0
+          submit(idx, peer)
+      while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          raise AppException(status.HTTP_504_GATEWAY_TIMEOUT, ErrorMessages.TIMEOUT)
+        if cancelled is not None:
+          if cancelled.is_set():
+            raise AppException(499, ErrorMessages.CLIENT_DISCONNECTED)
+          remaining = min(remaining, DISCONNECT_POLL_INTERVAL)
+        done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+          idx, peer = pending.pop(future)
+          try:
+            outputs[idx] = future.result()
+            continue
+          except PEER_ERRORS as e:
+            if time.monotonic() >= deadline:
+              raise AppException(
+                status.HTTP_504_GATEWAY_TIMEOUT, ErrorMessages.TIMEOUT
+              ) from e
+            logger.warning("Shard %s failed on peer %s: %s", idx, peer.url, e)
+          with self._lock:
+            peer.failures += 1
+          failed.add(peer)
+          others = [p for p in peers if p not in failed]
+          tries[idx] += 1
+          if tries[idx] > self.retries or not others:
+            raise AppException(status.HTTP_502_BAD_GATEWAY, ErrorMessages.PEER_FAILED)
+          submit(idx, max(others, key=ready.get))
+    finally:
+      if pending:
+        for future in pending:
+          future.cancel()
+        in_flight.abort()
+    parts = [outputs[idx] for idx in sorted(outputs)]
+    header = next((h for _, h in parts if h), None)
+    if heavy:
+      return numpy.concatenate([values for values, _ in parts]), header
+    return [row for rows, _ in parts for row in rows], header
+
+  def stats(self):
+    with self._lock:
+      return [{"url": p.url, "failures": p.failures} for p in self.peers]
+
+
+coordinator = Coordinator(COORDINATOR_PEERS) if COORDINATOR_PEERS else None
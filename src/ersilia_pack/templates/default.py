@@ -1,4 +1,4 @@
-import logging, os, tempfile, traceback, sys, uuid
+import logging, os, tempfile, threading, traceback, sys, uuid
 from datetime import datetime
 from fastapi.responses import JSONResponse
 from typing import List
@@ -10,7 +10,14 @@ from pydantic import BaseModel
 ROOT = os.path.dirname(os.path.abspath(__file__))
 MODEL_VERSION = os.environ.get("MODEL_VERSION", "1.0")
 EOS_TMP = os.path.join(os.path.join(str(Path.home()), "eos"), "temp")
-EOS_TMP_TASKS = os.path.join(EOS_TMP, "tasks")
+IO_BACKEND = os.environ.get("IO_BACKEND", "disk").lower()  # disk, shm or fifo
+IO_FOLDER = os.environ.get("IO_FOLDER") or (
+  "/dev/shm" if IO_BACKEND != "disk" and os.path.isdir("/dev/shm") else None
+)
+if IO_FOLDER:
+  EOS_TMP_TASKS = os.path.join(IO_FOLDER, "ersilia-tasks")
+else:
+  EOS_TMP_TASKS = os.path.join(EOS_TMP, "tasks")
 if not os.path.exists(EOS_TMP_TASKS):
   os.makedirs(EOS_TMP_TASKS, exist_ok=True)
 RUNTIME = os.environ.get("RUNTIME", "python")
@@ -23,6 +30,67 @@ LOADED_AT_STARTUP = os.environ.get("LOADED_AT_STARTUP", "False").lower() in (
   "1",
   "yes",
 )
+WARMUP_RETRY_DELAY = float(os.environ.get("WARMUP_RETRY_DELAY", 5))  # doubles per retry
+WARMUP_RETRY_MAX_DELAY = float(os.environ.get("WARMUP_RETRY_MAX_DELAY", 300))
+RESIDENT_RUNNER = os.environ.get("RESIDENT_RUNNER", "True").lower() in (
+  "true",
+  "1",
+  "yes",
+)
+RESIDENT_MAX_IDLE = int(os.environ.get("RESIDENT_MAX_IDLE", 0))  # 0: worker budget
+POOL_START_METHOD = os.environ.get("POOL_START_METHOD", "forkserver")
+POOL_MAX_WORKERS = int(os.environ.get("POOL_MAX_WORKERS", min(16, os.cpu_count() or 1)))
+POOL_MAX_TASKS = int(os.environ.get("POOL_MAX_TASKS", 1000))  # per worker, 0 disables
+POOL_MAX_RSS_MB = int(os.environ.get("POOL_MAX_RSS_MB", 0))  # whole pool, 0 disables
+WORKER_BUDGET = int(os.environ.get("WORKER_BUDGET", 0))  # 0 derives it from resources
+THREAD_LIMITS = os.environ.get("THREAD_LIMITS", "True").lower() in ("true", "1", "yes")
+THREADS_PER_WORKER = int(os.environ.get("THREADS_PER_WORKER", 0))  # 0: CPUs per worker
+CPU_PINNING = os.environ.get("CPU_PINNING", "False").lower() in ("true", "1", "yes")
+SCHEDULER_TOLERANCE = float(os.environ.get("SCHEDULER_TOLERANCE", 2.0))
+SCHEDULER_BACKOFF = float(os.environ.get("SCHEDULER_BACKOFF", 0.9))
+SCHEDULER_DRIFT = float(os.environ.get("SCHEDULER_DRIFT", 0.01))
+ADAPTIVE_CHUNKING = os.environ.get("ADAPTIVE_CHUNKING", "True").lower() in (
+  "true",
+  "1",
+  "yes",
+)
+CHUNK_MULTIPLIER = int(os.environ.get("CHUNK_MULTIPLIER", 4))  # until costs are known
+CHUNK_COST_DECAY = float(os.environ.get("CHUNK_COST_DECAY", 0.9))
+# Least fixed cost assumed per chunk: a model run never starts for free.
+CHUNK_FIXED_COST_FLOOR = float(os.environ.get("CHUNK_FIXED_COST_FLOOR", 0.05))
+COST_AWARE_CHUNKING = os.environ.get("COST_AWARE_CHUNKING", "True").lower() in (
+  "true",
+  "1",
+  "yes",
+)
+ITEM_COST_FUNCTION = os.environ.get("ITEM_COST_FUNCTION")  # "module:function"
+STRATEGY_SELECTION = os.environ.get("STRATEGY_SELECTION", "True").lower() in (
+  "true",
+  "1",
+  "yes",
+)
+STRATEGY_EXPLORATION = float(os.environ.get("STRATEGY_EXPLORATION", 0.05))
+# Opt-in: only the sync process pool (ASYNC_EXECUTION=false) gathers results.
+SHARED_RESULTS = os.environ.get("SHARED_RESULTS", "False").lower() in (
+  "true",
+  "1",
+  "yes",
+)
+BIN_PASSTHROUGH = os.environ.get("BIN_PASSTHROUGH", "True").lower() in (
+  "true",
+  "1",
+  "yes",
+)
+HEDGING = os.environ.get("HEDGING", "False").lower() in ("true", "1", "yes")
+HEDGE_QUORUM = float(os.environ.get("HEDGE_QUORUM", 0.75))  # of chunks finished
+HEDGE_MULTIPLIER = float(os.environ.get("HEDGE_MULTIPLIER", 3.0))  # x median chunk time
+BISECT_RETRY = os.environ.get("BISECT_RETRY", "True").lower() in ("true", "1", "yes")
+BISECT_MAX_RUNS = int(os.environ.get("BISECT_MAX_RUNS", 64))  # retries per chunk
+NEGATIVE_CACHE = os.environ.get("NEGATIVE_CACHE", "False").lower() in (
+  "true",
+  "1",
+  "yes",
+)
 
 
 REDOC_JS_URL = "https://unpkg.com/redoc@next/bundles/redoc.standalone.js"
@@ -32,8 +100,34 @@ This server provides `/metrics` for Prometheus-based performance insights, `/met
 """
 FRAMEWORK_FOLDER = os.path.abspath(os.path.join(ROOT, "..", "model", "framework"))
 MODEL_ROOT = os.path.abspath(os.path.join(ROOT, "..", "model"))
-TEMP_FOLDER = tempfile.mkdtemp(prefix="ersilia-")
+RESIDENT_ENTRYPOINT = os.path.join(FRAMEWORK_FOLDER, "resident", "run.sh")
+DEFAULT_API = "run"
+_temp_folder = os.environ.get("ERSILIA_TEMP_FOLDER")
+_temp_folder_lock = threading.Lock()
+
+
+def temp_folder():
+  """This server's folder for chunk files, created on first use. Pool workers
+  are handed the server's folder by their initializer, see `set_temp_folder`."""
+  global _temp_folder
+  with _temp_folder_lock:
+    if _temp_folder is None:
+      _temp_folder = tempfile.mkdtemp(prefix="ersilia-", dir=IO_FOLDER)
+    return _temp_folder
+
+
+def set_temp_folder(folder):
+  global _temp_folder
+  with _temp_folder_lock:
+    _temp_folder = folder
+
+
 BUNDLE_FOLDER = os.path.abspath(os.path.join(ROOT, ".."))
+FOOTPRINT_FILE = os.environ.get(
+  "FOOTPRINT_FILE", os.path.join(BUNDLE_FOLDER, "footprint.json")
+)
+FOOTPRINT_WINDOW = int(os.environ.get("FOOTPRINT_WINDOW", 50))  # runs kept per model
+FOOTPRINT_INTERVAL = float(os.environ.get("FOOTPRINT_INTERVAL", 0.2))
 generic_example_output_file = "output.csv"
 generic_example_input_file = "input.csv"
 
@@ -44,13 +138,29 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_EXPIRATION = int(
   os.getenv("REDIS_EXPIRATION", 3600 * 24 * 7)
 )  # One week just as default expiration
-MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 2))
-MAX_WAIT_TIME = os.getenv("MAX_WAIT_TIME", 0.1)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 64))
+MAX_WAIT_TIME = float(os.getenv("MAX_WAIT_TIME", 0.1))
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "True").lower() in ("true", "1", "yes")
+ASYNC_EXECUTION = os.getenv("ASYNC_EXECUTION", "True").lower() in ("true", "1", "yes")
 FAIL_MAX = int(os.getenv("FAIL_MAX", 100))
 RESET_TIMEOUT = os.getenv("RESET_TIMEOUT", 60)
 RATE_LIMIT = os.getenv("RATE_LIMIT", "100/minute")
 RATE_LIMIT_LOCAL = os.getenv("RATE_LIMIT", "10000000/minute")
-DEFAULT_TIMEOUT = os.getenv("TIMEOUT", 60)  # TODO: More accurate timeout
+DEFAULT_TIMEOUT = float(os.getenv("TIMEOUT", 600))  # per request, overridable
+MAX_TIMEOUT = float(os.getenv("MAX_TIMEOUT", 3600))  # server cap on any deadline
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", 0.5))
+STALE_FILE_AGE = float(os.getenv("STALE_FILE_AGE", 2 * MAX_TIMEOUT))
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", 300))
+JOB_FOLDER = os.getenv("JOB_FOLDER") or os.path.join(os.path.dirname(EOS_TMP), "jobs")
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", 1000))  # inputs per checkpoint
+JOB_CLAIM_TTL = float(os.getenv("JOB_CLAIM_TTL", 30))  # renewed by a heartbeat
+JOB_RESCAN_INTERVAL = float(os.getenv("JOB_RESCAN_INTERVAL", 60))
+# Coordinator mode: /run and /job batches are sharded across these peer servers.
+COORDINATOR_PEERS = [
+  url.strip() for url in os.getenv("COORDINATOR_PEERS", "").split(",") if url.strip()
+]
+PEER_RETRIES = int(os.getenv("PEER_RETRIES", 2))  # other peers tried per shard
+PEER_HEALTH_TIMEOUT = float(os.getenv("PEER_HEALTH_TIMEOUT", 5))
 MAX_CPU_PERC = float(os.getenv("MAX_CPU_PERC", 90.0))
 MAX_MEM_PERC = float(os.getenv("MAX_MEM_PERC", 90.0))
 DATA_SIZE_UPPERBOUND = os.getenv("DATA_SIZE_UPPERBOUND", 10_000)
@@ -61,6 +171,7 @@ HISTOGRAM_TIME_INTERVAL = os.getenv(
   "HISTOGRAM_TIME_INTERVAL", (0.1, 0.3, 0.5, 1.0, 2.0, 3.0, 4.0)
 )
 MEDIA_TYPE = "application/octet-stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 CONTENT_DESP = "attachment; filename=result.bin"
 allowed_origins_env = os.getenv("ALLOWED_ORIGINS", "*").strip()
 if allowed_origins_env == "*":
@@ -81,11 +192,39 @@ class OrientEnum(str, Enum):
   INDEX = "index"
 
 
+class StrategyEnum(str, Enum):
+  SEQUENTIAL = "sequential"
+  THREADS = "threads"
+  PROCESSES = "processes"
+
+
 class TaskTypeEnum(str, Enum):
   HEAVY = "heavy"
   SIMPLE = "simple"
 
 
+class StreamEnum(str, Enum):
+  NDJSON = "ndjson"
+
+
+class StreamOrderEnum(str, Enum):
+  INPUT = "input"
+  COMPLETION = "completion"
+
+
+class LaneEnum(str, Enum):
+  INTERACTIVE = "interactive"
+  BATCH = "batch"
+  BACKGROUND = "background"
+
+
+LANE_WEIGHTS = {
+  LaneEnum.INTERACTIVE: float(os.environ.get("INTERACTIVE_WEIGHT", 8)),
+  LaneEnum.BATCH: float(os.environ.get("BATCH_WEIGHT", 2)),
+  LaneEnum.BACKGROUND: float(os.environ.get("BACKGROUND_WEIGHT", 1)),
+}
+
+
 class CardField(str, Enum):
   identifier = "Identifier"
   slug = "Slug"
@@ -124,12 +263,15 @@ class APIInfo(BaseModel):
 class ErrorMessages(str, Enum):
   CIRCUIT_BREAKER = "Service temporarily unavailable due to high error rate and exited by circuit breaker"
   SERVER = "Internal processing error due to a shell execution"
-  TIMEOUT = f"Processing timed out after {DEFAULT_TIMEOUT} seconds"
+  TIMEOUT = "Processing did not finish before the request deadline"
+  CLIENT_DISCONNECTED = "Client disconnected before the result was ready"
   INCONSISTENT_HEADER = "Inconsistent output headers across workers"
   RESOURCE = "System resources over threshold"
   EMPTY_DATA = "Data is empty."
   EMPTY_REQUEST = "API request is empty."
   RATE_LIMIT_EXCEEDED = "Rate limit exceeded for the request."
+  NO_PEERS = "No peer server is ready to take the batch"
+  PEER_FAILED = "A shard of the batch failed on every peer it was sent to"
 
   def to_response(self, status_code: int) -> JSONResponse:
     content = {"detail": self.value}
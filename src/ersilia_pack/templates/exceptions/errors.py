@@ -1,4 +1,6 @@
-import pybreaker, time
+import asyncio, inspect, pybreaker, time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
 from fastapi import HTTPException
 from pybreaker import CircuitMemoryStorage
 from ..default import ErrorMessages, FAIL_MAX, RESET_TIMEOUT
@@ -10,12 +12,16 @@ class AppException(Exception):
     self.error_enum = error_enum
 
 
+def _is_client_error(exc):
+  return isinstance(exc, AppException) and exc.status_code < 500
+
+
 class ProcessingCircuitBreaker(pybreaker.CircuitBreaker):
   def __init__(self):
     super().__init__(
       fail_max=FAIL_MAX,
       reset_timeout=RESET_TIMEOUT,
-      exclude=[HTTPException(status_code=400)],
+      exclude=[HTTPException(status_code=400), _is_client_error],
       state_storage=CircuitMemoryStorage(pybreaker.STATE_CLOSED),
     )
     self.last_failure_time = None
@@ -29,11 +35,64 @@ class ProcessingCircuitBreaker(pybreaker.CircuitBreaker):
       return self.last_failure_time + self.reset_timeout
     return None
 
+  def call(self, func, *args, **kwargs):
+    # pybreaker holds its lock for the whole call, which serialises every
+    # request. Only trial calls out of an open circuit need that.
+    with self._lock:
+      state = self.state
+      if state.name != pybreaker.STATE_CLOSED:
+        return state.call(func, *args, **kwargs)
+    return state.call(func, *args, **kwargs)
+
+  async def call_async(self, func, *args, **kwargs):
+    # Native coroutine counterpart of `call`. The breaker lock is never held
+    # across an await, so concurrent trial calls are not serialised.
+    with self._lock:
+      state = self.state
+      if state.name == pybreaker.STATE_OPEN:
+        opened_at = self._state_storage.opened_at
+        if opened_at and _now_like(opened_at) < opened_at + timedelta(
+          seconds=self.reset_timeout
+        ):
+          raise pybreaker.CircuitBreakerError(
+            "Timeout not elapsed yet, circuit breaker still open"
+          )
+        self.half_open()
+        state = self.state
+      for listener in self.listeners:
+        listener.before_call(self, func, *args, **kwargs)
+    try:
+      ret = await func(*args, **kwargs)
+    except asyncio.CancelledError:
+      raise
+    except BaseException as e:
+      with self._lock:
+        state._handle_error(e)
+    with self._lock:
+      state._handle_success()
+    return ret
+
+  def __call__(self, func):
+    if not inspect.iscoroutinefunction(func):
+      return super().__call__(func)
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+      return await self.call_async(func, *args, **kwargs)
+
+    return wrapper
+
   def on_failure(self, exc):
     self.last_failure_time = time.time()
     super().on_failure(exc)
 
 
+def _now_like(moment):
+  if moment.tzinfo is None:
+    return datetime.utcnow()
+  return datetime.now(timezone.utc)
+
+
 class CircuitBreakerListener(pybreaker.CircuitBreakerListener):
   def state_change(self, cb, old_state, new_state):
     print(f"Circuit state changed from {old_state} to {new_state}")
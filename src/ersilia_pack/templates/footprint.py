@@ -0,0 +1,110 @@
+import json, os, threading, psutil
+from collections import deque
+
+from .default import FOOTPRINT_FILE, FOOTPRINT_WINDOW, FOOTPRINT_INTERVAL, logger
+
+
+def tree_rss(pid):
+  try:
+    proc = psutil.Process(pid)
+    procs = [proc] + proc.children(recursive=True)
+  except psutil.Error:
+    return 0
+  total = 0
+  for p in procs:
+    try:
+      total += p.memory_info().rss
+    except psutil.Error:
+      continue
+  return total
+
+
+class PeakRss:
+  """Tracks the peak RSS of a process tree while the `with` block runs.
+
+  Sampling starts every 10ms and backs off to `interval`, so that short model
+  runs are still measured without polling long ones needlessly.
+  """
+
+  def __init__(self, pid, interval=FOOTPRINT_INTERVAL):
+    self.pid = pid
+    self.interval = interval
+    self.peak = 0
+    self._stop = threading.Event()
+    self._thread = threading.Thread(
+      target=self._sample, name="ersilia-rss", daemon=True
+    )
+
+  def _sample(self):
+    delay = 0.01
+    while True:
+      self.peak = max(self.peak, tree_rss(self.pid))
+      if self._stop.wait(delay):
+        return
+      delay = min(self.interval, delay * 2)
+
+  def __enter__(self):
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self.peak = max(self.peak, tree_rss(self.pid))
+    self._stop.set()
+    self._thread.join()
+    return False
+
+
+class FootprintStore:
+  """Rolling per-model estimate of the peak RSS of one model run.
+
+  The estimate is the largest of the last `window` samples. It is persisted as
+  JSON next to the bundle so a restarted server, or one freshly packed with a
+  seeded estimate, does not have to fall back to the model's size on disk.
+  """
+
+  def __init__(self, path=FOOTPRINT_FILE, window=FOOTPRINT_WINDOW):
+    self.path = path
+    self.window = max(1, window)
+    self._samples = {}
+    self._lock = threading.Lock()
+    self._load()
+
+  def _load(self):
+    if not self.path or not os.path.exists(self.path):
+      return
+    try:
+      with open(self.path, "r") as f:
+        data = json.load(f)
+    except (OSError, ValueError) as e:
+      logger.warning("Could not read %s: %s", self.path, e)
+      return
+    for key, samples in data.items():
+      self._samples[key] = deque((int(x) for x in samples), maxlen=self.window)
+
+  def _save(self):
+    data = {key: list(samples) for key, samples in self._samples.items()}
+    tmp = f"{self.path}.tmp"
+    try:
+      with open(tmp, "w") as f:
+        json.dump(data, f)
+      os.replace(tmp, self.path)
+    except OSError as e:
+      logger.warning("Could not write %s: %s", self.path, e)
+
+  def record(self, key, peak_bytes):
+    if not key or not peak_bytes or peak_bytes <= 0:
+      return
+    with self._lock:
+      samples = self._samples.setdefault(key, deque(maxlen=self.window))
+      before = max(samples) if samples else None
+      samples.append(int(peak_bytes))
+      if self.path and max(samples) != before:
+        self._save()
+
+  def estimate(self, key):
+    with self._lock:
+      samples = self._samples.get(key)
+      return max(samples) if samples else None
+
+
+footprints = FootprintStore()
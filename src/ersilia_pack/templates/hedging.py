@@ -0,0 +1,78 @@
+import asyncio, math, statistics
+
+from .default import HEDGE_QUORUM, HEDGE_MULTIPLIER, cprint
+
+RECHECK_INTERVAL = 0.1  # while a straggler waits for an idle slot
+
+
+async def _cancel(tasks):
+  for task in tasks:
+    task.cancel()
+  await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def gather_hedged(
+  run, n, can_hedge=lambda: True, quorum=HEDGE_QUORUM, multiplier=HEDGE_MULTIPLIER
+):
+  """Await `run(i, copy)` for every chunk `i` in `range(n)`; return the results
+  in chunk order.
+
+  Once `quorum` of the chunks have finished, a chunk running for more than
+  `multiplier` times their median time is started again as `run(i, 1)`, as soon
+  as `can_hedge()` allows. The first copy to finish wins and the other is
+  cancelled. A chunk is hedged at most once and fails only if all its copies do.
+  """
+  loop = asyncio.get_running_loop()
+  owner, started, copies = {}, {}, {}
+  hedged, durations = set(), []
+  results = [None] * n
+  needed = max(1, math.ceil(quorum * n))
+
+  def launch(i, copy):
+    task = asyncio.ensure_future(run(i, copy))
+    owner[task] = i
+    started[task] = loop.time()
+    copies.setdefault(i, set()).add(task)
+
+  for i in range(n):
+    launch(i, 0)
+  try:
+    while copies:
+      waits = []
+      if len(durations) >= needed:
+        limit = multiplier * statistics.median(durations)
+        now = loop.time()
+        for i, tasks in list(copies.items()):
+          if i in hedged:
+            continue
+          age = now - min(started[t] for t in tasks)
+          if age < limit:
+            waits.append(limit - age)
+          elif can_hedge():
+            cprint(f"Hedging chunk {i} after {age:.2f}s", fg="yellow")
+            hedged.add(i)
+            launch(i, 1)
+          else:
+            waits.append(RECHECK_INTERVAL)
+      pending = set().union(*copies.values())
+      done, _ = await asyncio.wait(
+        pending,
+        timeout=min(waits) if waits else None,
+        return_when=asyncio.FIRST_COMPLETED,
+      )
+      for task in done:
+        i = owner.pop(task)
+        if i not in copies:
+          task.cancelled() or task.exception()  # its sibling won this round
+          continue
+        copies[i].discard(task)
+        if task.exception() is not None:
+          if copies[i]:
+            continue
+          raise task.exception()
+        results[i] = task.result()
+        durations.append(loop.time() - started[task])
+        await _cancel(copies.pop(i))
+  finally:
+    await _cancel([task for tasks in copies.values() for task in tasks])
+  return results
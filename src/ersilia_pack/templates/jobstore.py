@@ -0,0 +1,245 @@
+import contextlib, os, shutil, socket, uuid, anyio, orjson
+
+from .default import JOB_FOLDER, JOB_CLAIM_TTL, REDIS_EXPIRATION, cprint
+from .retry import RowError
+from .taskio import process_token
+from . import utils
+
+# A restarted container often gets the same hostname and pid, so the random part
+# keeps it from taking the claims of its previous incarnation for its own.
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+
+job_store = None
+
+
+def dump_rows(rows, header):
+  rows = [{"error": row.message} if isinstance(row, RowError) else row for row in rows]
+  return orjson.dumps(
+    {"header": header, "rows": rows}, option=orjson.OPT_SERIALIZE_NUMPY
+  )
+
+
+def load_rows(payload):
+  chunk = orjson.loads(payload)
+  rows = [
+    RowError(row["error"]) if isinstance(row, dict) else row for row in chunk["rows"]
+  ]
+  return rows, chunk["header"]
+
+
+class JobStore:
+  """Persists `/job` submissions so they survive a restart.
+
+  A job is a set of named blobs: its `state`, its `inputs`, one `chunk-<i>` per
+  finished checkpoint and, once done, its `result`. Subclasses implement the
+  blob primitives and `claim`, which makes sure one server works on a job.
+  """
+
+  async def create(self, job_id, state, data):
+    await self.put(job_id, "inputs", orjson.dumps(data))
+    await self.put(job_id, "state", orjson.dumps(state))
+
+  async def state(self, job_id):
+    raw = await self.get(job_id, "state")
+    return orjson.loads(raw) if raw else None
+
+  async def set_status(self, job_id, status, **fields):
+    state = await self.state(job_id) or {"job_id": job_id}
+    state.update(status=status, **fields)
+    await self.put(job_id, "state", orjson.dumps(state))
+
+  async def inputs(self, job_id):
+    return orjson.loads(await self.get(job_id, "inputs"))
+
+  async def save_chunk(self, job_id, idx, rows, header):
+    payload = await anyio.to_thread.run_sync(dump_rows, rows, header)
+    await self.put(job_id, f"chunk-{idx}", payload)
+    await self.renew(job_id)
+
+  async def chunks(self, job_id):
+    """Finished checkpoints of a job, as `{idx: (rows, header)}`."""
+    chunks = {}
+    for name in await self.names(job_id):
+      if name.startswith("chunk-"):
+        raw = await self.get(job_id, name)
+        chunks[int(name[6:])] = await anyio.to_thread.run_sync(load_rows, raw)
+    return chunks
+
+  async def finish(self, job_id, result):
+    await self.put(job_id, "result", orjson.dumps(result))
+    await self.set_status(job_id, "completed")
+    names = [n for n in await self.names(job_id) if n.startswith("chunk-")]
+    await self.remove(job_id, names + ["inputs"])
+    await self.release(job_id)
+
+  async def fail(self, job_id, error):
+    await self.set_status(job_id, "failed", error=error)
+    await self.release(job_id)
+
+  async def result(self, job_id):
+    raw = await self.get(job_id, "result")
+    return orjson.loads(raw) if raw else None
+
+  async def unfinished(self):
+    states = []
+    for job_id in await self.job_ids():
+      state = await self.state(job_id)
+      if state is not None and state["status"] == "pending":
+        states.append(state)
+    return states
+
+  async def renew(self, job_id):
+    pass
+
+
+class DiskJobStore(JobStore):
+  """Keeps each job in `folder/<job_id>`, one file per blob."""
+
+  def __init__(self, folder=JOB_FOLDER):
+    self.folder = folder
+
+  def _path(self, job_id, name=None):
+    path = os.path.join(self.folder, job_id)
+    return path if name is None else os.path.join(path, name)
+
+  def _put(self, job_id, name, payload):
+    os.makedirs(self._path(job_id), exist_ok=True)
+    path = self._path(job_id, name)
+    with open(path + ".tmp", "wb") as f:
+      f.write(payload)
+    os.replace(path + ".tmp", path)
+
+  def _get(self, job_id, name):
+    try:
+      with open(self._path(job_id, name), "rb") as f:
+        return f.read()
+    except FileNotFoundError:
+      return None
+
+  def _names(self, job_id):
+    try:
+      names = os.listdir(self._path(job_id))
+    except FileNotFoundError:
+      return []
+    return [n for n in names if not n.endswith(".tmp") and n != "owner"]
+
+  def _remove(self, job_id, names):
+    for name in names:
+      with contextlib.suppress(FileNotFoundError):
+        os.remove(self._path(job_id, name))
+
+  def _job_ids(self):
+    if not os.path.isdir(self.folder):
+      return []
+    return sorted(os.listdir(self.folder))
+
+  def _claim(self, job_id):
+    os.makedirs(self._path(job_id), exist_ok=True)
+    token = process_token(os.getpid())
+    try:
+      fd = os.open(self._path(job_id, "owner"), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+    except FileExistsError:
+      owner = (self._get(job_id, "owner") or b"").decode()
+      if owner == token:
+        return True
+      pid = owner.split(":")[0]
+      if pid.isdigit() and process_token(int(pid)) == owner:
+        return False
+      self._put(job_id, "owner", token.encode())  # its owner is gone
+      return True
+    with os.fdopen(fd, "w") as f:
+      f.write(token)
+    return True
+
+  def _clear(self):
+    shutil.rmtree(self.folder, ignore_errors=True)
+
+  async def put(self, job_id, name, payload):
+    await anyio.to_thread.run_sync(self._put, job_id, name, payload)
+
+  async def get(self, job_id, name):
+    return await anyio.to_thread.run_sync(self._get, job_id, name)
+
+  async def names(self, job_id):
+    return await anyio.to_thread.run_sync(self._names, job_id)
+
+  async def remove(self, job_id, names):
+    await anyio.to_thread.run_sync(self._remove, job_id, names)
+
+  async def job_ids(self):
+    return await anyio.to_thread.run_sync(self._job_ids)
+
+  async def claim(self, job_id):
+    return await anyio.to_thread.run_sync(self._claim, job_id)
+
+  async def release(self, job_id):
+    await self.remove(job_id, ["owner"])
+
+  async def clear(self):
+    await anyio.to_thread.run_sync(self._clear)
+
+
+class RedisJobStore(JobStore):
+  """Keeps each job in the Redis hash `job:<job_id>`, one field per blob.
+
+  A claim expires `JOB_CLAIM_TTL` seconds after its owner's last heartbeat, so
+  the jobs of a server that died are picked up by the next rescan of another.
+  """
+
+  def __init__(self, client):
+    self.client = client
+
+  async def put(self, job_id, name, payload):
+    pipe = self.client.pipeline()
+    pipe.hset(f"job:{job_id}", name, payload)
+    pipe.expire(f"job:{job_id}", REDIS_EXPIRATION)
+    pipe.sadd("jobs", job_id)
+    await pipe.execute()
+
+  async def get(self, job_id, name):
+    return await self.client.hget(f"job:{job_id}", name)
+
+  async def names(self, job_id):
+    return await self.client.hkeys(f"job:{job_id}")
+
+  async def remove(self, job_id, names):
+    if names:
+      await self.client.hdel(f"job:{job_id}", *names)
+
+  async def job_ids(self):
+    job_ids = sorted(await self.client.smembers("jobs"))
+    for job_id in job_ids:
+      if not await self.client.exists(f"job:{job_id}"):
+        await self.client.srem("jobs", job_id)  # expired
+    return job_ids
+
+  async def claim(self, job_id):
+    key = f"job:{job_id}:owner"
+    if await self.client.set(key, OWNER, nx=True, ex=int(JOB_CLAIM_TTL)):
+      return True
+    return await self.client.get(key) == OWNER
+
+  async def renew(self, job_id):
+    key = f"job:{job_id}:owner"
+    if await self.client.get(key) == OWNER:
+      await self.client.expire(key, int(JOB_CLAIM_TTL))
+
+  async def release(self, job_id):
+    await self.client.delete(f"job:{job_id}:owner")
+
+  async def clear(self):
+    job_ids = await self.client.smembers("jobs")
+    keys = [f"job:{j}" for j in job_ids] + [f"job:{j}:owner" for j in job_ids]
+    await self.client.delete("jobs", *keys)
+
+
+async def get_job_store():
+  """Redis when it is reachable at first use, the local disk otherwise."""
+  global job_store
+  if job_store is None:
+    if await utils.init_async_redis():
+      job_store = RedisJobStore(utils.async_redis_client)
+    else:
+      job_store = DiskJobStore()
+    cprint(f"Checkpointing jobs with {type(job_store).__name__}", fg="blue")
+  return job_store
@@ -0,0 +1,106 @@
+import json, os, anyio, numpy
+from starlette.responses import Response
+
+
+def read_layout(path):
+  """Return `(meta, offset, size)` of a .bin file: its JSON header line, where
+  the raw array starts and the file size."""
+  with open(path, "rb") as f:
+    meta = json.loads(f.readline().decode("utf-8"))
+    offset = f.tell()
+    size = os.fstat(f.fileno()).st_size
+  return meta, offset, size
+
+
+def bin_passthrough(files, dtype):
+  """Plan a response body made of the raw arrays of `files`, in order.
+
+  `files` holds `(path, n_rows)` per chunk. Returns `(header_line, parts)`, each
+  part a `(path, offset, count)` byte range, or None when the files cannot be
+  concatenated as they are (other dtype, ragged widths or a short file).
+  """
+  dtype = numpy.dtype(dtype)
+  columns, n_cols, parts = None, None, []
+  for path, n_rows in files:
+    meta, offset, size = read_layout(path)
+    rows, cols = meta["shape"]
+    count = rows * cols * dtype.itemsize
+    if numpy.dtype(meta["dtype"]) != dtype or rows != n_rows or size - offset < count:
+      return None
+    if n_cols is None:
+      columns, n_cols = meta["columns"], cols
+    elif cols != n_cols:
+      return None
+    parts.append((path, offset, count))
+  n_rows = sum(n for _, n in files)
+  info = {"dims": columns, "shape": [n_rows, n_cols or 0], "dtype": dtype.str}
+  return (json.dumps(info) + "\n").encode("utf-8"), parts
+
+
+def _remove(paths):
+  for path in paths:
+    if os.path.exists(path):
+      os.remove(path)
+
+
+class BinFilesResponse(Response):
+  """Send a heavy response straight from the chunks' .bin output files.
+
+  The body is `header_line` followed by the `(path, offset, count)` byte ranges
+  in `parts`. Servers offering the ASGI zero-copy extension sendfile() them;
+  otherwise they are read in blocks, so the result is never held in memory as a
+  whole. The files are removed once sent or once sending fails.
+  """
+
+  chunk_size = 1024 * 1024
+
+  def __init__(self, header_line, parts, headers=None, media_type=None):
+    self.status_code = 200
+    self.media_type = media_type
+    self.background = None
+    self.header_line = header_line
+    self.parts = parts
+    self.init_headers(headers)
+    length = len(header_line) + sum(count for _, _, count in parts)
+    self.headers["content-length"] = str(length)
+
+  async def _send_blocks(self, send, path, offset, count):
+    with open(path, "rb") as f:
+      end = offset + count
+      while offset < end:
+        block = await anyio.to_thread.run_sync(
+          os.pread, f.fileno(), min(self.chunk_size, end - offset), offset
+        )
+        if not block:
+          raise OSError(f"{path} ended before byte {end}")
+        offset += len(block)
+        await send({"type": "http.response.body", "body": block, "more_body": True})
+
+  async def __call__(self, scope, receive, send):
+    zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+    try:
+      await send({
+        "type": "http.response.start",
+        "status": self.status_code,
+        "headers": self.raw_headers,
+      })
+      await send({
+        "type": "http.response.body",
+        "body": self.header_line,
+        "more_body": True,
+      })
+      for path, offset, count in self.parts:
+        if zerocopy:
+          with open(path, "rb") as f:
+            await send({
+              "type": "http.response.zerocopysend",
+              "file": f,
+              "offset": offset,
+              "count": count,
+              "more_body": True,
+            })
+        else:
+          await self._send_blocks(send, path, offset, count)
+      await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+      await anyio.to_thread.run_sync(_remove, [path for path, _, _ in self.parts])
@@ -0,0 +1,259 @@
+import multiprocessing, threading, time, psutil
+from concurrent.futures import (
+  FIRST_COMPLETED,
+  ProcessPoolExecutor,
+  ThreadPoolExecutor,
+  wait,
+)
+
+from .default import (
+  DEFAULT_API,
+  POOL_START_METHOD,
+  POOL_MAX_WORKERS,
+  POOL_MAX_TASKS,
+  POOL_MAX_RSS_MB,
+  DISCONNECT_POLL_INTERVAL,
+  cprint,
+  temp_folder,
+)
+from . import runner
+from .affinity import Placement
+from .runner import RunCancelled, current_api, init_worker
+
+worker_pools = {}
+_pools_lock = threading.Lock()
+placements = {}  # start method -> Placement shared by all pools using it
+_placements_lock = threading.Lock()
+worker_slots, worker_cpus = 1, None  # see `set_worker_budget`
+
+
+def resolve_start_method(start_method):
+  available = multiprocessing.get_all_start_methods()
+  if start_method in available:
+    return start_method
+  fallback = "spawn" if "spawn" in available else available[0]
+  cprint(f"Start method {start_method} unavailable, using {fallback}", fg="yellow")
+  return fallback
+
+
+class WorkerPool:
+  """App-lifetime process and thread pools shared by every request to one API.
+
+  Workers run their tasks with `api` as the current API and place model runs
+  with the shared `placement`. The process pool is replaced by a fresh one once
+  it has run `max_tasks` tasks per worker or once its workers exceed
+  `max_rss_mb` in total. The previous pool is shut down without waiting so
+  in-flight chunks finish undisturbed.
+  """
+
+  def __init__(
+    self,
+    max_workers=POOL_MAX_WORKERS,
+    start_method=POOL_START_METHOD,
+    max_tasks=POOL_MAX_TASKS,
+    max_rss_mb=POOL_MAX_RSS_MB,
+    preload=None,
+    api=DEFAULT_API,
+  ):
+    self.api = api
+    self.max_workers = max(1, max_workers)
+    self.start_method = resolve_start_method(start_method)
+    self.max_tasks = max_tasks
+    self.max_rss_mb = max_rss_mb
+    self.preload = preload if preload is not None else [f"{__package__}.utils"]
+    self.generation = 0
+    self._tasks = 0
+    self._lock = threading.Lock()
+    self._context = multiprocessing.get_context(self.start_method)
+    if self.start_method == "forkserver" and self.preload:
+      self._context.set_forkserver_preload(self.preload)
+    self.placement = get_placement(self.start_method, self._context)
+    self._processes = None
+    self._threads = ThreadPoolExecutor(
+      max_workers=self.max_workers,
+      thread_name_prefix=f"ersilia-{api}",
+      initializer=init_worker,
+      initargs=(api, self.placement),
+    )
+
+  def _new_process_pool(self):
+    self.generation += 1
+    cprint(
+      f"Starting {self.api} process pool #{self.generation} ({self.start_method}, {self.max_workers} workers)",
+      fg="blue",
+    )
+    return ProcessPoolExecutor(
+      max_workers=self.max_workers,
+      mp_context=self._context,
+      initializer=init_worker,
+      initargs=(self.api, self.placement, temp_folder()),
+    )
+
+  def _worker_processes(self):
+    executor = self._processes
+    if executor is None:
+      return []
+    return list((getattr(executor, "_processes", None) or {}).values())
+
+  def rss_mb(self):
+    total = 0
+    for proc in self._worker_processes():
+      try:
+        total += psutil.Process(proc.pid).memory_info().rss
+      except (psutil.Error, ValueError):
+        continue
+    return total / (1024 * 1024)
+
+  def _should_recycle(self):
+    if self.max_tasks and self._tasks >= self.max_tasks * self.max_workers:
+      return True
+    if self.max_rss_mb and self.rss_mb() > self.max_rss_mb:
+      return True
+    return False
+
+  def _process_pool(self):
+    with self._lock:
+      if self._processes is None:
+        self._processes = self._new_process_pool()
+      elif self._should_recycle():
+        old = self._processes
+        self._processes = self._new_process_pool()
+        self._tasks = 0
+        old.shutdown(wait=False)
+      self._tasks += 1
+      return self._processes
+
+  def submit(self, fn, *args, threads=False):
+    if threads:
+      return self._threads.submit(fn, *args)
+    return self._process_pool().submit(fn, *args)
+
+  def map(
+    self,
+    fn,
+    *iterables,
+    max_in_flight=None,
+    threads=False,
+    timeout=None,
+    gate=None,
+    cancelled=None,
+    on_abort=None,
+  ):
+    """Like `Executor.map` but keeps at most `max_in_flight` tasks submitted.
+
+    With a `gate`, `gate.acquire()` is called before each submission and
+    `gate.release()` once that task is done, e.g. to take scheduler slots.
+    Once `cancelled` (anything with `is_set()`) is set, `RunCancelled` is
+    raised. Tasks not started when the map stops early are cancelled; with
+    `on_abort`, it is called and the running ones are waited for, e.g. to
+    have them kill their model runs before the caller moves on.
+    """
+    limit = max(1, min(max_in_flight or self.max_workers, self.max_workers))
+    deadline = None if timeout is None else time.monotonic() + timeout
+    tasks = list(zip(*iterables))
+    futures, running = [], set()
+
+    def top_up():
+      while len(futures) < len(tasks) and len(running) < limit:
+        if gate is None:
+          future = self.submit(fn, *tasks[len(futures)], threads=threads)
+        else:
+          gate.acquire()
+          try:
+            future = self.submit(fn, *tasks[len(futures)], threads=threads)
+          except BaseException:
+            gate.release()
+            raise
+          future.add_done_callback(lambda _: gate.release())
+        futures.append(future)
+        running.add(future)
+
+    try:
+      top_up()
+      for i in range(len(tasks)):
+        while not futures[i].done():
+          remaining = None if deadline is None else max(0, deadline - time.monotonic())
+          if cancelled is not None:
+            poll = DISCONNECT_POLL_INTERVAL
+            remaining = poll if remaining is None else min(remaining, poll)
+          done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+          if not done:
+            if deadline is not None and time.monotonic() >= deadline:
+              raise TimeoutError(f"Chunk {i} did not finish within {timeout} seconds")
+            if cancelled.is_set():
+              raise RunCancelled(f"Chunk {i} was cancelled")
+          running.difference_update(done)
+          top_up()
+        running.discard(futures[i])
+        top_up()
+        future, futures[i] = futures[i], None
+        yield future.result()
+    finally:
+      started = [future for future in running if not future.cancel()]
+      if started and on_abort is not None:
+        on_abort()
+        wait(started)
+
+  def warm_up(self):
+    executor = self._process_pool()
+    for future in [executor.submit(time.sleep, 0) for _ in range(self.max_workers)]:
+      future.result()
+
+  def shutdown(self, wait=True):
+    with self._lock:
+      executor, self._processes = self._processes, None
+    if executor is not None:
+      executor.shutdown(wait=wait, cancel_futures=True)
+    self._threads.shutdown(wait=wait, cancel_futures=True)
+
+
+def set_worker_budget(slots, n_cpus=None):
+  """Size placements and idle resident runners by the scheduler's `slots` and
+  the `n_cpus` the cgroup quota allows. `utils` calls this when it creates the
+  scheduler, before any pool is started."""
+  global worker_slots, worker_cpus
+  worker_slots, worker_cpus = slots, n_cpus
+  runner.worker_slots = slots
+
+
+def get_placement(start_method, context):
+  """CPU placement of model runs, one per start method since its shared
+  counters can only be handed to workers of the context that created them.
+
+  There is one CPU set per scheduler slot, taken from the CPUs the cgroup
+  quota allows, so concurrent runs never start more threads than there are.
+  """
+  with _placements_lock:
+    if start_method not in placements:
+      placements[start_method] = Placement(worker_slots, context, n_cpus=worker_cpus)
+    if runner.placement is None:
+      runner.placement = placements[start_method]
+    return placements[start_method]
+
+
+def init_worker_pool(warm_up=True, api=DEFAULT_API):
+  with _pools_lock:
+    pool = worker_pools.get(api)
+    created = pool is None
+    if created:
+      pool = worker_pools[api] = WorkerPool(api=api)
+  if created and warm_up:
+    pool.warm_up()
+  return pool
+
+
+def get_worker_pool(api=None):
+  """Pool of `api`, by default the current one, created on first use."""
+  api = api or current_api.get()
+  pool = worker_pools.get(api)
+  if pool is None:
+    return init_worker_pool(warm_up=False, api=api)
+  return pool
+
+
+def shutdown_worker_pool():
+  with _pools_lock:
+    pools = list(worker_pools.values())
+    worker_pools.clear()
+  for pool in pools:
+    pool.shutdown()
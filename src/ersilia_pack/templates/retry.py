@@ -0,0 +1,88 @@
+import asyncio, subprocess
+
+from .default import BISECT_MAX_RUNS, cprint
+from .runner import ResidentRunnerError
+
+# Failures that may come from the inputs; anything else fails the request.
+MODEL_ERRORS = (subprocess.CalledProcessError, ResidentRunnerError, FileNotFoundError)
+
+
+class RowError:
+  """Result row of an input the model failed on."""
+
+  __slots__ = ("message",)
+
+  def __init__(self, message):
+    self.message = message
+
+  def __eq__(self, other):
+    return isinstance(other, RowError) and other.message == self.message
+
+  def __repr__(self):
+    return f"RowError({self.message!r})"
+
+
+def _describe(error):
+  if isinstance(error, subprocess.CalledProcessError):
+    return f"Model exited with code {error.returncode}"
+  return str(error) or type(error).__name__
+
+
+class Bisector:
+  """Retries a failed chunk in halves until the inputs that fail are isolated.
+
+  `run(items, key)` runs the model on `items` and returns `(results, header)`;
+  `key` tells the runs apart, e.g. for their file names. A single input that
+  still fails gets a `RowError` row. At most `max_runs` retries are made, after
+  which the last error is raised, so a model that fails on every input does not
+  run once per input.
+  """
+
+  def __init__(self, max_runs=BISECT_MAX_RUNS):
+    self.runs_left = max_runs
+
+  def _halves(self, chunk, key, error):
+    if self.runs_left < 2:
+      raise error
+    self.runs_left -= 2
+    mid = len(chunk) // 2
+    cprint(
+      f"Chunk of {len(chunk)} inputs failed ({error}), retrying halves", fg="yellow"
+    )
+    return (chunk[:mid], f"{key}a"), (chunk[mid:], f"{key}b")
+
+  def run(self, run, chunk, key=""):
+    try:
+      return run(chunk, key)
+    except MODEL_ERRORS as e:
+      if len(chunk) == 1:
+        return [RowError(_describe(e))], None
+      outputs = [self.run(run, half, k) for half, k in self._halves(chunk, key, e)]
+    return _join(outputs)
+
+  async def run_async(self, run, chunk, key=""):
+    try:
+      return await run(chunk, key)
+    except MODEL_ERRORS as e:
+      if len(chunk) == 1:
+        return [RowError(_describe(e))], None
+      halves = self._halves(chunk, key, e)
+    tasks = [asyncio.ensure_future(self.run_async(run, h, k)) for h, k in halves]
+    try:
+      outputs = await asyncio.gather(*tasks)
+    finally:
+      for task in tasks:
+        task.cancel()
+      await asyncio.gather(*tasks, return_exceptions=True)
+    return _join(outputs)
+
+
+def _join(outputs):
+  (a, header_a), (b, header_b) = outputs
+  return list(a) + list(b), header_a if header_a is not None else header_b
+
+
+def count_row_errors(results):
+  if not isinstance(results, list):
+    return 0
+  return sum(1 for row in results if isinstance(row, RowError))
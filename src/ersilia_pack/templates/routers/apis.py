@@ -0,0 +1,125 @@
+import uuid, sys
+from enum import Enum
+from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, Query, Request, status
+from fastapi.responses import ORJSONResponse
+from ..input_schemas.compound.single import InputSchema, exemplary_input
+from ..utils import (
+  get_metadata,
+  orient_to_json,
+  run_cached_or_compute,
+  compute_apis_async,
+  create_limiter,
+  rate_limit,
+  extract_input,
+  available_apis,
+  api_model_id,
+  dedupe_inputs,
+  fan_out,
+  is_model_variable,
+  resolve_timeout,
+  run_with_deadline,
+  to_thread,
+)
+from ..runner import api
+from ..exceptions.errors import breaker
+from ..default import OrientEnum, ErrorMessages
+from ..default import ROOT
+from ..exceptions.errors import AppException
+
+sys.path.insert(0, ROOT)
+
+router = APIRouter()
+limiter = create_limiter()
+
+ApiEnum = Enum("ApiEnum", {name: name for name in available_apis()}, type=str)
+
+
+def _read_input(requests):
+  if not requests:
+    raise AppException(status.HTTP_400_BAD_REQUEST, ErrorMessages.EMPTY_REQUEST)
+  data = extract_input(requests.model_dump())
+  if not data:
+    raise AppException(status.HTTP_422_UNPROCESSABLE_ENTITY, ErrorMessages.EMPTY_DATA)
+  return data
+
+
+@router.get("/apis", tags=["APIs"])
+async def list_apis(request: Request):
+  return [name.value for name in ApiEnum]
+
+
+@router.post("/apis", tags=["APIs"])
+@breaker
+@limiter.limit(rate_limit())
+async def run_apis(
+  request: Request,
+  requests: InputSchema = Body(..., example=exemplary_input),
+  apis: List[ApiEnum] = Query(...),
+  orient: OrientEnum = Query(OrientEnum.RECORDS),
+  min_workers: int = Query(1, ge=1),
+  max_workers: int = Query(16, ge=1),
+  timeout: Optional[float] = Query(None, gt=0),
+  metadata: dict = Depends(get_metadata),
+):
+  data = _read_input(requests)
+  names = list(dict.fromkeys(name.value for name in apis))
+  if is_model_variable(metadata):
+    unique, positions = data, None
+  else:
+    unique, positions = await to_thread(dedupe_inputs, data)
+  outputs = await run_with_deadline(
+    compute_apis_async(
+      unique, str(uuid.uuid4()), names, max_workers, min_workers, metadata
+    ),
+    resolve_timeout(timeout),
+    request,
+  )
+  response = {}
+  for name, (results, header) in outputs.items():
+    if positions is not None:
+      results = fan_out(results, positions)
+    response[name] = await to_thread(
+      orient_to_json, results, header, data, orient, metadata["Output Type"]
+    )
+  return ORJSONResponse(response)
+
+
+@router.post("/apis/{api_name}", tags=["APIs"])
+@breaker
+@limiter.limit(rate_limit())
+async def run_api(
+  request: Request,
+  api_name: ApiEnum,
+  requests: InputSchema = Body(..., example=exemplary_input),
+  orient: OrientEnum = Query(OrientEnum.RECORDS),
+  fetch_cache: bool = Query(False),
+  save_cache: bool = Query(False),
+  cache_only: bool = Query(False),
+  min_workers: int = Query(1, ge=1),
+  max_workers: int = Query(16, ge=1),
+  timeout: Optional[float] = Query(None, gt=0),
+  metadata: dict = Depends(get_metadata),
+):
+  data = _read_input(requests)
+  model_id = api_model_id(metadata["Identifier"], api_name.value)
+  with api(api_name.value):
+    results, header = await run_with_deadline(
+      run_cached_or_compute(
+        model_id,
+        data,
+        str(uuid.uuid4()),
+        max_workers,
+        min_workers,
+        {**metadata, "Identifier": model_id},
+        fetch_cache,
+        save_cache,
+        cache_only,
+      ),
+      resolve_timeout(timeout),
+      request,
+    )
+  results = await to_thread(
+    orient_to_json, results, header, data, orient, metadata["Output Type"]
+  )
+  return ORJSONResponse(results)
@@ -1,14 +1,17 @@
 import psutil
 from fastapi import APIRouter
 
+from ..coordinator import coordinator
 from ..exceptions.errors import breaker
+from ..utils import resource_limits, get_scheduler
+from ..warmup import warmup_status
 
 
 router = APIRouter()
 
 
 @router.get("/healthz", tags=["Monitoring"])
-def health_check():
+async def health_check():
   status = {
     "breaker": {
       "state": breaker.current_state,
@@ -18,5 +21,9 @@ def health_check():
       "next_reset": breaker.next_reset,
     },
     "system": {"cpu": psutil.cpu_percent(), "memory": psutil.virtual_memory().percent},
+    "limits": resource_limits(),
+    "scheduler": get_scheduler().stats(),
+    "warmup": warmup_status(),
+    "peers": coordinator.stats() if coordinator is not None else None,
   }
   return status
@@ -7,16 +7,27 @@ from ..input_schemas.compound.single import InputSchema, exemplary_input
 from ..utils import (
   get_metadata,
   orient_to_json,
-  get_cached_or_compute,
+  run_cached_or_compute,
   create_limiter,
   rate_limit,
   extract_input,
   cprint,
-  to_thread,
+  run_with_deadline,
+  concat_results,
+  first_header,
 )
 from ..exceptions.errors import breaker
-from ..default import OrientEnum, ErrorMessages
-from ..default import ROOT
+from ..jobstore import get_job_store
+from ..scheduler import lane
+from ..default import OrientEnum, ErrorMessages, LaneEnum
+from ..default import (
+  ROOT,
+  MAX_TIMEOUT,
+  JOB_CHUNK_SIZE,
+  JOB_CLAIM_TTL,
+  JOB_RESCAN_INTERVAL,
+  logger,
+)
 from ..exceptions.errors import AppException
 
 sys.path.insert(0, ROOT)
@@ -36,6 +47,7 @@ async def run(
   orient: OrientEnum = Query(OrientEnum.RECORDS),
   min_workers: int = Query(1, ge=1),
   max_workers: int = Query(12, ge=1),
+  priority: LaneEnum = Query(LaneEnum.BATCH),
   metadata: dict = Depends(get_metadata),
 ):
   if not requests:
@@ -48,6 +60,15 @@ async def run(
 
   job_id = str(uuid.uuid4())
   jobs[job_id] = {"status": "pending", "result": None}
+  state = {
+    "job_id": job_id,
+    "status": "pending",
+    "orient": orient,
+    "min_workers": min_workers,
+    "max_workers": max_workers,
+    "priority": priority,
+  }
+  await (await get_job_store()).create(job_id, state, data)
 
   asyncio.create_task(
     process_job(
@@ -58,6 +79,7 @@ async def run(
       min_workers=min_workers,
       metadata=metadata,
       orient=orient,
+      priority=priority,
     )
   )
 
@@ -72,30 +94,117 @@ async def process_job(
   min_workers: int,
   metadata: dict,
   orient,
+  priority=LaneEnum.BATCH,
 ):
+  """Run a job `JOB_CHUNK_SIZE` inputs at a time, checkpointing each chunk's
+  results, so a resumed job only computes the chunks it had not finished."""
+  store = await get_job_store()
+  if not await store.claim(job_id):
+    cprint(f"Job {job_id} is already running elsewhere", fg="yellow")
+    jobs.pop(job_id, None)  # left to the store, so a later rescan can take it over
+    return
+  heartbeat = asyncio.ensure_future(_heartbeat(store, job_id))
   try:
-    results, header = await to_thread(
-      breaker.call,
-      get_cached_or_compute,
-      identifier,
-      data,
-      job_id,
-      max_workers,
-      min_workers,
-      metadata,
-    )
+    done = await store.chunks(job_id)
+    if done:
+      cprint(f"Resuming job {job_id} after {len(done)} chunks", fg="blue")
+    starts = range(0, len(data), JOB_CHUNK_SIZE)
+    with lane(priority):
+      for idx, start in enumerate(starts):
+        if idx in done:
+          continue
+        chunk = data[start : start + JOB_CHUNK_SIZE]
+        results, header = await run_with_deadline(
+          breaker.call_async(
+            run_cached_or_compute,
+            identifier,
+            chunk,
+            f"{job_id}-{idx}",
+            max_workers,
+            min_workers,
+            metadata,
+          ),
+          MAX_TIMEOUT,
+        )
+        await store.save_chunk(job_id, idx, results, header)
+        done[idx] = (results, header)
+    order = sorted(done)
+    results = concat_results([done[idx][0] for idx in order])
+    header = first_header(done[idx][1] for idx in order)
     results = orient_to_json(results, header, data, orient, metadata["Output Type"])
+    await store.finish(job_id, results)
     jobs[job_id]["result"] = results
     jobs[job_id]["status"] = "completed"
   except Exception as e:
     cprint(f"Exception has occured when collecting the result: {e}")
     jobs[job_id]["status"] = "failed"
     jobs[job_id]["result"] = {"error": str(e)}
+    await store.fail(job_id, str(e))
+  finally:
+    heartbeat.cancel()
+
+
+async def _heartbeat(store, job_id, interval=JOB_CLAIM_TTL / 3):
+  """Keep the claim on a running job alive between checkpoints."""
+  while True:
+    await asyncio.sleep(interval)
+    try:
+      await store.renew(job_id)
+    except Exception as e:
+      logger.warning("Could not renew the claim on job %s: %s", job_id, e)
+
+
+async def resume_jobs():
+  """Restart the unfinished jobs nobody works on, e.g. left by a dead server."""
+  store = await get_job_store()
+  states = await store.unfinished()
+  if not states:
+    return
+  metadata = await get_metadata()
+  for state in states:
+    job_id = state["job_id"]
+    if job_id in jobs or not await store.claim(job_id):
+      continue
+    jobs[job_id] = {"status": "pending", "result": None}
+    asyncio.create_task(
+      process_job(
+        job_id=job_id,
+        identifier=metadata["Identifier"],
+        data=await store.inputs(job_id),
+        max_workers=state["max_workers"],
+        min_workers=state["min_workers"],
+        metadata=metadata,
+        orient=state["orient"],
+        priority=state["priority"],
+      )
+    )
+
+
+async def rescan_jobs(interval=JOB_RESCAN_INTERVAL):
+  while True:
+    try:
+      await resume_jobs()
+    except Exception as e:
+      logger.warning("Could not resume unfinished jobs: %s", e)
+    await asyncio.sleep(interval)
+
+
+async def _find_job(job_id):
+  job = jobs.get(job_id)
+  if job is not None:
+    return job
+  # Finished by an earlier server, or by another one sharing the store.
+  store = await get_job_store()
+  state = await store.state(job_id)
+  if state is None:
+    return None
+  result = await store.result(job_id) if state["status"] == "completed" else None
+  return {"status": state["status"], "result": result}
 
 
 @router.get("/status/{job_id}")
 async def get_job_status(job_id: str):
-  job = jobs.get(job_id)
+  job = await _find_job(job_id)
   if not job:
     raise HTTPException(status_code=404, detail="Job not found")
   return {"job_id": job_id, "status": job["status"]}
@@ -103,7 +212,7 @@ async def get_job_status(job_id: str):
 
 @router.get("/result/{job_id}")
 async def get_job_result(job_id: str):
-  job = jobs.get(job_id)
+  job = await _find_job(job_id)
   if not job:
     raise HTTPException(status_code=404, detail="Job not found")
   if job["status"] != "completed":
@@ -114,4 +223,5 @@ async def get_job_result(job_id: str):
 @router.post("/jobs/reset")
 async def reset_jobs():  # TODO: this ofcourse requires admin auth
   jobs.clear()
+  await (await get_job_store()).clear()
   return {"message": "All jobs have been reset."}
@@ -4,9 +4,9 @@ from typing import Dict, List, Union, Any
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 
+from .. import default
 from ..default import CardField, Worker, APIInfo
 from ..default import (
-  ROOT_ENDPOINT_LOADED,
   API_ID,
   API_START_TIME,
   MODEL_VERSION,
@@ -59,8 +59,8 @@ async def get_specific_field(
 
 
 def compute_status() -> str:
-  global ROOT_ENDPOINT_LOADED
-  return "READY" if ROOT_ENDPOINT_LOADED else "NOT_READY"
+  # Set once the startup warm-up has run, see `warmup.py`.
+  return "READY" if default.ROOT_ENDPOINT_LOADED else "NOT_READY"
 
 
 @router.get("/", tags=["Root"])
@@ -1,24 +1,44 @@
 import uuid, sys
+from typing import Optional
 from fastapi import APIRouter, Body, Depends, Query, Request, status
 from fastapi.responses import ORJSONResponse
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from ..input_schemas.compound.single import InputSchema, exemplary_input
 from ..utils import (
   get_metadata,
   orient_to_json,
   load_csv_data,
-  get_cached_or_compute,
+  run_cached_or_compute,
   create_limiter,
   rate_limit,
   extract_input,
   generate_resp_body,
+  stream_ndjson,
+  compute_heavy_files_async,
+  has_duplicates,
+  load_bin_files,
+  resolve_dtype,
+  resolve_timeout,
+  run_with_deadline,
+  strategy_report,
+  to_thread,
 )
 from ..exceptions.errors import breaker
-from ..default import OrientEnum, ErrorMessages, TaskTypeEnum
+from ..passthrough import BinFilesResponse, bin_passthrough
+from ..default import (
+  OrientEnum,
+  ErrorMessages,
+  TaskTypeEnum,
+  StreamEnum,
+  StreamOrderEnum,
+)
 from ..default import (
   ROOT,
   CONTENT_DESP,
   MEDIA_TYPE,
+  NDJSON_MEDIA_TYPE,
+  BIN_PASSTHROUGH,
+  COORDINATOR_PEERS,
   generic_example_input_file,
   generic_example_output_file,
   cprint,
@@ -68,10 +88,21 @@ async def columns_output(request: Request):
   return header
 
 
+@router.get("/run/strategy", tags=["Run"])
+async def strategy(
+  request: Request,
+  n: int = Query(1, ge=1),
+  min_workers: int = Query(1, ge=1),
+  max_workers: int = Query(16, ge=1),
+  metadata: dict = Depends(get_metadata),
+):
+  return await to_thread(strategy_report, n, max_workers, min_workers, metadata)
+
+
 @router.post("/run", tags=["Run"])
 @breaker
 @limiter.limit(rate_limit())
-def run(
+async def run(
   request: Request,
   requests: InputSchema = Body(..., example=exemplary_input),
   orient: OrientEnum = Query(OrientEnum.RECORDS),
@@ -81,6 +112,9 @@ def run(
   min_workers: int = Query(1, ge=1),
   max_workers: int = Query(16, ge=1),
   output_type: str = Query("simple"),
+  stream: Optional[StreamEnum] = Query(None),
+  order: StreamOrderEnum = Query(StreamOrderEnum.INPUT),
+  timeout: Optional[float] = Query(None, gt=0),
   metadata: dict = Depends(get_metadata),
 ):
   if not requests:
@@ -91,35 +125,113 @@ def run(
   if not data:
     raise AppException(status.HTTP_422_UNPROCESSABLE_ENTITY, ErrorMessages.EMPTY_DATA)
   tag = str(uuid.uuid4())
+  timeout = resolve_timeout(timeout)
+
+  if stream == StreamEnum.NDJSON:
+    lines = stream_ndjson(
+      data,
+      tag,
+      max_workers,
+      min_workers,
+      metadata,
+      output_type,
+      ordered=order == StreamOrderEnum.INPUT,
+      timeout=timeout,
+    )
+    return StreamingResponse(lines, media_type=NDJSON_MEDIA_TYPE)
+
+  # The .bin files are passed through as they are, so their rows cannot be fanned
+  # out to duplicate inputs; those take the deduplicating path below.
+  passthrough = BIN_PASSTHROUGH and not COORDINATOR_PEERS
+  if (
+    output_type == TaskTypeEnum.HEAVY
+    and passthrough
+    and not fetch_cache
+    and not await to_thread(has_duplicates, data, metadata)
+  ):
+    stats = {"inputs": len(data), "unique": len(data), "failed": 0}
+    return await heavy_passthrough(
+      request, data, tag, max_workers, min_workers, metadata, timeout, stats
+    )
+
   import time
 
   st = time.perf_counter()
-  results, header = get_cached_or_compute(
-    metadata["Identifier"],
-    data,
-    tag,
-    max_workers,
-    min_workers,
-    metadata,
-    fetch_cache,
-    save_cache,
-    cache_only,
-    output_type,
+  stats = {}
+  results, header = await run_with_deadline(
+    run_cached_or_compute(
+      metadata["Identifier"],
+      data,
+      tag,
+      max_workers,
+      min_workers,
+      metadata,
+      fetch_cache,
+      save_cache,
+      cache_only,
+      output_type,
+      stats=stats,
+    ),
+    timeout,
+    request,
   )
   et = time.perf_counter()
   cprint(f"Execution Time: {et - st:.6f}", fg="cyan", bold=True)
   cprint(f"Generating a response for {output_type} task", fg="cyan", bold=True)
+  dedup_headers = stats_headers(stats)
 
   if output_type == TaskTypeEnum.HEAVY:
-    payload = generate_resp_body(results, metadata["Output Type"][0], header)
+    payload = await to_thread(
+      generate_resp_body, results, metadata["Output Type"][0], header
+    )
     return Response(
       content=payload,
       media_type=MEDIA_TYPE,
       headers={
         "Content-Disposition": CONTENT_DESP,
         "Content-Length": str(len(payload)),
+        **dedup_headers,
       },
     )
 
-  results = orient_to_json(results, header, data, orient, metadata["Output Type"])
-  return ORJSONResponse(results)
+  results = await to_thread(
+    orient_to_json, results, header, data, orient, metadata["Output Type"]
+  )
+  return ORJSONResponse(results, headers=dedup_headers)
+
+
+def stats_headers(stats):
+  return {
+    "X-Dedup-Ratio": f"{stats['inputs'] / max(1, stats['unique']):.3f}",
+    "X-Unique-Inputs": str(stats["unique"]),
+    "X-Failed-Inputs": str(stats["failed"]),
+  }
+
+
+async def heavy_passthrough(
+  request, data, tag, max_workers, min_workers, metadata, timeout, stats
+):
+  files = await run_with_deadline(
+    compute_heavy_files_async(data, tag, max_workers, min_workers, metadata),
+    timeout,
+    request,
+  )
+  headers = {"Content-Disposition": CONTENT_DESP, **stats_headers(stats)}
+  output_type = metadata["Output Type"][0]
+  dtype = resolve_dtype(output_type)
+  plan = None
+  if dtype is not str:
+    try:
+      plan = await to_thread(bin_passthrough, files, dtype)
+    except (OSError, ValueError, KeyError) as e:
+      cprint(f"Could not pass the .bin outputs through: {e}")
+  if plan is not None:
+    header_line, parts = plan
+    return BinFilesResponse(header_line, parts, headers=headers, media_type=MEDIA_TYPE)
+  results, header = await to_thread(load_bin_files, files)
+  payload = await to_thread(generate_resp_body, results, output_type, header)
+  return Response(
+    content=payload,
+    media_type=MEDIA_TYPE,
+    headers={**headers, "Content-Length": str(len(payload))},
+  )
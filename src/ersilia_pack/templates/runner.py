@@ -0,0 +1,448 @@
+import asyncio, contextlib, contextvars, json, os, select, signal, subprocess
+import threading, time
+
+from .default import (
+  DEFAULT_API,
+  FRAMEWORK_FOLDER,
+  ROOT,
+  RESIDENT_RUNNER,
+  RESIDENT_MAX_IDLE,
+  RESIDENT_ENTRYPOINT,
+  MAX_TIMEOUT,
+  DISCONNECT_POLL_INTERVAL,
+  logger,
+  set_temp_folder,
+)
+from .footprint import PeakRss
+
+# Resident protocol
+# -----------------
+# A model opts in by shipping `model/framework/resident/run.sh`. The script is
+# started once as `bash resident/run.sh <framework_dir> <root>` and then keeps
+# reading requests from stdin, one JSON object per line:
+#
+#   {"input": "/path/input-<tag>.csv", "output": "/path/output-<tag>.csv"}
+#
+# Input and output files follow exactly the same formats as for `run.sh`. When a
+# batch is done the runner answers with a single JSON line on stdout, either
+# {"status": "ok"} or {"status": "error", "detail": "..."}. Any other stdout line
+# is treated as a log line. The runner must exit when stdin reaches EOF.
+#
+# Every model process is started in its own session, so cancelling a chunk
+# kills the whole process group and no child of run.sh outlives its request.
+# `run_model` and `run_model_async` return the peak RSS of the process tree
+# that served the chunk, in bytes. `run_model` kills the group once its
+# `timeout` passes or its `cancelled` token (anything with `is_set()`) is set.
+#
+# Bundles may ship several APIs, one `<api>.sh` each next to `run.sh`. The API
+# a chunk runs is taken from `current_api`, which tasks and `to_thread` calls
+# inherit and pool workers get from their pool. Only `run` can be resident.
+#
+# Each run.sh child is placed by `placement`, set up by the worker pool: it gets
+# a CPU set of its own and BLAS/OpenMP thread counts that fit in it.
+
+current_api = contextvars.ContextVar("api", default=DEFAULT_API)
+
+
+@contextlib.contextmanager
+def api(name):
+  token = current_api.set(name)
+  try:
+    yield
+  finally:
+    current_api.reset(token)
+
+
+placement = None
+# Scheduler slots, which bound the idle resident runners; set by the pool.
+worker_slots = 1
+
+
+def init_worker(name, worker_placement=None, folder=None):
+  """Pool worker initializer: run every task of this worker with API `name`,
+  writing chunk files to the server's temp `folder`."""
+  global placement
+  current_api.set(name)
+  if worker_placement is not None:
+    placement = worker_placement
+  if folder is not None:
+    set_temp_folder(folder)
+
+
+def _place():
+  return placement.assign() if placement is not None else contextlib.nullcontext()
+
+
+def _child_env(cpus=None):
+  return placement.env(cpus) if placement is not None else None
+
+
+def _bind_runner(runner, cpus):
+  # A resident runner's threads predate this run, so its whole tree is rebound.
+  if cpus is not None:
+    placement.bind_tree(runner.pid, cpus)
+
+
+_idle_runners = []
+_idle_lock = threading.Lock()
+_idle_async_runners = []
+
+
+class ResidentRunnerError(RuntimeError):
+  pass
+
+
+class RunCancelled(RuntimeError):
+  """The request a model run belonged to was cancelled."""
+
+
+def time_left(deadline):
+  """Seconds until the `time.monotonic()` `deadline`, `MAX_TIMEOUT` if None."""
+  return MAX_TIMEOUT if deadline is None else deadline - time.monotonic()
+
+
+def _poll_timeout(remaining, cancelled):
+  # How long to block before checking `cancelled` again.
+  if cancelled is None:
+    return remaining
+  if remaining is None:
+    return DISCONNECT_POLL_INTERVAL
+  return max(0, min(remaining, DISCONNECT_POLL_INTERVAL))
+
+
+def _wait(proc, timeout, cancelled=None):
+  """`proc.wait(timeout)` that raises `RunCancelled` once `cancelled` is set."""
+  deadline = None if timeout is None else time.monotonic() + timeout
+  while True:
+    remaining = None if deadline is None else deadline - time.monotonic()
+    try:
+      return proc.wait(timeout=_poll_timeout(remaining, cancelled))
+    except subprocess.TimeoutExpired:
+      if deadline is not None and time.monotonic() >= deadline:
+        raise
+      if cancelled.is_set():
+        raise RunCancelled(f"Run of process {proc.pid} was cancelled") from None
+
+
+class ResidentRunner:
+  def __init__(self, entrypoint=RESIDENT_ENTRYPOINT):
+    self.entrypoint = entrypoint
+    self.proc = subprocess.Popen(
+      ["bash", entrypoint, FRAMEWORK_FOLDER, ROOT],
+      stdin=subprocess.PIPE,
+      stdout=subprocess.PIPE,
+      bufsize=0,
+      start_new_session=True,
+      env=_child_env(),
+    )
+    self._pending = b""  # stdout read past the last reply
+    logger.info(f"Resident runner started with pid {self.proc.pid}")
+
+  @property
+  def pid(self):
+    return self.proc.pid
+
+  def is_alive(self):
+    return self.proc.poll() is None
+
+  def run(self, input_f, output_f, timeout=None, cancelled=None):
+    """Run one batch; past `timeout` seconds or once `cancelled` is set the
+    runner is killed and `subprocess.TimeoutExpired` or `RunCancelled` raised,
+    as for a plain `run.sh`."""
+    request = json.dumps({"input": input_f, "output": output_f})
+    try:
+      self.proc.stdin.write((request + "\n").encode("utf-8"))
+    except (BrokenPipeError, OSError, ValueError) as e:
+      raise ResidentRunnerError(f"Resident runner {self.pid} is not reachable") from e
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+      reply = self._read_reply(deadline, cancelled)
+    except (subprocess.TimeoutExpired, RunCancelled):
+      self.abort()
+      raise
+    if reply.get("status") != "ok":
+      raise ResidentRunnerError(
+        reply.get("detail", f"Resident runner {self.pid} failed on {input_f}")
+      )
+
+  def _readline(self, deadline, cancelled=None):
+    fd = self.proc.stdout.fileno()
+    while b"\n" not in self._pending:
+      remaining = None if deadline is None else deadline - time.monotonic()
+      if remaining is not None and remaining <= 0:
+        raise subprocess.TimeoutExpired(self.proc.args, remaining)
+      if not select.select([fd], [], [], _poll_timeout(remaining, cancelled))[0]:
+        if cancelled is not None and cancelled.is_set():
+          raise RunCancelled(f"Run on resident runner {self.pid} was cancelled")
+        continue  # the deadline is checked again above
+      block = os.read(fd, 1 << 16)
+      if not block:
+        return None
+      self._pending += block
+    line, self._pending = self._pending.split(b"\n", 1)
+    return line.decode("utf-8", errors="replace")
+
+  def _read_reply(self, deadline=None, cancelled=None):
+    while True:
+      line = self._readline(deadline, cancelled)
+      if line is None:
+        code = self.proc.wait()
+        raise ResidentRunnerError(f"Resident runner {self.pid} exited with {code}")
+      reply = _parse_reply(line)
+      if reply is not None:
+        return reply
+
+  def abort(self):
+    kill_process_group(self.pid)
+    self.proc.wait()
+
+  def close(self, timeout=5):
+    with contextlib.suppress(Exception):
+      self.proc.stdin.close()
+    try:
+      self.proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+      self.proc.kill()
+      self.proc.wait()
+
+
+class AsyncResidentRunner:
+  """Event-loop counterpart of `ResidentRunner` built on asyncio subprocesses."""
+
+  def __init__(self, proc, entrypoint):
+    self.proc = proc
+    self.entrypoint = entrypoint
+    self._lock = asyncio.Lock()
+
+  @classmethod
+  async def start(cls, entrypoint=RESIDENT_ENTRYPOINT):
+    proc = await asyncio.create_subprocess_exec(
+      "bash",
+      entrypoint,
+      FRAMEWORK_FOLDER,
+      ROOT,
+      stdin=asyncio.subprocess.PIPE,
+      stdout=asyncio.subprocess.PIPE,
+      limit=2**20,
+      start_new_session=True,
+      env=_child_env(),
+    )
+    logger.info(f"Resident runner started with pid {proc.pid}")
+    return cls(proc, entrypoint)
+
+  @property
+  def pid(self):
+    return self.proc.pid
+
+  def is_alive(self):
+    return self.proc.returncode is None
+
+  async def run(self, input_f, output_f):
+    request = json.dumps({"input": input_f, "output": output_f})
+    async with self._lock:
+      try:
+        self.proc.stdin.write((request + "\n").encode("utf-8"))
+        await self.proc.stdin.drain()
+      except (BrokenPipeError, ConnectionResetError, OSError) as e:
+        raise ResidentRunnerError(f"Resident runner {self.pid} is not reachable") from e
+      reply = await self._read_reply()
+    if reply.get("status") != "ok":
+      raise ResidentRunnerError(
+        reply.get("detail", f"Resident runner {self.pid} failed on {input_f}")
+      )
+
+  async def _read_reply(self):
+    while True:
+      line = await self.proc.stdout.readline()
+      if not line:
+        code = await self.proc.wait()
+        raise ResidentRunnerError(f"Resident runner {self.pid} exited with {code}")
+      reply = _parse_reply(line.decode("utf-8", errors="replace"))
+      if reply is not None:
+        return reply
+
+  def abort(self):
+    kill_process_group(self.proc.pid)
+
+  async def close(self, timeout=5):
+    with contextlib.suppress(Exception):
+      self.proc.stdin.close()
+    try:
+      await asyncio.wait_for(self.proc.wait(), timeout)
+    except asyncio.TimeoutError:
+      self.proc.kill()
+      await self.proc.wait()
+
+
+def kill_process_group(pid):
+  with contextlib.suppress(ProcessLookupError, PermissionError):
+    os.killpg(pid, signal.SIGKILL)
+
+
+def _parse_reply(line):
+  try:
+    reply = json.loads(line)
+  except json.JSONDecodeError:
+    reply = None
+  if isinstance(reply, dict) and "status" in reply:
+    return reply
+  logger.info(line.rstrip("\n"))
+  return None
+
+
+def is_resident_enabled():
+  return (
+    RESIDENT_RUNNER
+    and current_api.get() == DEFAULT_API
+    and os.path.exists(RESIDENT_ENTRYPOINT)
+  )
+
+
+def acquire_runner():
+  with _idle_lock:
+    while _idle_runners:
+      runner = _idle_runners.pop()
+      if runner.is_alive():
+        return runner
+  return ResidentRunner()
+
+
+def max_idle_runners():
+  """Idle runners kept for reuse: one per worker slot unless configured, so a
+  fully loaded server never starts and closes a runner per chunk."""
+  if RESIDENT_MAX_IDLE > 0:
+    return RESIDENT_MAX_IDLE
+  return worker_slots
+
+
+def release_runner(runner):
+  if not runner.is_alive():
+    return
+  max_idle = max_idle_runners()
+  with _idle_lock:
+    if len(_idle_runners) < max_idle:
+      _idle_runners.append(runner)
+      return
+  runner.close()
+
+
+async def acquire_async_runner():
+  while _idle_async_runners:
+    runner = _idle_async_runners.pop()
+    if runner.is_alive():
+      return runner
+  return await AsyncResidentRunner.start()
+
+
+async def release_async_runner(runner):
+  if not runner.is_alive():
+    return
+  if len(_idle_async_runners) < max_idle_runners():
+    _idle_async_runners.append(runner)
+    return
+  await runner.close()
+
+
+def close_runners():
+  with _idle_lock:
+    runners = list(_idle_runners)
+    _idle_runners.clear()
+  for runner in runners:
+    runner.close()
+
+
+async def close_async_runners():
+  runners = list(_idle_async_runners)
+  _idle_async_runners.clear()
+  for runner in runners:
+    await runner.close()
+
+
+def _forget_inherited_runners():
+  # Pipes of runners created in the parent must not be shared with forked
+  # pool workers; each worker starts its own resident process on demand.
+  global _idle_runners, _idle_lock, _idle_async_runners
+  _idle_runners = []
+  _idle_lock = threading.Lock()
+  _idle_async_runners = []
+
+
+if hasattr(os, "register_at_fork"):
+  os.register_at_fork(after_in_child=_forget_inherited_runners)
+
+
+def run_resident(input_f, output_f, timeout=None, cancelled=None):
+  runner = acquire_runner()
+  try:
+    with _place() as cpus, PeakRss(runner.pid) as rss:
+      _bind_runner(runner, cpus)
+      runner.run(input_f, output_f, timeout, cancelled)
+  except ResidentRunnerError:
+    release_runner(runner)
+    raise
+  except BaseException:
+    # Interrupted mid-request, so a reply may still be pending on stdout.
+    runner.abort()
+    raise
+  release_runner(runner)
+  return rss.peak
+
+
+def _run_sh_args(input_f, output_f):
+  script = f"{FRAMEWORK_FOLDER}/{current_api.get()}.sh"
+  return ["bash", script, FRAMEWORK_FOLDER, input_f, output_f, ROOT]
+
+
+def run_model(input_f, output_f, timeout=MAX_TIMEOUT, cancelled=None):
+  if is_resident_enabled():
+    return run_resident(input_f, output_f, timeout, cancelled)
+  args = _run_sh_args(input_f, output_f)
+  with _place() as cpus:
+    proc = subprocess.Popen(args, start_new_session=True, env=_child_env(cpus))
+    try:
+      if cpus is not None:
+        placement.bind(proc.pid, cpus)
+      with PeakRss(proc.pid) as rss:
+        code = _wait(proc, timeout, cancelled)
+    except BaseException:
+      kill_process_group(proc.pid)
+      proc.wait()
+      raise
+  if code != 0:
+    raise subprocess.CalledProcessError(code, args)
+  return rss.peak
+
+
+async def run_model_async(input_f, output_f):
+  if is_resident_enabled():
+    runner = await acquire_async_runner()
+    try:
+      with _place() as cpus, PeakRss(runner.pid) as rss:
+        _bind_runner(runner, cpus)
+        await runner.run(input_f, output_f)
+    except ResidentRunnerError:
+      await release_async_runner(runner)
+      raise
+    except BaseException:
+      # Interrupted mid-request, so a reply may still be pending on stdout.
+      runner.abort()
+      raise
+    await release_async_runner(runner)
+    return rss.peak
+  args = _run_sh_args(input_f, output_f)
+  with _place() as cpus:
+    proc = await asyncio.create_subprocess_exec(
+      *args, start_new_session=True, env=_child_env(cpus)
+    )
+    try:
+      if cpus is not None:
+        placement.bind(proc.pid, cpus)
+      with PeakRss(proc.pid) as rss:
+        code = await proc.wait()
+    except BaseException:
+      kill_process_group(proc.pid)
+      await asyncio.shield(proc.wait())
+      raise
+  if code != 0:
+    raise subprocess.CalledProcessError(code, args)
+  return rss.peak
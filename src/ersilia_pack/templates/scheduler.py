@@ -0,0 +1,190 @@
+import asyncio, contextlib, contextvars, itertools, threading, time
+from concurrent.futures import Future
+
+from .default import SCHEDULER_TOLERANCE, SCHEDULER_BACKOFF, SCHEDULER_DRIFT
+from .default import LaneEnum, LANE_WEIGHTS
+
+# Lane of the work running in the current context. Tasks and `to_thread` calls
+# inherit it, so setting it once at the entry point covers every chunk.
+current_lane = contextvars.ContextVar("lane", default=LaneEnum.INTERACTIVE)
+
+
+@contextlib.contextmanager
+def lane(name):
+  token = current_lane.set(LaneEnum(name))
+  try:
+    yield
+  finally:
+    current_lane.reset(token)
+
+
+class SlotLease:
+  """One request's share of the scheduler, holding at most `want` slots at once.
+
+  The lease belongs to a priority `lane`, by default the one of the context
+  that created it.
+
+  Each model run takes one slot for its duration, through `slot()` in threads or
+  `slot_async()` on the event loop. `acquire`/`release` also make a lease usable
+  as the `gate` of `WorkerPool.map`.
+  """
+
+  def __init__(self, scheduler, want, lane=None):
+    self.scheduler = scheduler
+    self.want = max(1, want)
+    self.lane = LaneEnum(lane or current_lane.get())
+    self.held = 0
+
+  def acquire(self):
+    self.scheduler._wait(self).result()
+
+  async def acquire_async(self):
+    future = self.scheduler._wait(self)
+    try:
+      await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+      if not future.cancel():
+        self.release()  # granted while we were being cancelled
+      raise
+
+  def release(self):
+    self.scheduler._release(self)
+
+  @contextlib.contextmanager
+  def slot(self):
+    self.acquire()
+    try:
+      yield
+    finally:
+      self.release()
+
+  @contextlib.asynccontextmanager
+  async def slot_async(self):
+    await self.acquire_async()
+    try:
+      yield
+    finally:
+      self.release()
+
+
+class WorkerScheduler:
+  """Owns the server-wide budget of worker slots and shares it between requests.
+
+  At most `limit` model runs are in flight, and `limit` never exceeds `budget`.
+  Runs that cannot get a slot wait. A freed slot goes to the lane furthest
+  below its weighted share of the running slots (ties to the more interactive
+  lane), and within the lane to the request that holds the fewest slots, oldest
+  first. Slots are handed out per model run, so bulk work yields to interactive
+  work at every chunk boundary yet uses all slots while nothing else waits.
+  `limit` adapts with AIMD: it grows
+  by about one slot per `limit` runs while it is the bottleneck, and shrinks by
+  `backoff` when a run takes more than `tolerance` times the best recent latency
+  of runs of the same model and size.
+  """
+
+  def __init__(
+    self,
+    budget,
+    min_limit=1,
+    tolerance=SCHEDULER_TOLERANCE,
+    backoff=SCHEDULER_BACKOFF,
+    drift=SCHEDULER_DRIFT,
+    weights=None,
+  ):
+    self.budget = max(1, budget)
+    self.min_limit = max(1, min(min_limit, self.budget))
+    self.tolerance = tolerance
+    self.backoff = backoff
+    self.drift = drift
+    self.weights = {
+      LaneEnum(k): max(1e-6, v) for k, v in (weights or LANE_WEIGHTS).items()
+    }
+    self.limit = float(self.budget)
+    self.in_use = 0
+    self.lane_in_use = {name: 0 for name in LaneEnum}
+    self._waiters = []
+    self._baselines = {}
+    self._last_backoff = 0.0
+    self._seq = itertools.count()
+    self._lock = threading.Lock()
+
+  def lease(self, want=1, lane=None):
+    return SlotLease(self, want, lane)
+
+  def _wait(self, lease):
+    future = Future()
+    with self._lock:
+      self._waiters.append((next(self._seq), lease, future))
+      self._grant()
+    return future
+
+  def has_idle_slot(self):
+    with self._lock:
+      return self.in_use < int(self.limit) and not any(
+        not w[2].cancelled() for w in self._waiters
+      )
+
+  def _release(self, lease):
+    with self._lock:
+      lease.held -= 1
+      self.in_use -= 1
+      self.lane_in_use[lease.lane] -= 1
+      self._grant()
+
+  def _grant(self):
+    while self.in_use < int(self.limit):
+      self._waiters = [w for w in self._waiters if not w[2].cancelled()]
+      eligible = [w for w in self._waiters if w[1].held < w[1].want]
+      if not eligible:
+        return
+      entry = min(eligible, key=self._priority)
+      self._waiters.remove(entry)
+      _, lease, future = entry
+      if not future.set_running_or_notify_cancel():
+        continue
+      lease.held += 1
+      self.in_use += 1
+      self.lane_in_use[lease.lane] += 1
+      future.set_result(None)
+
+  def _priority(self, waiter):
+    seq, lease, _ = waiter
+    share = (self.lane_in_use[lease.lane] + 1) / self.weights.get(lease.lane, 1e-6)
+    return share, -self.weights.get(lease.lane, 1e-6), lease.held, seq
+
+  def observe(self, key, n_items, seconds):
+    """Feed the latency of one finished model run into the AIMD limit."""
+    bucket = (key, max(1, n_items).bit_length())
+    now = time.monotonic()
+    with self._lock:
+      baseline = self._baselines.get(bucket)
+      self._baselines[bucket] = (
+        seconds if baseline is None else min(seconds, baseline * (1 + self.drift))
+      )
+      if baseline is None:
+        return
+      if seconds > self.tolerance * baseline:
+        # One decrease per observed latency, so a burst of slow runs caused by
+        # the same overload does not collapse the limit.
+        if now - self._last_backoff >= seconds:
+          self.limit = max(self.min_limit, self.limit * self.backoff)
+          self._last_backoff = now
+      elif self._waiters or self.in_use >= int(self.limit):
+        self.limit = min(self.budget, self.limit + 1 / self.limit)
+      self._grant()
+
+  def stats(self):
+    with self._lock:
+      return {
+        "budget": self.budget,
+        "limit": round(self.limit, 2),
+        "in_use": self.in_use,
+        "queued": len(self._waiters),
+        "lanes": {
+          name.value: {
+            "in_use": self.lane_in_use[name],
+            "queued": sum(1 for w in self._waiters if w[1].lane == name),
+          }
+          for name in LaneEnum
+        },
+      }
@@ -0,0 +1,57 @@
+import numpy
+from multiprocessing import shared_memory
+
+
+def _index(rows):
+  if isinstance(rows, range) and rows.step == 1:
+    return slice(rows.start, rows.stop)
+  return numpy.asarray(rows, dtype=numpy.intp)
+
+
+def write_rows(handle, rows, values):
+  """Copy `values` into rows `rows` of the shared array behind `handle`.
+
+  Runs in pool workers, which attach to the parent's block by name; attaching
+  re-registers it with the resource tracker the pool shares with the parent,
+  so it is still unlinked exactly once.
+  """
+  name, shape, dtype = handle
+  shm = shared_memory.SharedMemory(name=name)
+  try:
+    array = numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array[_index(rows)] = values
+    del array
+  finally:
+    shm.close()
+
+
+class SharedResults:
+  """Result matrix in shared memory that pool workers fill in place.
+
+  The parent owns the block: it allocates it for the whole request, passes the
+  picklable `handle` to every chunk and unlinks it on exit. Workers only send
+  back row counts and timings instead of pickled rows.
+  """
+
+  def __init__(self, shape, dtype):
+    self.shape = tuple(shape)
+    self.dtype = numpy.dtype(dtype)
+    size = max(1, int(numpy.prod(self.shape)) * self.dtype.itemsize)
+    self._shm = shared_memory.SharedMemory(create=True, size=size)
+    self.array = numpy.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+  @property
+  def handle(self):
+    return self._shm.name, self.shape, self.dtype.str
+
+  def close(self):
+    self.array = None
+    self._shm.close()
+    self._shm.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+    return False
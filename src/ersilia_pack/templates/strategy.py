@@ -0,0 +1,103 @@
+import math, random
+from collections import namedtuple
+
+from .default import StrategyEnum, STRATEGY_EXPLORATION
+from .chunking import ChunkCostModel, chunk_costs, optimal_chunk_count
+
+StrategyPlan = namedtuple("StrategyPlan", ["strategy", "workers", "seconds"])
+
+
+class StrategySelector:
+  """Chooses how a request runs from per-model costs learned online.
+
+  A model run on `n` inputs takes `fixed + per_item * n` seconds, as fitted by
+  `chunk_costs` from every finished chunk. Each strategy adds its own overhead,
+  such as dispatching and pickling chunks, parsing outputs or waiting for a
+  micro-batch. That overhead is fitted the same way, from the wall time of
+  requests minus their predicted run time. A request takes the strategy and
+  worker count with the lowest predicted latency. A fraction `exploration` of
+  requests tries another strategy, so that every overhead stays measured.
+  """
+
+  def __init__(self, costs=chunk_costs, exploration=STRATEGY_EXPLORATION, rng=None):
+    self.costs = costs
+    self.overheads = ChunkCostModel()
+    self.exploration = exploration
+    self._rng = rng or random.Random()
+
+  def run_time(self, model_id, strategy, n_items, workers):
+    estimate = self.costs.estimate(model_id)
+    if estimate is None:
+      return None
+    fixed, per_item = estimate
+    if strategy == StrategyEnum.SEQUENTIAL:
+      return fixed + per_item * n_items
+    chunks = optimal_chunk_count(fixed, per_item, n_items, workers)
+    return math.ceil(chunks / workers) * (fixed + per_item * n_items / chunks)
+
+  def overhead(self, model_id, strategy, n_items):
+    key = (model_id, strategy)
+    estimate = self.overheads.estimate(key)
+    if estimate is not None:
+      fixed, per_item = estimate
+      return fixed + per_item * n_items
+    return self.overheads.mean(key) or 0.0
+
+  def predict(
+    self, model_id, n_items, max_workers, min_workers=1, strategies=tuple(StrategyEnum)
+  ):
+    """Predicted latency of every `(strategy, workers)` candidate, fastest first.
+
+    Empty until the run cost of the model has been fitted.
+    """
+    n_items = max(1, n_items)
+    max_workers = max(1, min(max_workers, n_items))
+    plans = []
+    for strategy in strategies:
+      if strategy == StrategyEnum.SEQUENTIAL:
+        counts = [1] if min_workers <= 1 else []
+      else:
+        counts = range(max(2, min_workers), max_workers + 1)
+      for workers in counts:
+        run = self.run_time(model_id, strategy, n_items, workers)
+        if run is None:
+          return []
+        seconds = run + self.overhead(model_id, strategy, n_items)
+        plans.append(StrategyPlan(StrategyEnum(strategy), workers, seconds))
+    plans.sort(key=lambda plan: (plan.seconds, plan.workers))
+    return plans
+
+  def choose(
+    self, model_id, n_items, max_workers, min_workers=1, strategies=tuple(StrategyEnum)
+  ):
+    """The plan to run a request with, or None while costs are unknown."""
+    plans = self.predict(model_id, n_items, max_workers, min_workers, strategies)
+    if not plans:
+      return None
+    others = sorted({plan.strategy for plan in plans} - {plans[0].strategy})
+    if others and self._rng.random() < self.exploration:
+      strategy = self._rng.choice(others)
+      return next(plan for plan in plans if plan.strategy == strategy)
+    return plans[0]
+
+  def observe(self, model_id, plan, n_items, seconds):
+    run = self.run_time(model_id, plan.strategy, n_items, plan.workers)
+    if run is not None:
+      self.overheads.record((model_id, plan.strategy), n_items, max(0.0, seconds - run))
+
+  def stats(self, model_id):
+    estimate = self.costs.estimate(model_id)
+    overheads = {}
+    for strategy in StrategyEnum:
+      fit = self.overheads.estimate((model_id, strategy))
+      mean = self.overheads.mean((model_id, strategy))
+      overheads[strategy.value] = (
+        {"fixed": fit[0], "per_item": fit[1]} if fit else {"mean": mean}
+      )
+    return {
+      "run_cost": {"fixed": estimate[0], "per_item": estimate[1]} if estimate else None,
+      "overheads": overheads,
+    }
+
+
+strategy_selector = StrategySelector()
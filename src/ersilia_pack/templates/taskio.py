@@ -0,0 +1,170 @@
+import asyncio, contextlib, glob, os, psutil, socket, threading, time
+
+from .default import (
+  IO_BACKEND,
+  temp_folder,
+  EOS_TMP_TASKS,
+  STALE_FILE_AGE,
+  JANITOR_INTERVAL,
+  logger,
+)
+
+TASK_FILE_PREFIXES = ("input-", "output-", "cancel-")
+OWNER_MARKER = ".owner"
+
+
+class ChunkInput:
+  """Hands a chunk's input file to run.sh, or streams it through a named pipe.
+
+  `write(path)` produces the input. With `fifo`, `open()` creates a FIFO at
+  `path` and writes to it from a thread, so the model starts reading while the
+  input is still being produced. The model must then read its input once, front
+  to back. `close()` unblocks and joins the writer if the model exited early.
+  """
+
+  def __init__(self, path, write, fifo=IO_BACKEND == "fifo"):
+    self.path = path
+    self.write = write
+    self.fifo = fifo
+    self.error = None
+    self._thread = None
+
+  def open(self):
+    if not self.fifo:
+      self.write(self.path)
+      return
+    os.mkfifo(self.path)
+    self._thread = threading.Thread(target=self._feed, name="ersilia-fifo", daemon=True)
+    self._thread.start()
+
+  def _feed(self):
+    try:
+      self.write(self.path)
+    except OSError as e:
+      self.error = e
+
+  def close(self):
+    if self._thread is None:
+      return
+    if self._thread.is_alive():
+      # The model is gone; open the read end ourselves and drain it so the
+      # writer's open()/write() return.
+      fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+      try:
+        while self._thread.is_alive():
+          with contextlib.suppress(BlockingIOError):
+            os.read(fd, 1 << 16)
+          self._thread.join(0.01)
+      finally:
+        os.close(fd)
+    self._thread = None
+    if self.error is not None:
+      logger.warning("Could not feed %s: %s", self.path, self.error)
+
+
+class CancelFlag:
+  """Cancellation token that pool workers can check: a marker file in the
+  temp folder. It is picklable, unlike a `threading.Event`."""
+
+  def __init__(self, tag, folder=None):
+    self.path = os.path.join(folder or temp_folder(), f"cancel-{tag}")
+
+  def is_set(self):
+    return os.path.exists(self.path)
+
+  def set(self):
+    with open(self.path, "a"):
+      pass
+
+  def clear(self):
+    with contextlib.suppress(FileNotFoundError):
+      os.remove(self.path)
+
+
+def process_token(pid):
+  """Identifies a process across pid reuse; None if it does not exist."""
+  try:
+    return f"{pid}:{psutil.Process(pid).create_time()}"
+  except psutil.Error:
+    return None
+
+
+def mark_owner(folder=None):
+  """Record this process as the owner of `folder` (default: this server's temp
+  folder), so that the janitors of other servers leave it alone for as long as
+  the process lives."""
+  with open(os.path.join(folder or temp_folder(), OWNER_MARKER), "w") as f:
+    f.write(f"{socket.gethostname()} {process_token(os.getpid())}")
+
+
+def owner_gone(folder):
+  """True only if `folder` has an owner marker from this host whose process
+  no longer exists. Folders without a marker are never considered dead."""
+  try:
+    with open(os.path.join(folder, OWNER_MARKER)) as f:
+      host, _, owner = f.read().strip().partition(" ")
+  except OSError:
+    return False
+  pid = owner.split(":")[0]
+  if host != socket.gethostname() or not pid.isdigit():
+    return False
+  return process_token(int(pid)) != owner
+
+
+def task_folders():
+  """Folders holding chunk files: this server's and those of other servers."""
+  own = temp_folder()
+  parent = os.path.dirname(own)
+  return sorted(
+    set(glob.glob(os.path.join(parent, "ersilia-*")) + [own, EOS_TMP_TASKS])
+  )
+
+
+def sweep_stale_files(folders=None, max_age=STALE_FILE_AGE, now=None):
+  """Remove chunk files not touched for `max_age` seconds, e.g. left by crashed
+  workers, from this server's folders. The temp folders of other servers are
+  only touched once their owner process is gone: all their chunk files are
+  removed, and the folder too if nothing else is left. Returns the number of
+  files removed."""
+  cutoff = (now or time.time()) - max_age
+  removed = 0
+  own_folders = (temp_folder(), EOS_TMP_TASKS)
+  for folder in folders if folders is not None else task_folders():
+    own = folder in own_folders
+    if not own and not owner_gone(folder):
+      continue
+    for dirpath, _, filenames in os.walk(folder):
+      for name in filenames:
+        if not name.startswith(TASK_FILE_PREFIXES):
+          continue
+        path = os.path.join(dirpath, name)
+        try:
+          if not own or os.lstat(path).st_mtime < cutoff:
+            os.remove(path)
+            removed += 1
+        except OSError:
+          continue
+    if not own:
+      try:
+        if os.listdir(folder) == [OWNER_MARKER]:
+          os.remove(os.path.join(folder, OWNER_MARKER))
+          os.rmdir(folder)
+      except OSError:
+        continue
+  return removed
+
+
+async def run_janitor(interval=JANITOR_INTERVAL):
+  loop = asyncio.get_running_loop()
+  try:
+    mark_owner()
+  except OSError as e:
+    logger.warning("Could not mark the temp folder as ours: %s", e)
+  while True:
+    try:
+      removed = await loop.run_in_executor(None, sweep_stale_files)
+      if removed:
+        logger.info("Removed %d stale task files", removed)
+    except Exception as e:
+      logger.warning("Task file sweep failed: %s", e)
+    await asyncio.sleep(interval)
@@ -1,14 +1,16 @@
-import asyncio, csv, os, subprocess, psutil, json, redis, itertools, numpy, struct
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio, contextvars, csv, os, psutil, json, orjson, redis, itertools, numpy, struct
+import threading, time, uuid
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from .default import (
+  POOL_MAX_WORKERS,
   ENVIRONMENT,
   DEFAULT_REDIS_URI,
-  ROOT,
+  DEFAULT_API,
   FRAMEWORK_FOLDER,
-  TEMP_FOLDER,
+  temp_folder,
   BUNDLE_FOLDER,
   RATE_LIMIT,
   RATE_LIMIT_LOCAL,
@@ -22,14 +24,44 @@ from .default import (
   MODEL_ROOT,
   OUTPUT_CONSISTENCY,
   EOS_TMP_TASKS,
+  ErrorMessages,
+  MICRO_BATCHING,
+  COST_AWARE_CHUNKING,
+  STRATEGY_SELECTION,
+  StrategyEnum,
+  TaskTypeEnum,
+  SHARED_RESULTS,
+  HEDGING,
+  BISECT_RETRY,
+  NEGATIVE_CACHE,
+  WORKER_BUDGET,
+  ASYNC_EXECUTION,
+  DEFAULT_TIMEOUT,
+  MAX_TIMEOUT,
+  DISCONNECT_POLL_INTERVAL,
   generic_example_input_file,
   generic_example_output_file,
   cprint,
   logger,
 )
+from .batcher import MicroBatcher
+from .chunking import chunk_costs, pack_chunks, contiguous_rows, restore_order
+from .cgroups import read_cgroup_limits
+from .coordinator import coordinator
+from .footprint import footprints
+from .hedging import gather_hedged
+from .retry import Bisector, RowError, count_row_errors
+from .scheduler import WorkerScheduler
+from .sharedmem import SharedResults, write_rows
+from .strategy import StrategyPlan, strategy_selector
+from .taskio import CancelFlag, ChunkInput
+from .exceptions.errors import AppException
+from .pool import get_worker_pool as _get_worker_pool, set_worker_budget
+from .runner import api, current_api, run_model, run_model_async, time_left
 
-CHUNK_MULTIPLIER = 4
 redis_client = None
+async_redis_client = None
+scheduler = None
 
 
 def resolve_dtype(dtype):
@@ -56,7 +88,7 @@ def write_smiles_bin(chunk, out_file):
       f.write(b)
 
 
-def read_bin(path):
+def read_bin_array(path):
   if not os.path.exists(path):
     raise FileNotFoundError(f"{path!r} not found")
 
@@ -81,6 +113,11 @@ def read_bin(path):
     offset=offset,
     shape=(rows, cols),
   )
+  return arr, columns
+
+
+def read_bin(path):
+  arr, columns = read_bin_array(path)
   return arr.tolist(), columns
 
 
@@ -91,11 +128,18 @@ def compute_memory_usage() -> float:
 
 
 def available_mem():
-  return psutil.virtual_memory().available
+  available = psutil.virtual_memory().available
+  limits = read_cgroup_limits()
+  if limits["memory_limit"] is not None:
+    headroom = limits["memory_limit"] - (limits["memory_usage"] or 0)
+    available = min(available, max(0, headroom))
+  return available
 
 
 def available_mem_total():
-  return psutil.virtual_memory().total
+  total = psutil.virtual_memory().total
+  limit = read_cgroup_limits()["memory_limit"]
+  return total if limit is None else min(total, limit)
 
 
 def compute_max_model_size_threshold():
@@ -159,6 +203,14 @@ def orient_to_json(values, columns, index, orient, output_type):
       cprint(e)
     return str(x)
 
+  # Inputs the model failed on get empty rows and an error field.
+  errors = None
+  if isinstance(values, list) and any(isinstance(row, RowError) for row in values):
+    errors = [row.message if isinstance(row, RowError) else None for row in values]
+    values = [
+      [None] * len(columns) if isinstance(row, RowError) else row for row in values
+    ]
+
   def convert_value(x):
     if x is None or x == "":
       return None
@@ -226,11 +278,23 @@ def orient_to_json(values, columns, index, orient, output_type):
     serialized = []
 
   if orient == "split":
-    return {"columns": columns, "index": index, "data": serialized}
+    split = {"columns": columns, "index": index, "data": serialized}
+    if errors:
+      split["errors"] = errors
+    return split
   elif orient == "records":
-    return [dict(zip(columns, row)) for row in serialized]
+    records = [dict(zip(columns, row)) for row in serialized]
+    for record, error in zip(records, errors or ()):
+      if error is not None:
+        record["error"] = error
+    return records
   elif orient == "index":
-    return {idx: dict(zip(columns, row)) for idx, row in zip(index, serialized)}
+    indexed = {}
+    for i, (idx, row) in enumerate(zip(index, serialized)):
+      indexed[idx] = dict(zip(columns, row))
+      if errors and errors[i] is not None:
+        indexed[idx]["error"] = errors[i]
+    return indexed
   elif orient == "columns":
     data = {}
     for col_idx, col in enumerate(columns):
@@ -242,6 +306,10 @@ def orient_to_json(values, columns, index, orient, output_type):
           cprint(e)
           col_data[make_hashable(idx_val)] = None
       data[col] = col_data
+    if errors:
+      data["error"] = {
+        make_hashable(idx_val): error for idx_val, error in zip(index, errors)
+      }
     return data
   elif orient == "values":
     return serialized
@@ -249,15 +317,18 @@ def orient_to_json(values, columns, index, orient, output_type):
   return None
 
 
+REDIS_OPTIONS = {
+  "host": REDIS_HOST,
+  "port": REDIS_PORT,
+  "decode_responses": True,
+  "socket_connect_timeout": 0.2,
+  "socket_timeout": 0.5,
+  "retry_on_timeout": False,
+}
+
+
 def conn_redis():
-  client = Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    decode_responses=True,
-    socket_connect_timeout=0.2,
-    socket_timeout=0.5,
-    retry_on_timeout=False,
-  )
+  client = Redis(**REDIS_OPTIONS)
   client.ping()
   return client
 
@@ -274,6 +345,31 @@ def init_redis():
     return False
 
 
+async def init_async_redis():
+  global async_redis_client
+  try:
+    if async_redis_client is None:
+      async_redis_client = AsyncRedis(**REDIS_OPTIONS)
+    await async_redis_client.ping()
+    cprint("Redis connected", fg="green", bold=True)
+    return True
+  except Exception:
+    cprint("Redis not connected", fg="yellow", bold=True)
+    return False
+
+
+async def close_async_redis():
+  global async_redis_client
+  client, async_redis_client = async_redis_client, None
+  if client is None:
+    return
+  close = getattr(client, "aclose", None) or client.close
+  try:
+    await close()
+  except Exception as e:
+    logger.warning("Redis close failed: %s", e)
+
+
 def get_api_names_from_sh(framework_dir):
   if not os.path.exists(framework_dir):
     return
@@ -287,6 +383,16 @@ def get_api_names_from_sh(framework_dir):
   return api_names
 
 
+def available_apis():
+  names = get_api_names_from_sh(FRAMEWORK_FOLDER) or []
+  return sorted(names) or [DEFAULT_API]
+
+
+def api_model_id(model_id, api_name):
+  """Identifier under which `api_name` caches results and records chunk costs."""
+  return model_id if api_name == DEFAULT_API else f"{model_id}:{api_name}"
+
+
 def get_example_path(example_file):
   example_path = os.path.join(FRAMEWORK_FOLDER, "examples", example_file)
   api_name = get_api_names_from_sh(FRAMEWORK_FOLDER)
@@ -403,16 +509,40 @@ def split_data(data, num_chunks):
 
 
 def get_cpu_count(logical):
-  return psutil.cpu_count(logical=logical)
+  count = psutil.cpu_count(logical=logical)
+  if hasattr(os, "sched_getaffinity"):
+    allowed = len(os.sched_getaffinity(0))
+    count = min(count, allowed) if count else allowed
+  cpu_limit = read_cgroup_limits()["cpu_limit"]
+  if cpu_limit is not None:
+    quota = max(1, int(cpu_limit))
+    count = min(count, quota) if count else quota
+  return count
+
+
+def resource_limits():
+  limits = read_cgroup_limits()
+  return {
+    "cgroup_version": limits["version"],
+    "cpu_quota": limits["cpu_limit"],
+    "memory_limit": limits["memory_limit"],
+    "memory_usage": limits["memory_usage"],
+    "cpus": get_cpu_count(logical=True),
+    "available_memory": available_mem(),
+  }
 
 
 def generate_resp_body(results, output_type, header):
   dtype = resolve_dtype(output_type)
-  n_rows = len(results)
-  n_cols = len(results[0]) if n_rows else 0
-  flat_iter = itertools.chain.from_iterable(results)
-  arr = numpy.fromiter(flat_iter, dtype=dtype, count=n_rows * n_cols)
-  arr = arr.reshape((n_rows, n_cols))
+  if isinstance(results, numpy.ndarray):
+    arr = numpy.ascontiguousarray(results, dtype=dtype).reshape(len(results), -1)
+    n_rows, n_cols = arr.shape
+  else:
+    n_rows = len(results)
+    n_cols = len(results[0]) if n_rows else 0
+    flat_iter = itertools.chain.from_iterable(results)
+    arr = numpy.fromiter(flat_iter, dtype=dtype, count=n_rows * n_cols)
+    arr = arr.reshape((n_rows, n_cols))
   del results
   info = {"dims": header, "shape": [n_rows, n_cols], "dtype": arr.dtype.str}
   header_line = (json.dumps(info) + "\n").encode("utf-8")
@@ -420,13 +550,24 @@ def generate_resp_body(results, output_type, header):
   return header_line + body
 
 
-def resource_planner(data, max_workers):
+def worker_memory(model_id=None):
+  # Measured peak RSS of one model run; the model's size on disk until known.
+  measured = footprints.estimate(model_id) if model_id else None
+  return measured or model_size_byte or 1
+
+
+def worker_capacity(model_id=None):
   total_mem = available_mem()
-  model_mem = model_size_byte or 1
+  model_mem = worker_memory(model_id)
   safety_mem = int(total_mem * RESOURCE_SAFETY_MARGIN)
   max_workers_by_mem = max(1, safety_mem // model_mem)
   phys_cores = get_cpu_count(logical=False) or get_cpu_count(logical=True) or 1
   max_workers_by_cpu = max(1, phys_cores - 1)
+  return max_workers_by_mem, max_workers_by_cpu
+
+
+def resource_planner(data, max_workers, model_id=None):
+  max_workers_by_mem, max_workers_by_cpu = worker_capacity(model_id)
   data_workers = len(data) if data else 1
   num_workers = min(max_workers, max_workers_by_mem, max_workers_by_cpu, data_workers)
   cprint(
@@ -436,8 +577,8 @@ def resource_planner(data, max_workers):
   return num_workers
 
 
-def compute_num_workers(data, max_workers, min_workers):
-  workers = resource_planner(data, max_workers)
+def compute_num_workers(data, max_workers, min_workers, model_id=None):
+  workers = resource_planner(data, max_workers, model_id)
   workers = max(workers, min_workers)
   if data and workers > len(data):
     workers = len(data)
@@ -445,60 +586,212 @@ def compute_num_workers(data, max_workers, min_workers):
   return workers
 
 
-def run_in_parallel(num_workers, tag, chunks, model_id, task_type, timeout=None):
-  cprint(f"ProcessPool tasks: {len(chunks)} | workers: {num_workers}", fg="blue")
-  results = []
+def first_header(headers):
+  """The first known header; chunks whose every input failed have none."""
+  return next((h for h in headers if h is not None), None)
+
+
+def concat_results(parts):
+  """Join per-chunk results, keeping heavy outputs as one typed array."""
+  if parts and all(isinstance(part, numpy.ndarray) for part in parts):
+    return numpy.concatenate(parts)
+  return [row for part in parts for row in part]
+
+
+def _run_in_pool(num_workers, tag, chunks, model_id, task_type, timeout, threads):
+  parts = []
   headers = []
-  with ProcessPoolExecutor(max_workers=num_workers) as executor:
-    for chunk_result, header in executor.map(
-      process_chunk,
+  deadline, cancelled = request_deadline.get(), request_cancelled.get()
+  # Process workers cannot see the request's event, so they get a flag that is
+  # only set if the request is cancelled while they run.
+  flag = None if threads else CancelFlag(tag)
+  try:
+    for chunk, (chunk_result, header, elapsed, peak_rss) in zip(
       chunks,
-      range(len(chunks)),
-      itertools.repeat(tag),
-      itertools.repeat(model_id),
-      itertools.repeat(task_type),
-      timeout=timeout,
+      get_worker_pool().map(
+        process_chunk_timed,
+        chunks,
+        range(len(chunks)),
+        itertools.repeat(tag),
+        itertools.repeat(model_id),
+        itertools.repeat(task_type),
+        itertools.repeat(deadline),
+        itertools.repeat(cancelled if threads else flag),
+        max_in_flight=num_workers,
+        threads=threads,
+        timeout=timeout if deadline is None else time_left(deadline),
+        gate=get_scheduler().lease(num_workers),
+        cancelled=cancelled,
+        on_abort=None if threads else flag.set,
+      ),
     ):
-      results.extend(chunk_result)
+      record_chunk(model_id, len(chunk), elapsed, peak_rss)
+      parts.append(chunk_result)
       headers.append(header)
+  finally:
+    if flag is not None:
+      flag.clear()
+  return concat_results(parts), first_header(headers)
+
+
+def shared_result_layout(metadata, task_type):
+  """Return `(dtype, columns)` for results that can be gathered in shared memory.
+
+  Only numeric heavy outputs of the sync process pool qualify, with
+  `SHARED_RESULTS` on; the async path runs chunks as subprocesses of the API
+  process and heavy `/run` requests pass the .bin files through instead. The
+  width comes from the example output; values are held at 64 bits so nothing is
+  lost before the response cast.
+  """
+  if not SHARED_RESULTS or ASYNC_EXECUTION:
+    return None
+  if task_type != "heavy" or len(metadata["Output Type"]) != 1:
+    return None
+  dtype = resolve_dtype(metadata["Output Type"][0])
+  if dtype is str:
+    return None
+  try:
+    columns = load_csv_data(generic_example_output_file)[0]
+  except (OSError, StopIteration, IndexError) as e:
+    logger.warning("Could not read the output columns: %s", e)
+    return None
+  return numpy.dtype(dtype).kind + "8", columns
+
+
+def _run_in_shared(num_workers, tag, chunks, rows, model_id, layout, timeout=None):
+  dtype, columns = layout
+  cprint(f"Shared ProcessPool tasks: {len(chunks)} | workers: {num_workers}", fg="blue")
+  headers, fallback = [], []
+  deadline, cancelled = request_deadline.get(), request_cancelled.get()
+  flag = CancelFlag(tag)
+  with SharedResults(
+    (sum(len(chunk) for chunk in chunks), len(columns)), dtype
+  ) as shared:
+    try:
+      for chunk, chunk_rows, (values, header, elapsed, peak_rss) in zip(
+        chunks,
+        rows,
+        get_worker_pool().map(
+          process_chunk_shared,
+          chunks,
+          range(len(chunks)),
+          itertools.repeat(tag),
+          itertools.repeat(model_id),
+          rows,
+          itertools.repeat(shared.handle),
+          itertools.repeat(deadline),
+          itertools.repeat(flag),
+          max_in_flight=num_workers,
+          timeout=timeout if deadline is None else time_left(deadline),
+          gate=get_scheduler().lease(num_workers),
+          cancelled=cancelled,
+          on_abort=flag.set,
+        ),
+      ):
+        record_chunk(model_id, len(chunk), elapsed, peak_rss)
+        if values is not None:
+          fallback.append((chunk_rows, values))
+        headers.append(header)
+    finally:
+      flag.clear()
+    if not fallback:
+      return numpy.array(shared.array), (headers[0] if headers else None)
+    results = shared.array.tolist()
+  for chunk_rows, values in fallback:
+    for idx, row in zip(chunk_rows, values):
+      results[idx] = row
   return results, (headers[0] if headers else None)
 
 
+def worker_budget():
+  if WORKER_BUDGET > 0:
+    return WORKER_BUDGET
+  metadata = get_sync_metadata()
+  model_id = metadata["card"]["Identifier"] if metadata else None
+  by_mem, by_cpu = worker_capacity(model_id)
+  # Not the pool's max_workers: creating a pool sizes its placement from this.
+  budget = min(max(1, POOL_MAX_WORKERS), by_mem, by_cpu)
+  cprint(f"Worker budget: {budget} (mem: {by_mem}, cpu: {by_cpu})", fg="blue")
+  return budget
+
+
+def get_scheduler():
+  global scheduler
+  if scheduler is None:
+    scheduler = WorkerScheduler(worker_budget())
+    set_worker_budget(scheduler.budget, get_cpu_count(logical=True))
+  return scheduler
+
+
+def get_worker_pool(api=None):
+  """`pool.get_worker_pool`, once the scheduler has sized CPU placements."""
+  get_scheduler()
+  return _get_worker_pool(api)
+
+
+def run_in_parallel(num_workers, tag, chunks, model_id, task_type, timeout=None):
+  cprint(f"ProcessPool tasks: {len(chunks)} | workers: {num_workers}", fg="blue")
+  return _run_in_pool(
+    num_workers, tag, chunks, model_id, task_type, timeout, threads=False
+  )
+
+
 def run_in_threads(num_workers, tag, chunks, model_id, task_type, timeout=None):
   cprint(f"ThreadPool tasks: {len(chunks)} | workers: {num_workers}", fg="blue")
-  results = []
-  headers = []
-  with ThreadPoolExecutor(max_workers=num_workers) as executor:
-    for chunk_result, header in executor.map(
-      process_chunk,
-      chunks,
-      range(len(chunks)),
-      itertools.repeat(tag),
-      itertools.repeat(model_id),
-      itertools.repeat(task_type),
-      timeout=timeout,
-    ):
-      results.extend(chunk_result)
-      headers.append(header)
-  return results, (headers[0] if headers else None)
+  return _run_in_pool(
+    num_workers, tag, chunks, model_id, task_type, timeout, threads=True
+  )
 
 
-def compute_parallel(data, tag, max_workers, min_workers, metadata, task_type):
-  num_workers = compute_num_workers(data, max_workers, min_workers)
+def plan_chunks(data, max_workers, min_workers, model_id=None, contiguous=False):
+  """Return `(num_workers, chunks, rows)`, `rows[i]` being the input indices of
+  `chunks[i]`. Unless `contiguous`, chunks are packed by input cost, costliest
+  first, and results must be put back in order with `restore_order`.
+  """
+  max_workers = min(max_workers, get_worker_pool().max_workers)
+  num_workers = compute_num_workers(data, max_workers, min_workers, model_id)
   os.environ["MAX_WORKERS"] = str(num_workers)
-  max_chunks = num_workers * CHUNK_MULTIPLIER
-  chunk_count = min(len(data), max_chunks) if data else 1
-  chunks = split_data(data, chunk_count)
+  chunk_count = chunk_costs.chunk_count(model_id, len(data), num_workers) if data else 1
+  if COST_AWARE_CHUNKING and not contiguous and data:
+    rows = pack_chunks(data, chunk_count)
+    chunks = [[data[i] for i in chunk_rows] for chunk_rows in rows]
+  else:
+    chunks = split_data(data, chunk_count)
+    rows = contiguous_rows(len(chunk) for chunk in chunks)
   cprint(f"Scheduling {len(chunks)} chunks across {num_workers} workers", fg="blue")
+  return num_workers, chunks, rows
+
+
+def compute_parallel(
+  data,
+  tag,
+  max_workers,
+  min_workers,
+  metadata,
+  task_type,
+  strategy=StrategyEnum.PROCESSES,
+):
+  num_workers, chunks, rows = plan_chunks(
+    data, max_workers, min_workers, metadata["Identifier"]
+  )
 
-  if not is_model_variable(metadata) and len(data) < (num_workers * 10):
-    return run_in_threads(num_workers, tag, chunks, metadata["Identifier"], task_type)
+  if strategy == StrategyEnum.THREADS:
+    run = run_in_threads
   else:
-    return run_in_parallel(num_workers, tag, chunks, metadata["Identifier"], task_type)
+    layout = shared_result_layout(metadata, task_type)
+    if layout is not None:
+      return _run_in_shared(
+        num_workers, tag, chunks, rows, metadata["Identifier"], layout
+      )
+    run = run_in_parallel
+  results, header = run(num_workers, tag, chunks, metadata["Identifier"], task_type)
+  return restore_order(rows, results), header
 
 
 def run_sequential_data(tag, data, model_id, task_type):
-  return process_chunk(data, 0, tag, model_id, task_type)
+  return process_chunk(
+    data, 0, tag, model_id, task_type, request_deadline.get(), request_cancelled.get()
+  )
 
 
 def is_model_variable(metadata):
@@ -510,6 +803,65 @@ def is_model_variable(metadata):
   return False
 
 
+# Chunks of the async path always run as subprocesses of the event loop, so
+# "threads" stands for concurrent runs from the API process there.
+ASYNC_STRATEGIES = (StrategyEnum.SEQUENTIAL, StrategyEnum.THREADS)
+
+
+def plan_strategy(
+  data, max_workers, min_workers, metadata, strategies=tuple(StrategyEnum)
+):
+  """Pick the strategy and worker count of a request among `strategies`.
+
+  The learned cost model decides once it knows the model's run cost. Until
+  then, or with `STRATEGY_SELECTION` off, the static size rules below do.
+  """
+  model_id = metadata["Identifier"]
+  max_workers = min(max_workers, get_worker_pool().max_workers)
+  workers = compute_num_workers(data, max_workers, min_workers, model_id)
+  plan = None
+  if STRATEGY_SELECTION:
+    plan = strategy_selector.choose(
+      model_id, len(data), workers, min(min_workers, workers), strategies
+    )
+  if plan is None:
+    plan = static_strategy(data, workers, metadata, strategies)
+  cprint(f"Strategy: {plan.strategy.value} on {plan.workers} workers", fg="blue")
+  return plan
+
+
+def static_strategy(data, num_workers, metadata, strategies=tuple(StrategyEnum)):
+  if num_workers <= 1 or not is_parallel_amenable(data, metadata):
+    return StrategyPlan(StrategyEnum.SEQUENTIAL, 1, None)
+  if StrategyEnum.PROCESSES in strategies and len(data) >= num_workers * 10:
+    return StrategyPlan(StrategyEnum.PROCESSES, num_workers, None)
+  return StrategyPlan(StrategyEnum.THREADS, num_workers, None)
+
+
+def observe_strategy(metadata, plan, n_items, seconds):
+  strategy_selector.observe(metadata["Identifier"], plan, n_items, seconds)
+
+
+def strategy_report(n_items, max_workers, min_workers, metadata):
+  """Predicted latency of each strategy for a request of `n_items` inputs."""
+  model_id = metadata["Identifier"]
+  max_workers = min(max_workers, get_worker_pool().max_workers)
+  workers = compute_num_workers(range(n_items), max_workers, min_workers, model_id)
+  plans = strategy_selector.predict(
+    model_id, n_items, workers, min(min_workers, workers)
+  )
+  if not plans:
+    plans = [static_strategy(range(n_items), workers, metadata)]
+  return {
+    "model_id": model_id,
+    "items": n_items,
+    "selection": STRATEGY_SELECTION,
+    "chosen": plans[0]._asdict(),
+    "predictions": [plan._asdict() for plan in plans],
+    **strategy_selector.stats(model_id),
+  }
+
+
 def is_parallel_amenable(data, metadata):
   model_size_thres = compute_max_model_size_threshold()
   if model_size_byte > model_size_thres and len(data) >= int(DATA_SIZE_LOWERBOUND):
@@ -519,68 +871,659 @@ def is_parallel_amenable(data, metadata):
   return False
 
 
+def _submit_batch(key, inputs, deadline, cancelled):
+  model_id, task_type, api_name = key
+  tag = str(uuid.uuid4())
+  return get_worker_pool(api_name).submit(
+    _process_batch, inputs, tag, model_id, task_type, deadline, cancelled, threads=True
+  )
+
+
+def _process_batch(inputs, tag, model_id, task_type, deadline, cancelled):
+  with get_scheduler().lease().slot():
+    results, header, elapsed, peak_rss = process_chunk_timed(
+      inputs, 0, tag, model_id, task_type, deadline, cancelled
+    )
+  record_chunk(model_id, len(inputs), elapsed, peak_rss)
+  return results, header
+
+
+micro_batcher = MicroBatcher(_submit_batch)
+
+
+def run_on_peers(data, task_type, deadline=None, cancelled=None):
+  # Peers get the request's own task type, so they run the model as we would.
+  heavy = task_type == TaskTypeEnum.HEAVY
+  return coordinator.run(data, heavy, deadline, cancelled)
+
+
 def compute_results(data, tag, max_workers, min_workers, metadata, task_type):
-  parallel_amenable = is_parallel_amenable(data, metadata)
-  cprint(f"Amenable for multiprocessing: {parallel_amenable}", fg="blue")
-  if parallel_amenable:
-    return compute_parallel(data, tag, max_workers, min_workers, metadata, task_type)
+  if coordinator is not None:
+    return run_on_peers(data, task_type, request_deadline.get())
+  plan = plan_strategy(data, max_workers, min_workers, metadata)
+  start = time.monotonic()
+  if plan.strategy != StrategyEnum.SEQUENTIAL:
+    output = compute_parallel(
+      data, tag, plan.workers, plan.workers, metadata, task_type, plan.strategy
+    )
+  elif MICRO_BATCHING and micro_batcher.accepts(data):
+    key = (metadata["Identifier"], task_type, current_api.get())
+    output = micro_batcher.submit(
+      key, data, request_deadline.get(), request_cancelled.get()
+    ).result()
   else:
-    return run_sequential_data(tag, data, metadata["Identifier"], task_type)
+    output = run_sequential_data(tag, data, metadata["Identifier"], task_type)
+  observe_strategy(metadata, plan, len(data), time.monotonic() - start)
+  return output
 
 
-def _process_chunk_simple(chunk, chunk_idx, base_tag, model_id):
+def _chunk_paths(chunk_idx, base_tag, model_id, task_type):
   tag = f"{base_tag}_{chunk_idx}"
-  input_f = os.path.join(TEMP_FOLDER, f"input-{tag}.csv")
-  output_f = os.path.join(TEMP_FOLDER, f"output-{tag}.csv")
-  try:
-    with open(input_f, "w", newline="") as csvfile:
-      writer = csv.writer(csvfile)
-      writer.writerow(["input"])
-      for item in chunk:
-        writer.writerow([item])
-
-    cmd = (
-      f"bash {FRAMEWORK_FOLDER}/run.sh {FRAMEWORK_FOLDER} {input_f} {output_f} {ROOT}"
+  if task_type == "heavy":
+    model_task_path = os.path.join(EOS_TMP_TASKS, model_id)
+    if not os.path.exists(model_task_path):
+      os.makedirs(model_task_path, exist_ok=True)
+    return (
+      os.path.join(model_task_path, f"input-{tag}.bin"),
+      os.path.join(model_task_path, f"output-{tag}.bin"),
     )
-    subprocess.run(cmd, shell=True, check=True)
-    with open(output_f, "r", newline="") as csvfile:
-      reader = csv.reader(csvfile)
-      rows = list(reader)
-    header = rows[0] if rows else []
-    results = rows[1:] if len(rows) > 1 else []
-  finally:
-    for fpath in [input_f, output_f]:
-      if os.path.exists(fpath):
-        os.remove(fpath)
+  return (
+    os.path.join(temp_folder(), f"input-{tag}.csv"),
+    os.path.join(temp_folder(), f"output-{tag}.csv"),
+  )
+
+
+def write_csv_input(chunk, input_f):
+  with open(input_f, "w", newline="") as csvfile:
+    writer = csv.writer(csvfile)
+    writer.writerow(["input"])
+    for item in chunk:
+      writer.writerow([item])
+
+
+def read_csv_output(output_f):
+  with open(output_f, "r", newline="") as csvfile:
+    reader = csv.reader(csvfile)
+    rows = list(reader)
+  header = rows[0] if rows else []
+  results = rows[1:] if len(rows) > 1 else []
   return results, header
 
 
-def _process_chunk_heavy(chunk, chunk_idx, base_tag, model_id):
-  tag = f"{base_tag}_{chunk_idx}"
-  model_task_path = os.path.join(EOS_TMP_TASKS, model_id)
+def _write_chunk(chunk, input_f, task_type):
+  if task_type == "heavy":
+    write_smiles_bin(chunk, input_f)
+  else:
+    write_csv_input(chunk, input_f)
+
+
+def _feed(chunk, input_f, task_type):
+  return ChunkInput(input_f, lambda path: _write_chunk(chunk, path, task_type))
+
 
-  if not os.path.exists(model_task_path):
-    os.makedirs(model_task_path, exist_ok=True)
-  input_f_bin = os.path.join(model_task_path, f"input-{tag}.bin")
-  output_f_bin = os.path.join(model_task_path, f"output-{tag}.bin")
+def _run_fed(chunk, input_f, output_f, task_type, deadline=None, cancelled=None):
+  feed = _feed(chunk, input_f, task_type)
+  feed.open()
   try:
-    write_smiles_bin(chunk, input_f_bin)
-    cmd = f"bash {FRAMEWORK_FOLDER}/run.sh {FRAMEWORK_FOLDER} {input_f_bin} {output_f_bin} {ROOT}"
-    subprocess.run(cmd, shell=True, check=True)
-    if not os.path.exists(output_f_bin):
-      raise FileNotFoundError(f"{output_f_bin} not found")
-    results, header = read_bin(output_f_bin)
+    return run_model(input_f, output_f, time_left(deadline), cancelled)
   finally:
-    for fpath in [input_f_bin, output_f_bin]:
-      if os.path.exists(fpath):
-        os.remove(fpath)
-  return results, header
+    feed.close()
+
+
+async def _run_fed_async(chunk, input_f, output_f, task_type):
+  feed = _feed(chunk, input_f, task_type)
+  await to_thread(feed.open)
+  try:
+    return await run_model_async(input_f, output_f)
+  finally:
+    await to_thread(feed.close)
 
 
-def process_chunk(chunk, chunk_idx, base_tag, model_id, task_type):
+def _read_chunk(output_f, task_type):
   if task_type == "heavy":
-    return _process_chunk_heavy(chunk, chunk_idx, base_tag, model_id)
-  return _process_chunk_simple(chunk, chunk_idx, base_tag, model_id)
+    if not os.path.exists(output_f):
+      raise FileNotFoundError(f"{output_f} not found")
+    values, columns = read_bin_array(output_f)
+    return numpy.array(values), columns  # detach from the file before removal
+  return read_csv_output(output_f)
+
+
+def _remove_files(paths):
+  for fpath in paths:
+    if os.path.exists(fpath):
+      os.remove(fpath)
+
+
+def bisects(task_type):
+  return BISECT_RETRY and task_type != "heavy"
+
+
+def _run_chunk(
+  chunk, chunk_idx, base_tag, model_id, task_type, deadline=None, cancelled=None
+):
+  """Run a chunk, bisecting it on failure, until `deadline` or `cancelled`."""
+  peaks = [0]
+
+  def run(items, key):
+    input_f, output_f = _chunk_paths(chunk_idx, base_tag + key, model_id, task_type)
+    try:
+      peaks.append(_run_fed(items, input_f, output_f, task_type, deadline, cancelled))
+      return _read_chunk(output_f, task_type)
+    finally:
+      _remove_files([input_f, output_f])
+
+  if bisects(task_type):
+    results, header = Bisector().run(run, chunk)
+  else:
+    results, header = run(chunk, "")
+  return results, header, max(peaks)
+
+
+def process_chunk(
+  chunk, chunk_idx, base_tag, model_id, task_type, deadline=None, cancelled=None
+):
+  results, header, _ = _run_chunk(
+    chunk, chunk_idx, base_tag, model_id, task_type, deadline, cancelled
+  )
+  return results, header
+
+
+def process_chunk_timed(
+  chunk, chunk_idx, base_tag, model_id, task_type, deadline=None, cancelled=None
+):
+  start = time.monotonic()
+  results, header, peak_rss = _run_chunk(
+    chunk, chunk_idx, base_tag, model_id, task_type, deadline, cancelled
+  )
+  return results, header, time.monotonic() - start, peak_rss
+
+
+def process_chunk_shared(
+  chunk, chunk_idx, base_tag, model_id, rows, handle, deadline=None, cancelled=None
+):
+  """Run a heavy chunk and write its rows straight into the shared result array.
+
+  Returns `(None, header, elapsed, peak_rss)`, or the rows themselves in place
+  of None if their width does not match the shared array.
+  """
+  start = time.monotonic()
+  input_f, output_f = _chunk_paths(chunk_idx, base_tag, model_id, "heavy")
+  try:
+    peak_rss = _run_fed(chunk, input_f, output_f, "heavy", deadline, cancelled)
+    values, header = read_bin_array(output_f)
+    if values.shape == (len(chunk), handle[1][1]):
+      write_rows(handle, rows, values)
+      values = None
+    else:
+      values = values.tolist()
+  finally:
+    _remove_files([input_f, output_f])
+  return values, header, time.monotonic() - start, peak_rss
+
+
+async def process_chunk_async(chunk, chunk_idx, base_tag, model_id, task_type):
+  input_f, output_f = _chunk_paths(chunk_idx, base_tag, model_id, task_type)
+  try:
+    peak_rss = await _run_fed_async(chunk, input_f, output_f, task_type)
+    results, header = await to_thread(_read_chunk, output_f, task_type)
+  finally:
+    await to_thread(_remove_files, [input_f, output_f])
+  return results, header, peak_rss
+
+
+def record_chunk(model_id, n_items, elapsed, peak_rss):
+  chunk_costs.record(model_id, n_items, elapsed)
+  footprints.record(model_id, peak_rss)
+  get_scheduler().observe(model_id, n_items, elapsed)
+
+
+async def cancel_tasks(tasks):
+  # Wait for cancelled chunks so their process groups and temp files are gone
+  # before the request returns.
+  for task in tasks:
+    task.cancel()
+  await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# `time.monotonic()` deadline of the request being served, if any, and the
+# `threading.Event` set once it is cancelled, e.g. at the deadline or when the
+# client disconnects. Sync runs stop and kill their model processes on it.
+request_deadline = contextvars.ContextVar("deadline", default=None)
+request_cancelled = contextvars.ContextVar("cancelled", default=None)
+
+
+def resolve_timeout(timeout):
+  return min(timeout or DEFAULT_TIMEOUT, MAX_TIMEOUT)
+
+
+async def run_with_deadline(coro, timeout, request=None):
+  """Await `coro`, cancelling it once `timeout` passes or `request` disconnects."""
+  deadline = time.monotonic() + timeout
+  cancelled = threading.Event()
+  deadline_token = request_deadline.set(deadline)
+  cancelled_token = request_cancelled.set(cancelled)
+  try:
+    task = asyncio.ensure_future(coro)
+  finally:
+    request_cancelled.reset(cancelled_token)
+    request_deadline.reset(deadline_token)
+  try:
+    while True:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        raise AppException(504, ErrorMessages.TIMEOUT)
+      poll = remaining if request is None else min(remaining, DISCONNECT_POLL_INTERVAL)
+      done, _ = await asyncio.wait([task], timeout=poll)
+      if done:
+        return task.result()
+      if request is not None and await request.is_disconnected():
+        cprint("Client disconnected, cancelling its chunks", fg="yellow")
+        raise AppException(499, ErrorMessages.CLIENT_DISCONNECTED)
+  finally:
+    cancelled.set()  # stops sync runs, which task cancellation cannot reach
+    await cancel_tasks([task])
+
+
+async def run_in_slot(chunk, chunk_idx, base_tag, model_id, task_type, lease=None):
+  """Run a chunk in a scheduler slot. If it fails, its halves are retried, each
+  in a slot of its own, until the failing inputs get `RowError` rows."""
+  lease = lease or get_scheduler().lease()
+
+  async def run(items, key):
+    async with lease.slot_async():
+      start = time.monotonic()
+      results, header, peak_rss = await process_chunk_async(
+        items, chunk_idx, base_tag + key, model_id, task_type
+      )
+    record_chunk(model_id, len(items), time.monotonic() - start, peak_rss)
+    return results, header
+
+  if bisects(task_type):
+    return await Bisector().run_async(run, chunk)
+  return await run(chunk, "")
+
+
+async def compute_parallel_async(
+  data, tag, max_workers, min_workers, metadata, task_type
+):
+  num_workers, chunks, rows = await to_thread(
+    plan_chunks, data, max_workers, min_workers, metadata["Identifier"]
+  )
+  cprint(f"Async tasks: {len(chunks)} | workers: {num_workers}", fg="blue")
+  lease = get_scheduler().lease(num_workers)
+  if HEDGING and not is_model_variable(metadata):
+    outputs = await gather_hedged(
+      lambda i, copy: run_in_slot(
+        chunks[i], i, f"{tag}-{copy}", metadata["Identifier"], task_type, lease=lease
+      ),
+      len(chunks),
+      can_hedge=lambda: lease.held < lease.want and get_scheduler().has_idle_slot(),
+    )
+    return _join_outputs(outputs, rows)
+  tasks = [
+    asyncio.ensure_future(
+      run_in_slot(chunk, i, tag, metadata["Identifier"], task_type, lease=lease)
+    )
+    for i, chunk in enumerate(chunks)
+  ]
+  try:
+    outputs = await asyncio.gather(*tasks)
+  finally:
+    await cancel_tasks(tasks)
+  return _join_outputs(outputs, rows)
+
+
+def _join_outputs(outputs, rows):
+  results = concat_results([chunk_result for chunk_result, _ in outputs])
+  return restore_order(rows, results), first_header(h for _, h in outputs)
+
+
+async def iter_chunks_async(
+  data, tag, max_workers, min_workers, metadata, task_type, ordered=True, timeout=None
+):
+  """Yield `(rows, inputs, results, header)` for each chunk once it is done.
+
+  At most `num_workers` chunks are in flight. With `ordered` chunks are
+  contiguous and yielded in input order, otherwise they are packed by cost and
+  yielded as soon as each one completes. Raises `TimeoutError` once `timeout`
+  seconds have passed.
+  """
+  deadline = None if timeout is None else time.monotonic() + timeout
+  num_workers, chunks, rows = await to_thread(
+    plan_chunks, data, max_workers, min_workers, metadata["Identifier"], ordered
+  )
+  cprint(f"Streaming tasks: {len(chunks)} | workers: {num_workers}", fg="blue")
+  tasks, submitted = {}, 0
+  lease = get_scheduler().lease(num_workers)
+
+  def top_up():
+    nonlocal submitted
+    while submitted < len(chunks) and len(tasks) < num_workers:
+      chunk = chunks[submitted]
+      task = asyncio.ensure_future(
+        run_in_slot(
+          chunk, submitted, tag, metadata["Identifier"], task_type, lease=lease
+        )
+      )
+      tasks[task] = submitted
+      submitted += 1
+
+  try:
+    top_up()
+    while tasks:
+      remaining = None if deadline is None else max(0, deadline - time.monotonic())
+      if ordered:
+        head = min(tasks, key=tasks.get)
+        done, _ = await asyncio.wait([head], timeout=remaining)
+      else:
+        done, _ = await asyncio.wait(
+          tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+        )
+      if not done:
+        raise TimeoutError(f"Streaming run did not finish within {timeout} seconds")
+      done = sorted(done, key=tasks.get)
+      for task in done:
+        idx = tasks.pop(task)
+        results, header = task.result()
+        yield rows[idx], chunks[idx], results, header
+      top_up()
+  finally:
+    await cancel_tasks(tasks)
+
+
+def ndjson_lines(rows, inputs, results, header, output_type):
+  if isinstance(results, numpy.ndarray):
+    results = results.tolist()
+  records = orient_to_json(results, header or [], inputs, "records", output_type)
+  return b"".join(
+    orjson.dumps({"index": idx, "input": x, "output": record}) + b"\n"
+    for idx, x, record in zip(rows, inputs, records)
+  )
+
+
+async def stream_ndjson(
+  data, tag, max_workers, min_workers, metadata, task_type, ordered=True, timeout=None
+):
+  """Stream one JSON line per input as its chunk completes.
+
+  Redis is not consulted. A failure after the first line has been sent can no
+  longer change the status code, so it is reported as a final `error` line.
+  """
+  output_type = metadata["Output Type"]
+  try:
+    async for rows, inputs, results, header in iter_chunks_async(
+      data, tag, max_workers, min_workers, metadata, task_type, ordered, timeout
+    ):
+      yield await to_thread(ndjson_lines, rows, inputs, results, header, output_type)
+  except TimeoutError as e:
+    logger.warning("Streaming run timed out: %s", e)
+    yield orjson.dumps({"error": ErrorMessages.TIMEOUT.value}) + b"\n"
+  except Exception as e:
+    logger.warning("Streaming run failed: %s", e)
+    yield orjson.dumps({"error": ErrorMessages.SERVER.value}) + b"\n"
+
+
+async def _run_chunk_to_file(chunk, chunk_idx, base_tag, model_id, lease):
+  input_f, output_f = _chunk_paths(chunk_idx, base_tag, model_id, "heavy")
+  async with lease.slot_async():
+    start = time.monotonic()
+    try:
+      peak_rss = await _run_fed_async(chunk, input_f, output_f, "heavy")
+    except BaseException:
+      await to_thread(_remove_files, [output_f])
+      raise
+    finally:
+      await to_thread(_remove_files, [input_f])
+    elapsed = time.monotonic() - start
+  record_chunk(model_id, len(chunk), elapsed, peak_rss)
+  return output_f, len(chunk)
+
+
+async def compute_heavy_files_async(data, tag, max_workers, min_workers, metadata):
+  """Run a heavy request and keep each chunk's .bin output on disk.
+
+  Chunks are contiguous, so the returned `(path, n_rows)` list is in input
+  order. The caller owns the files; they are removed here only on failure.
+  """
+  model_id = metadata["Identifier"]
+  plan = await to_thread(
+    plan_strategy, data, max_workers, min_workers, metadata, ASYNC_STRATEGIES
+  )
+  if plan.strategy != StrategyEnum.SEQUENTIAL:
+    num_workers, chunks, _ = await to_thread(
+      plan_chunks, data, plan.workers, plan.workers, model_id, True
+    )
+  else:
+    num_workers, chunks = 1, [data]
+  lease = get_scheduler().lease(num_workers)
+  tasks = [
+    asyncio.ensure_future(_run_chunk_to_file(chunk, i, tag, model_id, lease))
+    for i, chunk in enumerate(chunks)
+  ]
+  start = time.monotonic()
+  try:
+    files = await asyncio.gather(*tasks)
+    observe_strategy(metadata, plan, len(data), time.monotonic() - start)
+    return files
+  except BaseException:
+    await cancel_tasks(tasks)
+    done = [t for t in tasks if not t.cancelled() and t.exception() is None]
+    await to_thread(_remove_files, [t.result()[0] for t in done])
+    raise
+
+
+async def _run_apis_on_chunk(chunk, chunk_idx, base_tag, model_id, apis, lease):
+  """Write `chunk` once and run every API in `apis` on it, each in its own slot."""
+  input_f, _ = _chunk_paths(chunk_idx, base_tag, model_id, "simple")
+  outputs = {
+    name: _chunk_paths(chunk_idx, f"{base_tag}-{name}", model_id, "simple")[1]
+    for name in apis
+  }
+
+  async def run_one(name):
+    with api(name):
+      async with lease.slot_async():
+        start = time.monotonic()
+        peak_rss = await run_model_async(input_f, outputs[name])
+        elapsed = time.monotonic() - start
+      record_chunk(api_model_id(model_id, name), len(chunk), elapsed, peak_rss)
+      return await to_thread(read_csv_output, outputs[name])
+
+  # Always a plain file: every API reads it, so it cannot be a FIFO.
+  feed = ChunkInput(input_f, lambda path: write_csv_input(chunk, path), fifo=False)
+  try:
+    await to_thread(feed.open)
+    tasks = [asyncio.ensure_future(run_one(name)) for name in apis]
+    try:
+      results = await asyncio.gather(*tasks)
+    finally:
+      await cancel_tasks(tasks)
+  finally:
+    await to_thread(_remove_files, [input_f, *outputs.values()])
+  return dict(zip(apis, results))
+
+
+async def compute_apis_async(data, tag, apis, max_workers, min_workers, metadata):
+  """Run several APIs on the same inputs, writing each chunk's input only once.
+
+  Returns `{api: (results, header)}`, results in input order.
+  """
+  model_id = metadata["Identifier"]
+  plan = await to_thread(
+    plan_strategy, data, max_workers, min_workers, metadata, ASYNC_STRATEGIES
+  )
+  if plan.strategy != StrategyEnum.SEQUENTIAL:
+    num_workers, chunks, rows = await to_thread(
+      plan_chunks, data, plan.workers, plan.workers, model_id
+    )
+  else:
+    num_workers, chunks, rows = 1, [data], [range(len(data))]
+  cprint(f"Running {', '.join(apis)} on {len(chunks)} chunks", fg="blue")
+  lease = get_scheduler().lease(num_workers * len(apis))
+  tasks = [
+    asyncio.ensure_future(_run_apis_on_chunk(chunk, i, tag, model_id, apis, lease))
+    for i, chunk in enumerate(chunks)
+  ]
+  try:
+    outputs = await asyncio.gather(*tasks)
+  finally:
+    await cancel_tasks(tasks)
+  combined = {}
+  for name in apis:
+    results = concat_results([out[name][0] for out in outputs])
+    header = outputs[0][name][1] if outputs else None
+    combined[name] = (restore_order(rows, results), header)
+  return combined
+
+
+def load_bin_files(files):
+  """Read and remove the .bin files of `compute_heavy_files_async`."""
+  try:
+    outputs = [_read_chunk(path, "heavy") for path, _ in files]
+  finally:
+    _remove_files([path for path, _ in files])
+  results = concat_results([values for values, _ in outputs])
+  return results, first_header(h for _, h in outputs)
+
+
+async def compute_results_async(
+  data, tag, max_workers, min_workers, metadata, task_type
+):
+  if coordinator is not None:
+    # Set when this coroutine is cancelled, so the peers stop their shards.
+    cancelled = threading.Event()
+    try:
+      return await to_thread(
+        run_on_peers, data, task_type, request_deadline.get(), cancelled
+      )
+    finally:
+      cancelled.set()
+  plan = await to_thread(
+    plan_strategy, data, max_workers, min_workers, metadata, ASYNC_STRATEGIES
+  )
+  start = time.monotonic()
+  if plan.strategy != StrategyEnum.SEQUENTIAL:
+    output = await compute_parallel_async(
+      data, tag, plan.workers, plan.workers, metadata, task_type
+    )
+  elif MICRO_BATCHING and micro_batcher.accepts(data):
+    key = (metadata["Identifier"], task_type, current_api.get())
+    output = await asyncio.wrap_future(
+      micro_batcher.submit(key, data, request_deadline.get(), request_cancelled.get())
+    )
+  else:
+    output = await run_in_slot(data, 0, tag, metadata["Identifier"], task_type)
+  observe_strategy(metadata, plan, len(data), time.monotonic() - start)
+  return output
+
+
+def _cache_field(item):
+  return item.get("input") if isinstance(item, dict) and "input" in item else item
+
+
+def _cache_loads(value):
+  if isinstance(value, (bytes, bytearray)):
+    value = value.decode("utf-8")
+  result = json.loads(value)
+  if isinstance(result, dict) and "error" in result:
+    return RowError(result["error"])
+  return result
+
+
+def _loads_header(cached):
+  try:
+    return json.loads(cached) if isinstance(cached, str) else cached
+  except Exception:
+    return cached
+
+
+def resolve_cache_flags(fetch_cache, save_cache, cache_only):
+  fetch_cache = bool(fetch_cache)
+  if not fetch_cache:
+    return False, False, False
+  save_cache = bool(save_cache)
+  cache_only = bool(cache_only)
+  if cache_only:
+    save_cache = True
+  return fetch_cache, save_cache, cache_only
+
+
+def cache_only_results(raw, header):
+  results = []
+  for val in raw:
+    if val:
+      try:
+        results.append(_cache_loads(val))
+      except Exception:
+        results.append([None] * len(header))
+    else:
+      results.append([None] * len(header))
+  return results
+
+
+def split_cached(data, raw):
+  results = [None] * len(data)
+  missing_idx = []
+  missing_items = []
+  for i, (item, val) in enumerate(zip(data, raw)):
+    if val:
+      try:
+        results[i] = _cache_loads(val)
+      except Exception:
+        results[i] = None
+        missing_idx.append(i)
+        missing_items.append(item)
+    else:
+      missing_idx.append(i)
+      missing_items.append(item)
+  return results, missing_idx, missing_items
+
+
+def dedupe_inputs(data):
+  """Return the distinct inputs and, per input, the position of its copy in them."""
+  index, unique = {}, []
+  positions = []
+  for item in data:
+    key = make_hashable(item)
+    pos = index.get(key)
+    if pos is None:
+      pos = index[key] = len(unique)
+      unique.append(item)
+    positions.append(pos)
+  return unique, positions
+
+
+def has_duplicates(data, metadata):
+  """Whether `run_cached_or_compute` would deduplicate `data`."""
+  if is_model_variable(metadata):
+    return False
+  return len({make_hashable(item) for item in data}) < len(data)
+
+
+def fan_out(results, positions):
+  if isinstance(results, numpy.ndarray):
+    return results[numpy.asarray(positions, dtype=numpy.intp)]
+  return [results[pos] for pos in positions]
+
+
+def merge_computed(results, missing_idx, computed_results):
+  if isinstance(computed_results, numpy.ndarray) and len(missing_idx) == len(results):
+    return computed_results
+  for i, r in zip(missing_idx, computed_results):
+    results[i] = r
+  return results
+
+
+def _cache_dumps(result):
+  if isinstance(result, numpy.ndarray):
+    result = result.tolist()
+  elif isinstance(result, RowError):
+    result = {"error": result.message}
+  return json.dumps(result)
+
+
+def _cacheable(result):
+  return NEGATIVE_CACHE or not isinstance(result, RowError)
 
 
 def cache_missing_results(model_id, missing_inputs, computed_results):
@@ -588,14 +1531,27 @@ def cache_missing_results(model_id, missing_inputs, computed_results):
   try:
     pipe = redis_client.pipeline()
     for item, result in zip(missing_inputs, computed_results):
-      field = item.get("input") if isinstance(item, dict) and "input" in item else item
-      pipe.hset(hash_key, field, json.dumps(result))
+      if _cacheable(result):
+        pipe.hset(hash_key, _cache_field(item), _cache_dumps(result))
     pipe.expire(hash_key, REDIS_EXPIRATION)
     pipe.execute()
   except Exception as e:
     logger.warning("Redis cache save failed: %s", e)
 
 
+async def cache_missing_results_async(model_id, missing_inputs, computed_results):
+  hash_key = f"cache:{model_id}"
+  try:
+    pipe = async_redis_client.pipeline()
+    for item, result in zip(missing_inputs, computed_results):
+      if _cacheable(result):
+        pipe.hset(hash_key, _cache_field(item), _cache_dumps(result))
+    pipe.expire(hash_key, REDIS_EXPIRATION)
+    await pipe.execute()
+  except Exception as e:
+    logger.warning("Redis cache save failed: %s", e)
+
+
 def fetch_or_cache_header(model_id, computed_headers=None):
   header_key = f"{model_id}:header"
   cached = None
@@ -604,10 +1560,7 @@ def fetch_or_cache_header(model_id, computed_headers=None):
   except Exception as e:
     logger.warning("Redis get header failed: %s", e)
   if cached:
-    try:
-      return json.loads(cached) if isinstance(cached, str) else cached
-    except Exception:
-      return cached
+    return _loads_header(cached)
   if computed_headers is not None:
     try:
       redis_client.setex(header_key, REDIS_EXPIRATION, json.dumps(computed_headers))
@@ -617,6 +1570,26 @@ def fetch_or_cache_header(model_id, computed_headers=None):
   return None
 
 
+async def fetch_or_cache_header_async(model_id, computed_headers=None):
+  header_key = f"{model_id}:header"
+  cached = None
+  try:
+    cached = await async_redis_client.get(header_key)
+  except Exception as e:
+    logger.warning("Redis get header failed: %s", e)
+  if cached:
+    return _loads_header(cached)
+  if computed_headers is not None:
+    try:
+      await async_redis_client.setex(
+        header_key, REDIS_EXPIRATION, json.dumps(computed_headers)
+      )
+    except Exception as e:
+      logger.warning("Redis setex header failed: %s", e)
+    return computed_headers
+  return None
+
+
 def get_cached_or_compute(
   model_id,
   data,
@@ -629,23 +1602,9 @@ def get_cached_or_compute(
   cache_only=False,
   task_type="simple",
 ):
-  fetch_cache = bool(fetch_cache)
-  if not fetch_cache:
-    save_cache = False
-    cache_only = False
-  else:
-    save_cache = bool(save_cache)
-    cache_only = bool(cache_only)
-    if cache_only:
-      save_cache = True
-
-  def _field(x):
-    return x.get("input") if isinstance(x, dict) and "input" in x else x
-
-  def _loads(v):
-    if isinstance(v, (bytes, bytearray)):
-      v = v.decode("utf-8")
-    return json.loads(v)
+  fetch_cache, save_cache, cache_only = resolve_cache_flags(
+    fetch_cache, save_cache, cache_only
+  )
 
   if is_model_variable(metadata):
     inputs = extract_input(data)
@@ -660,7 +1619,7 @@ def get_cached_or_compute(
     return compute_results(inputs, tag, max_workers, min_workers, metadata, task_type)
 
   hash_key = f"cache:{model_id}"
-  fields = [_field(item) for item in data]
+  fields = [_cache_field(item) for item in data]
 
   if cache_only:
     try:
@@ -673,17 +1632,7 @@ def get_cached_or_compute(
     if header is None:
       header, _ = load_csv_data(generic_example_output_file)
 
-    results = []
-    for val in raw:
-      if val:
-        try:
-          results.append(_loads(val))
-        except Exception:
-          results.append([None] * len(header))
-      else:
-        results.append([None] * len(header))
-
-    return results, header
+    return cache_only_results(raw, header), header
 
   try:
     raw = redis_client.hmget(hash_key, fields)
@@ -691,21 +1640,7 @@ def get_cached_or_compute(
     logger.warning("Redis hmget failed: %s", e)
     raw = [None] * len(fields)
 
-  results = [None] * len(data)
-  missing_idx = []
-  missing_items = []
-
-  for i, (item, val) in enumerate(zip(data, raw)):
-    if val:
-      try:
-        results[i] = _loads(val)
-      except Exception:
-        results[i] = None
-        missing_idx.append(i)
-        missing_items.append(item)
-    else:
-      missing_idx.append(i)
-      missing_items.append(item)
+  results, missing_idx, missing_items = split_cached(data, raw)
 
   computed_headers = None
   if missing_items:
@@ -714,8 +1649,7 @@ def get_cached_or_compute(
       inputs, tag, max_workers, min_workers, metadata, task_type
     )
 
-    for i, r in zip(missing_idx, computed_results):
-      results[i] = r
+    results = merge_computed(results, missing_idx, computed_results)
 
     if save_cache:
       cache_missing_results(model_id, missing_items, computed_results)
@@ -725,3 +1659,94 @@ def get_cached_or_compute(
     header, _ = load_csv_data(generic_example_output_file)
 
   return results, header
+
+
+async def get_cached_or_compute_async(
+  model_id,
+  data,
+  tag,
+  max_workers,
+  min_workers,
+  metadata,
+  fetch_cache=True,
+  save_cache=True,
+  cache_only=False,
+  task_type="simple",
+):
+  fetch_cache, save_cache, cache_only = resolve_cache_flags(
+    fetch_cache, save_cache, cache_only
+  )
+
+  if is_model_variable(metadata) or not fetch_cache or not await init_async_redis():
+    inputs = extract_input(data)
+    return await compute_results_async(
+      inputs, tag, max_workers, min_workers, metadata, task_type
+    )
+
+  hash_key = f"cache:{model_id}"
+  fields = [_cache_field(item) for item in data]
+
+  try:
+    raw = await async_redis_client.hmget(hash_key, fields)
+  except Exception as e:
+    logger.warning("Redis hmget failed: %s", e)
+    raw = [None] * len(fields)
+
+  if cache_only:
+    header = await fetch_or_cache_header_async(model_id)
+    if header is None:
+      header, _ = await to_thread(load_csv_data, generic_example_output_file)
+    return cache_only_results(raw, header), header
+
+  results, missing_idx, missing_items = split_cached(data, raw)
+
+  computed_headers = None
+  if missing_items:
+    inputs = extract_input(missing_items)
+    computed_results, computed_headers = await compute_results_async(
+      inputs, tag, max_workers, min_workers, metadata, task_type
+    )
+
+    results = merge_computed(results, missing_idx, computed_results)
+
+    if save_cache:
+      await cache_missing_results_async(model_id, missing_items, computed_results)
+
+  header = await fetch_or_cache_header_async(model_id, computed_headers)
+  if header is None:
+    header, _ = await to_thread(load_csv_data, generic_example_output_file)
+
+  return results, header
+
+
+async def run_cached_or_compute(
+  model_id, data, tag, max_workers, min_workers, metadata, *args, stats=None, **kwargs
+):
+  """Look up or compute each distinct input once and fan results back out.
+
+  Variable models are not deduplicated, as equal inputs may differ in output.
+  With `stats`, the number of inputs and distinct inputs is recorded in it.
+  """
+  positions = None
+  if not is_model_variable(metadata):
+    unique, positions = await to_thread(dedupe_inputs, data)
+    if len(unique) < len(data):
+      cprint(f"Deduplicated {len(data)} inputs to {len(unique)}", fg="blue")
+      data = unique
+    else:
+      positions = None
+  if stats is not None:
+    stats["inputs"] = len(positions) if positions else len(data)
+    stats["unique"] = len(data)
+  args = (model_id, data, tag, max_workers, min_workers, metadata, *args)
+  if ASYNC_EXECUTION:
+    results, header = await get_cached_or_compute_async(*args, **kwargs)
+  else:
+    results, header = await to_thread(get_cached_or_compute, *args, **kwargs)
+  if positions:
+    results = await to_thread(fan_out, results, positions)
+  if header is None:  # every input failed
+    header, _ = await to_thread(load_csv_data, generic_example_output_file)
+  if stats is not None:
+    stats["failed"] = count_row_errors(results)
+  return results, header
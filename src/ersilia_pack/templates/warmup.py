@@ -0,0 +1,95 @@
+import asyncio, time
+
+from . import default
+from .default import (
+  LOADED_AT_STARTUP,
+  WARMUP_RETRY_DELAY,
+  WARMUP_RETRY_MAX_DELAY,
+  ErrorMessages,
+  generic_example_input_file,
+  cprint,
+  logger,
+)
+from .coordinator import coordinator
+from .footprint import footprints
+from .runner import api
+from .utils import (
+  available_apis,
+  api_model_id,
+  get_metadata,
+  load_csv_data,
+  run_cached_or_compute,
+  to_thread,
+)
+
+baseline = {}  # api -> latency and peak RSS of the example run
+warmup_error = None
+
+
+def mark_ready():
+  default.ROOT_ENDPOINT_LOADED = True
+
+
+async def warm_up(delay=WARMUP_RETRY_DELAY, max_delay=WARMUP_RETRY_MAX_DELAY):
+  """Run the example input through every API before declaring the server ready.
+
+  The runs take the same path as a request, bypassing the cache, so they load
+  the model files into the page cache and start the resident runners. Their
+  timings and peak RSS seed the chunk cost and memory estimates, and are kept
+  as the baseline reported by `/healthz`. A coordinator runs no model for
+  `/run`, so it is ready once a peer reports ready instead. Until then the
+  server stays not ready and the warm-up is retried, `delay` seconds later at
+  first and twice as late each time, up to `max_delay`.
+  """
+  global warmup_error
+  while True:
+    try:
+      await (_await_peers() if coordinator is not None else _run_examples())
+      break
+    except Exception as e:
+      warmup_error = str(e)
+      logger.warning("Warm-up failed, retrying in %ss: %s", delay, e)
+    await asyncio.sleep(delay)
+    delay = min(delay * 2, max_delay)
+  warmup_error = None
+  mark_ready()
+
+
+async def _await_peers():
+  capacities = await to_thread(coordinator.capacities)
+  if all(capacity is None for capacity in capacities.values()):
+    raise RuntimeError(ErrorMessages.NO_PEERS)
+
+
+async def _run_examples():
+  metadata = await get_metadata()
+  _, rows = await to_thread(load_csv_data, generic_example_input_file)
+  inputs = [element for row in rows for element in row]
+  for name in available_apis():
+    model_id = api_model_id(metadata["Identifier"], name)
+    start = time.monotonic()
+    with api(name):
+      await run_cached_or_compute(
+        model_id,
+        inputs,
+        f"warmup-{name}",
+        1,
+        1,
+        {**metadata, "Identifier": model_id},
+        False,
+      )
+    baseline[name] = {
+      "items": len(inputs),
+      "seconds": round(time.monotonic() - start, 3),
+      "peak_rss": footprints.estimate(model_id),
+    }
+    cprint(f"Warmed up {name}: {baseline[name]}", fg="blue")
+
+
+def warmup_status():
+  return {
+    "loaded_at_startup": LOADED_AT_STARTUP,
+    "ready": default.ROOT_ENDPOINT_LOADED,
+    "baseline": baseline,
+    "error": warmup_error,
+  }
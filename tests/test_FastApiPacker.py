@@ -226,6 +226,26 @@ class TestFastApiPacker:
         # Assert the output is as expected
         assert api_names == ["run"], "Expected to find 'run' as the API name"
 
+    # 6b. Test _modify_python_exe rewrites every API script
+    def test_modify_python_exe_rewrites_every_api(self, temp_model_directory, bundles_repo_path):
+        metadata_file = temp_model_directory / "metadata.json"
+        metadata_file.write_text(json.dumps({"Identifier": "test_model_id", "Output Type": "Float"}))
+        install_file = temp_model_directory / "install.yml"
+        install_file.write_text(yaml.dump({"python": "3.8", "pip": ["requests"]}))
+        packer = FastApiAppPacker(str(temp_model_directory), str(bundles_repo_path))
+
+        framework_dir = Path(packer.bundle_dir) / "model" / "framework"
+        framework_dir.mkdir(parents=True, exist_ok=True)
+        for api_name in ["run", "embed"]:
+            (framework_dir / f"{api_name}.sh").write_text(f"python $1/code/{api_name}.py $2 $3\n")
+
+        with patch.object(packer.install_writer, "get_python_exe", return_value="/env/bin/python"):
+            packer._modify_python_exe()
+
+        for api_name in ["run", "embed"]:
+            script = (framework_dir / f"{api_name}.sh").read_text()
+            assert script == f"/env/bin/python $1/code/{api_name}.py $2 $3"
+
     # 7. Test _create_app_files
     @patch("shutil.copy")  # Mock shutil.copy
     def test_create_app_files(self, mock_copy, temp_model_directory, bundles_repo_path):
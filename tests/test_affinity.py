@@ -0,0 +1,73 @@
+import asyncio, multiprocessing, os, subprocess, sys
+
+from ersilia_pack.templates import runner
+from ersilia_pack.templates.affinity import Placement, cpu_sets, numa_nodes, parse_cpulist
+
+RUN_SH = """
+echo "$OMP_NUM_THREADS $MKL_NUM_THREADS $OPENBLAS_NUM_THREADS" > "$3"
+"""
+
+
+def test_cpu_lists_and_nodes_are_parsed(tmp_path):
+  assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+  for node, cpus in [(1, "1,3"), (0, "0,2")]:
+    (tmp_path / f"node{node}").mkdir()
+    (tmp_path / f"node{node}" / "cpulist").write_text(cpus)
+  assert numa_nodes(str(tmp_path)) == [[0, 2], [1, 3]]
+  assert numa_nodes(str(tmp_path / "missing")) == []
+
+
+def test_sets_are_disjoint_and_stay_on_a_node():
+  nodes = [[0, 2, 4, 6], [1, 3, 5, 7]]
+  assert cpu_sets(2, range(8), nodes) == [[0, 2, 4, 6], [1, 3, 5, 7]]
+  assert cpu_sets(4, range(8), nodes) == [[0, 2], [4, 6], [1, 3], [5, 7]]
+  assert [len(s) for s in cpu_sets(3, range(8), [])] == [3, 3, 2]
+  assert cpu_sets(3, [0, 1], []) == [[0], [1], [0]]
+
+
+def test_sets_fit_the_cpu_quota():
+  # 64 host CPUs but a 4 CPU quota and 2 slots: 2 CPUs, hence threads, per run.
+  assert cpu_sets(2, range(64), [], n_cpus=4) == [[0, 1], [2, 3]]
+
+
+def test_resident_runner_threads_are_rebound():
+  cpu = sorted(os.sched_getaffinity(0))[0]
+  code = "import threading, time; threading.Thread(target=time.sleep, args=(5,)).start()"
+  proc = subprocess.Popen([sys.executable, "-c", code + "; time.sleep(5)"])
+  try:
+    placement = Placement(1, multiprocessing.get_context("fork"), pin=True)
+    placement.bind_tree(proc.pid, [cpu])
+    for tid in os.listdir(f"/proc/{proc.pid}/task"):
+      assert os.sched_getaffinity(int(tid)) == {cpu}
+  finally:
+    proc.kill()
+    proc.wait()
+
+
+def test_runs_take_the_least_busy_set(monkeypatch):
+  monkeypatch.setenv("MKL_NUM_THREADS", "7")
+  placement = Placement(2, multiprocessing.get_context("fork"), threads=0, limit=True)
+  placement.sets = [[0, 1], [2, 3]]
+  with placement.assign() as first, placement.assign() as second:
+    assert first != second
+    env = placement.env(first)
+  assert env["OMP_NUM_THREADS"] == "2" and env["MKL_NUM_THREADS"] == "7"
+  assert Placement(1, multiprocessing.get_context("fork"), limit=False).env() is None
+
+
+def test_model_runs_get_thread_limits(tmp_path, monkeypatch):
+  (tmp_path / "run.sh").write_text(RUN_SH)
+  monkeypatch.setattr(runner, "FRAMEWORK_FOLDER", str(tmp_path))
+  monkeypatch.setattr(runner, "RESIDENT_RUNNER", False)
+  for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    monkeypatch.delenv(var, raising=False)
+  placement = Placement(
+    1, multiprocessing.get_context("fork"), pin=True, threads=3, limit=True
+  )
+  monkeypatch.setattr(runner, "placement", placement)
+  output_f = str(tmp_path / "output.csv")
+  runner.run_model(str(tmp_path / "input.csv"), output_f)
+  assert open(output_f).read().split() == ["3", "3", "3"]
+  os.remove(output_f)
+  asyncio.run(runner.run_model_async(str(tmp_path / "input.csv"), output_f))
+  assert open(output_f).read().split() == ["3", "3", "3"]
@@ -0,0 +1,74 @@
+import asyncio, csv, os
+
+import pytest
+
+from ersilia_pack.templates import runner, utils
+from ersilia_pack.templates.default import StrategyEnum
+from ersilia_pack.templates.pool import WorkerPool
+from ersilia_pack.templates.strategy import StrategyPlan
+
+
+def _current_api(_):
+  return runner.current_api.get()
+
+
+@pytest.fixture
+def pool():
+  pool = WorkerPool(max_workers=1, start_method="fork", preload=[], api="calc")
+  yield pool
+  pool.shutdown()
+
+
+def test_api_selects_its_script():
+  assert runner._run_sh_args("in", "out")[1].endswith("/run.sh")
+  with runner.api("calc"):
+    assert runner._run_sh_args("in", "out")[1].endswith("/calc.sh")
+    assert not runner.is_resident_enabled()
+  assert runner.current_api.get() == "run"
+
+
+def test_pool_workers_run_their_api(pool):
+  assert list(pool.map(_current_api, [0], threads=True)) == ["calc"]
+  assert list(pool.map(_current_api, [0])) == ["calc"]
+
+
+def test_api_model_id_namespaces_other_apis():
+  assert utils.api_model_id("eos0abc", "run") == "eos0abc"
+  assert utils.api_model_id("eos0abc", "calc") == "eos0abc:calc"
+
+
+def test_apis_share_one_input_file(monkeypatch):
+  writes, seen = [], []
+  write_csv_input = utils.write_csv_input
+
+  def counting_write(chunk, path):
+    writes.append(path)
+    write_csv_input(chunk, path)
+
+  async def fake_run_model_async(input_f, output_f):
+    name = runner.current_api.get()
+    seen.append((name, input_f))
+    with open(input_f, newline="") as f:
+      items = [row[0] for row in list(csv.reader(f))[1:]]
+    with open(output_f, "w", newline="") as f:
+      csv.writer(f).writerows([[name]] + [[f"{name}:{item}"] for item in items])
+    return 0
+
+  monkeypatch.setattr(utils, "write_csv_input", counting_write)
+  monkeypatch.setattr(utils, "run_model_async", fake_run_model_async)
+  monkeypatch.setattr(
+    utils, "plan_strategy", lambda *args: StrategyPlan(StrategyEnum.THREADS, 2, None)
+  )
+  monkeypatch.setattr(
+    utils, "plan_chunks", lambda *args: (2, [["CC", "N"], ["C"]], [[1, 2], [0]])
+  )
+  outputs = asyncio.run(
+    utils.compute_apis_async(
+      ["C", "CC", "N"], "tag", ["run", "calc"], 2, 1, {"Identifier": "eos0abc"}
+    )
+  )
+  assert outputs["run"] == ([["run:C"], ["run:CC"], ["run:N"]], ["run"])
+  assert outputs["calc"] == ([["calc:C"], ["calc:CC"], ["calc:N"]], ["calc"])
+  assert len(writes) == 2
+  assert sorted(set(path for _, path in seen)) == sorted(writes)
+  assert not any(os.path.exists(path) for path in writes)
@@ -0,0 +1,66 @@
+from ersilia_pack.templates.cgroups import read_cgroup_limits
+
+
+def _write(folder, **files):
+  folder.mkdir(parents=True, exist_ok=True)
+  for name, value in files.items():
+    (folder / name.replace("__", ".")).write_text(value + "\n")
+
+
+def test_cgroup_v2_limits(tmp_path):
+  proc = tmp_path / "cgroup"
+  proc.write_text("0::/\n")
+  _write(
+    tmp_path / "fs",
+    cgroup__controllers="cpu memory",
+    cpu__max="250000 100000",
+    memory__max=str(4 * 2**30),
+    memory__current=str(2**30),
+    memory__stat="anon 1\ninactive_file 268435456\n",
+  )
+  limits = read_cgroup_limits(str(tmp_path / "fs"), str(proc))
+  assert limits == {
+    "version": 2,
+    "cpu_limit": 2.5,
+    "memory_limit": 4 * 2**30,
+    "memory_usage": 2**30 - 268435456,
+  }
+
+
+def test_cgroup_v2_without_limits(tmp_path):
+  proc = tmp_path / "cgroup"
+  proc.write_text("0::/kubepods/pod1\n")
+  _write(
+    tmp_path / "fs",
+    cgroup__controllers="cpu memory",
+    cpu__max="max 100000",
+    memory__max="max",
+  )
+  limits = read_cgroup_limits(str(tmp_path / "fs"), str(proc))
+  assert limits["cpu_limit"] is None
+  assert limits["memory_limit"] is None
+
+
+def test_cgroup_v1_fallback(tmp_path):
+  proc = tmp_path / "cgroup"
+  proc.write_text("4:memory:/docker/abc\n2:cpu,cpuacct:/docker/abc\n")
+  fs = tmp_path / "fs"
+  _write(fs / "cpu,cpuacct", cpu__cfs_quota_us="200000", cpu__cfs_period_us="100000")
+  _write(
+    fs / "memory" / "docker" / "abc",
+    memory__limit_in_bytes=str(2**31),
+    memory__usage_in_bytes=str(2**30),
+    memory__stat="total_inactive_file 0\n",
+  )
+  limits = read_cgroup_limits(str(fs), str(proc))
+  assert limits == {
+    "version": 1,
+    "cpu_limit": 2.0,
+    "memory_limit": 2**31,
+    "memory_usage": 2**30,
+  }
+
+
+def test_no_cgroup_information(tmp_path):
+  limits = read_cgroup_limits(str(tmp_path), str(tmp_path / "missing"))
+  assert limits["version"] is None
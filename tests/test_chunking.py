@@ -0,0 +1,72 @@
+import pytest
+
+from ersilia_pack.templates.chunking import (
+  ChunkCostModel,
+  optimal_chunk_count,
+  pack_chunks,
+  restore_order,
+)
+
+
+def _fit(model, fixed, per_item, sizes):
+  for n in sizes:
+    model.record("m", n, fixed + per_item * n)
+
+
+def test_estimate_recovers_linear_cost():
+  model = ChunkCostModel(decay=1.0)
+  _fit(model, 2.0, 0.01, [10, 100, 1000])
+  fixed, per_item = model.estimate("m")
+  assert fixed == pytest.approx(2.0)
+  assert per_item == pytest.approx(0.01)
+
+
+def test_single_chunk_size_falls_back_to_multiplier():
+  model = ChunkCostModel(multiplier=4)
+  _fit(model, 2.0, 0.01, [100, 100])
+  assert model.estimate("m") is None
+  assert model.chunk_count("m", 1000, 3) == 12
+  assert model.chunk_count("other", 5, 3) == 5
+
+
+def test_chunk_count_follows_startup_and_item_cost():
+  startup_bound = ChunkCostModel(decay=1.0)
+  _fit(startup_bound, 5.0, 0.0001, [10, 1000])
+  assert startup_bound.chunk_count("m", 10000, 4) == 4
+
+  item_bound = ChunkCostModel(decay=1.0)
+  _fit(item_bound, 0.1, 0.5, [10, 1000])
+  assert item_bound.chunk_count("m", 1000, 4) == 141
+  assert item_bound.chunk_count("m", 50, 4) == 32
+
+
+def test_zero_fixed_cost_does_not_split_into_single_items():
+  model = ChunkCostModel(decay=1.0)
+  model.record("m", 10, 0.05)
+  model.record("m", 1000, 10.0)
+  assert model.estimate("m")[0] == 0.0
+  assert model.chunk_count("m", 10000, 4) == 89
+  with pytest.raises(ValueError):
+    optimal_chunk_count(0.0, 0.01, 10000, 4, min_fixed=0)
+
+
+def test_pack_chunks_balances_cost_and_dispatches_largest_first():
+  data = ["C" * n for n in [1, 9, 2, 8, 3, 7, 10, 10]]
+  rows = pack_chunks(data, 3)
+  loads = [sum(len(data[i]) for i in chunk) for chunk in rows]
+  assert loads == sorted(loads, reverse=True)
+  assert max(loads) - min(loads) <= 1
+  assert sorted(i for chunk in rows for i in chunk) == list(range(len(data)))
+  assert all(chunk == sorted(chunk) for chunk in rows)
+
+
+def test_pack_chunks_uses_custom_cost():
+  rows = pack_chunks(["a", "b", "c", "d"], 2, cost=lambda x: 10 if x == "d" else 1)
+  assert rows == [[3], [0, 1, 2]]
+
+
+def test_restore_order_undoes_packing():
+  data = ["CCC", "C", "CCCCC", "CC", "CCCC"]
+  rows = pack_chunks(data, 2)
+  results = [data[i].lower() for chunk in rows for i in chunk]
+  assert restore_order(rows, results) == [x.lower() for x in data]
@@ -0,0 +1,209 @@
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy, orjson, pytest
+
+from ersilia_pack.templates.coordinator import Coordinator, weighted_shards
+from ersilia_pack.templates.exceptions.errors import AppException
+from ersilia_pack.templates.retry import RowError
+from ersilia_pack.templates import utils
+from ersilia_pack.templates.utils import generate_resp_body
+
+
+def _serve(
+  free_slots=4, ready=True, fail=False, split=False, delay=0, paths=None, junk=False
+):
+  """A stand-in peer on a local port; `seen` records the inputs of each run and
+  `paths` its request paths."""
+  seen = []
+
+  class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+      pass
+
+    def _reply(self, code, body):
+      self.send_response(code)
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def do_GET(self):
+      health = {
+        "warmup": {"ready": ready},
+        "scheduler": {"limit": free_slots, "in_use": 0, "queued": 0},
+      }
+      self._reply(200, orjson.dumps(health))
+
+    def do_POST(self):
+      inputs = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+      seen.append(inputs)
+      if paths is not None:
+        paths.append(self.path)
+      time.sleep(delay)
+      if fail:
+        return self._reply(500, b"{}")
+      if junk:
+        return self._reply(200, b"not a result")
+      if split:
+        body = {
+          "columns": ["value"],
+          "index": inputs,
+          "data": [[None] if x == "bad" else [x.lower()] for x in inputs],
+          "errors": ["Model exited with code 1" if x == "bad" else None for x in inputs],
+        }
+        return self._reply(200, orjson.dumps(body))
+      assert "output_type=heavy" in self.path
+      rows = [[len(x), len(x) * 0.5] for x in inputs]
+      self._reply(200, generate_resp_body(rows, "Float", ["n", "half"]))
+
+  server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server, f"http://127.0.0.1:{server.server_address[1]}", seen
+
+
+@pytest.fixture
+def peers():
+  servers = []
+
+  def start(**kwargs):
+    server, url, seen = _serve(**kwargs)
+    servers.append(server)
+    return url, seen
+
+  yield start
+  for server in servers:
+    server.shutdown()
+    server.server_close()
+
+
+def test_weighted_shards_are_contiguous_and_proportional():
+  assert weighted_shards(10, [1, 1]) == [(0, 5), (5, 10)]
+  assert weighted_shards(10, [3, 1]) == [(0, 8), (8, 10)]
+  assert weighted_shards(2, [1, 1, 1]) == [(0, 1), (1, 2), (2, 2)]
+
+
+def test_shards_by_capacity_and_merges_in_order(peers):
+  big, big_seen = peers(free_slots=3)
+  small, small_seen = peers(free_slots=1)
+  data = ["C" * n for n in range(1, 9)]
+  results, header = Coordinator([big, small]).run(data, heavy=True)
+  assert header == ["n", "half"]
+  assert results.tolist() == [[float(n), n * 0.5] for n in range(1, 9)]
+  assert big_seen == [data[:6]] and small_seen == [data[6:]]
+
+
+def test_heavy_results_stay_one_array(peers):
+  url, _ = peers()
+  results, _ = Coordinator([url]).run(["C", "CC"], heavy=True)
+  assert isinstance(results, numpy.ndarray)
+  assert results.dtype == numpy.float32 and results.shape == (2, 2)
+
+
+def test_peers_get_the_request_task_type(peers, monkeypatch):
+  paths = []
+  url, _ = peers(split=True, paths=paths)
+  monkeypatch.setattr(utils, "coordinator", Coordinator([url]))
+  results, header = utils.run_on_peers(["A", "B"], "simple")
+  assert results == [["a"], ["b"]] and header == ["value"]
+  assert "orient=split" in paths[0] and "output_type=heavy" not in paths[0]
+
+
+def test_failed_shard_is_retried_on_another_peer(peers):
+  good, good_seen = peers()
+  bad, bad_seen = peers(fail=True)
+  coordinator = Coordinator([bad, good])
+  results, _ = coordinator.run(["C", "CC", "CCC", "N"], heavy=True)
+  assert results[:, 0].tolist() == [1.0, 2.0, 3.0, 1.0]
+  assert bad_seen == [["C", "CC"]]
+  assert sorted(good_seen) == [["C", "CC"], ["CCC", "N"]]
+  assert {s["url"]: s["failures"] for s in coordinator.stats()} == {bad: 1, good: 0}
+
+
+def test_not_ready_and_unreachable_peers_are_skipped(peers):
+  good, good_seen = peers()
+  warming, warming_seen = peers(ready=False)
+  gone = "http://127.0.0.1:9"
+  results, _ = Coordinator([warming, gone, good]).run(["C", "CC"], heavy=True)
+  assert len(results) == 2
+  assert good_seen == [["C", "CC"]] and warming_seen == []
+
+
+def test_string_outputs_travel_as_split_json(peers):
+  url, _ = peers(split=True)
+  results, header = Coordinator([url]).run(["A", "bad", "B"], heavy=False)
+  assert header == ["value"]
+  assert results == [["a"], RowError("Model exited with code 1"), ["b"]]
+
+
+def test_gives_up_when_no_peer_can_run_a_shard(peers):
+  first, _ = peers(fail=True)
+  second, _ = peers(fail=True)
+  with pytest.raises(AppException) as e:
+    Coordinator([first, second]).run(["C", "CC"], heavy=True)
+  assert e.value.status_code == 502
+  with pytest.raises(AppException) as e:
+    Coordinator(["http://127.0.0.1:9"]).run(["C"], heavy=True)
+  assert e.value.status_code == 503
+
+
+def test_peers_get_the_time_left_until_the_deadline(peers):
+  paths = []
+  url, _ = peers(paths=paths)
+  Coordinator([url]).run(["C"], heavy=True, deadline=time.monotonic() + 30)
+  (path,) = paths
+  timeout = float(path.split("timeout=")[1].split("&")[0])
+  assert 25 < timeout <= 30
+
+
+def test_deadline_and_cancel_abort_the_shards_in_flight(peers):
+  url, _ = peers(delay=1)
+  coordinator = Coordinator([url])
+  start = time.monotonic()
+  with pytest.raises(AppException) as e:
+    coordinator.run(["C"], heavy=True, deadline=time.monotonic() + 0.2)
+  assert e.value.status_code == 504 and time.monotonic() - start < 0.8
+  cancelled = threading.Event()
+  threading.Timer(0.2, cancelled.set).start()
+  start = time.monotonic()
+  with pytest.raises(AppException) as e:
+    coordinator.run(["C"], heavy=True, cancelled=cancelled)
+  assert e.value.status_code == 499 and time.monotonic() - start < 0.8
+  assert coordinator.stats()[0]["failures"] == 0
+
+
+def test_probes_do_not_queue_behind_shard_runs(peers):
+  url, _ = peers(delay=1)
+  coordinator = Coordinator([url])
+  runs = [
+    threading.Thread(target=coordinator.run, args=(["C"], True)) for _ in range(2)
+  ]
+  for run in runs:
+    run.start()
+  time.sleep(0.2)
+  start = time.monotonic()
+  assert coordinator.capacities()[coordinator.peers[0]] == 4
+  assert time.monotonic() - start < 0.5
+  for run in runs:
+    run.join()
+
+
+def test_malformed_responses_count_against_the_peer(peers):
+  good, _ = peers()
+  junk, _ = peers(junk=True)
+  coordinator = Coordinator([junk, good])
+  results, _ = coordinator.run(["C", "CC"], heavy=True)
+  assert results[:, 0].tolist() == [1.0, 2.0]
+  assert {s["url"]: s["failures"] for s in coordinator.stats()} == {junk: 1, good: 0}
+
+
+def test_own_errors_are_not_blamed_on_peers(peers, monkeypatch):
+  url, _ = peers()
+  coordinator = Coordinator([url])
+
+  def broken(*args):
+    raise TypeError("bug")
+
+  monkeypatch.setattr(coordinator.peers[0], "run", broken)
+  with pytest.raises(TypeError):
+    coordinator.run(["C"], heavy=True)
+  assert coordinator.stats()[0]["failures"] == 0
@@ -0,0 +1,105 @@
+import asyncio, os, threading, time
+
+import psutil, pytest
+
+from ersilia_pack.templates import runner, utils
+from ersilia_pack.templates.taskio import CancelFlag
+from ersilia_pack.templates.exceptions.errors import AppException
+
+RUN_SH = """
+sleep 30 &
+echo $! > "$2.child"
+wait
+"""
+
+
+@pytest.fixture
+def framework(tmp_path, monkeypatch):
+  (tmp_path / "run.sh").write_text(RUN_SH)
+  monkeypatch.setattr(runner, "FRAMEWORK_FOLDER", str(tmp_path))
+  monkeypatch.setattr(runner, "RESIDENT_RUNNER", False)
+  return tmp_path
+
+
+def _alive(pid):
+  # An orphan killed with its group stays a zombie until PID 1 reaps it.
+  try:
+    return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+  except psutil.NoSuchProcess:
+    return False
+
+
+def test_deadline_kills_process_group(framework):
+  input_f = str(framework / "input.csv")
+
+  async def main():
+    with pytest.raises(AppException) as info:
+      await utils.run_with_deadline(
+        runner.run_model_async(input_f, str(framework / "output.csv")), 0.5
+      )
+    return info.value
+
+  exc = asyncio.run(main())
+  assert exc.status_code == 504
+  child = int((framework / "input.csv.child").read_text())
+  for _ in range(50):
+    if not _alive(child):
+      break
+    time.sleep(0.02)
+  assert not _alive(child)
+
+
+def _child_of(input_f):
+  for _ in range(50):
+    if os.path.exists(f"{input_f}.child"):
+      break
+    time.sleep(0.02)
+  with open(f"{input_f}.child") as f:
+    return int(f.read())
+
+
+def _wait_dead(pid):
+  for _ in range(100):
+    if not _alive(pid):
+      return True
+    time.sleep(0.02)
+  return False
+
+
+def test_deadline_kills_sync_runs(framework):
+  input_f = os.path.join(utils.temp_folder(), "input-sync-deadline_0.csv")
+
+  async def main():
+    with pytest.raises(AppException) as info:
+      await utils.run_with_deadline(
+        utils.to_thread(
+          utils.run_sequential_data, "sync-deadline", ["C"], "eos0test", "simple"
+        ),
+        0.5,
+      )
+    return info.value
+
+  start = time.monotonic()
+  assert asyncio.run(main()).status_code == 504
+  assert time.monotonic() - start < 5
+  assert _wait_dead(_child_of(input_f))
+  os.remove(f"{input_f}.child")
+
+
+def test_cancel_flag_kills_a_running_model(framework, tmp_path):
+  input_f = str(framework / "input.csv")
+  flag = CancelFlag("run", folder=str(tmp_path))
+  threading.Timer(0.3, flag.set).start()
+  start = time.monotonic()
+  with pytest.raises(runner.RunCancelled):
+    runner.run_model(input_f, str(framework / "output.csv"), 30, flag)
+  assert time.monotonic() - start < 5
+  assert _wait_dead(_child_of(input_f))
+
+
+def test_deadline_returns_result_in_time():
+  async def work():
+    await asyncio.sleep(0.01)
+    return "done"
+
+  assert asyncio.run(utils.run_with_deadline(work(), 5)) == "done"
@@ -0,0 +1,49 @@
+import asyncio
+
+from ersilia_pack.templates import utils
+
+METADATA = {"Identifier": "eos0test", "Task": ["Representation"]}
+
+
+def test_dedupe_inputs_and_fan_out():
+  unique, positions = utils.dedupe_inputs(["CC", "C", "CC", "N", "C", "CC"])
+  assert unique == ["CC", "C", "N"]
+  assert positions == [0, 1, 0, 2, 1, 0]
+  assert utils.fan_out([[2], [1], [7]], positions) == [[2], [1], [2], [7], [1], [2]]
+
+
+def _run(monkeypatch, data, metadata):
+  seen = []
+
+  async def get_cached_or_compute_async(model_id, inputs, *args, **kwargs):
+    seen.append(list(inputs))
+    return [[len(x)] for x in inputs], ["length"]
+
+  monkeypatch.setattr(utils, "ASYNC_EXECUTION", True)
+  monkeypatch.setattr(utils, "get_cached_or_compute_async", get_cached_or_compute_async)
+  stats = {}
+  results, header = asyncio.run(
+    utils.run_cached_or_compute("eos0test", data, "tag", 4, 1, metadata, stats=stats)
+  )
+  return seen, results, stats
+
+
+def test_duplicates_are_computed_once(monkeypatch):
+  seen, results, stats = _run(monkeypatch, ["CCC", "C", "CCC", "CCC"], METADATA)
+  assert seen == [["CCC", "C"]]
+  assert results == [[3], [1], [3], [3]]
+  assert stats == {"inputs": 4, "unique": 2, "failed": 0}
+
+
+def test_variable_models_are_not_deduplicated(monkeypatch):
+  metadata = {**METADATA, "Task": ["Generative"]}
+  seen, results, stats = _run(monkeypatch, ["C", "C"], metadata)
+  assert seen == [["C", "C"]]
+  assert stats == {"inputs": 2, "unique": 2, "failed": 0}
+
+
+def test_only_unique_heavy_inputs_skip_deduplication():
+  assert not utils.has_duplicates(["C", "CC", "N"], METADATA)
+  assert utils.has_duplicates(["C", "CC", "C"], METADATA)
+  variable = {**METADATA, "Output Consistency": "Variable"}
+  assert not utils.has_duplicates(["C", "C"], variable)
@@ -0,0 +1,22 @@
+import subprocess, sys
+
+from ersilia_pack.templates.footprint import FootprintStore, PeakRss
+
+ALLOCATE = "import time; x = bytearray(64 * 2**20); time.sleep(0.3)"
+
+
+def test_peak_rss_covers_child_processes():
+  proc = subprocess.Popen(["bash", "-c", f'{sys.executable} -c "{ALLOCATE}"'])
+  with PeakRss(proc.pid, interval=0.05) as rss:
+    proc.wait()
+  assert rss.peak > 64 * 2**20
+
+
+def test_store_keeps_rolling_max_and_persists(tmp_path):
+  path = tmp_path / "footprint.json"
+  store = FootprintStore(str(path), window=2)
+  assert store.estimate("eos0test") is None
+  for peak in [300, 100, 200]:
+    store.record("eos0test", peak)
+  assert store.estimate("eos0test") == 200
+  assert FootprintStore(str(path), window=2).estimate("eos0test") == 200
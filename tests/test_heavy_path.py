@@ -0,0 +1,53 @@
+import json
+
+import numpy
+
+from ersilia_pack.templates import utils
+from ersilia_pack.templates.chunking import restore_order
+
+
+def _write_bin(path, arr, columns):
+  meta = {"shape": list(arr.shape), "dtype": arr.dtype.str, "columns": columns}
+  with open(path, "wb") as f:
+    f.write((json.dumps(meta) + "\n").encode("utf-8"))
+    f.write(arr.tobytes())
+
+
+def test_heavy_chunk_is_read_as_array(tmp_path):
+  path = tmp_path / "output.bin"
+  arr = numpy.arange(6, dtype=numpy.float32).reshape(2, 3)
+  _write_bin(path, arr, ["a", "b", "c"])
+  values, columns = utils._read_chunk(str(path), "heavy")
+  assert isinstance(values, numpy.ndarray) and not isinstance(values, numpy.memmap)
+  assert values.dtype == numpy.float32
+  assert values.tolist() == arr.tolist()
+  assert columns == ["a", "b", "c"]
+
+
+def test_chunks_are_joined_and_reordered_as_arrays():
+  parts = [numpy.array([[2.0], [0.0]]), numpy.array([[1.0]])]
+  joined = utils.concat_results(parts)
+  assert isinstance(joined, numpy.ndarray)
+  restored = restore_order([[2, 0], [1]], joined)
+  assert restored[:, 0].tolist() == [0.0, 1.0, 2.0]
+  assert utils.concat_results([[[1]], [[2]]]) == [[1], [2]]
+
+
+def test_fan_out_and_merge_keep_arrays():
+  arr = numpy.array([[1], [2]], dtype=numpy.int32)
+  assert utils.fan_out(arr, [1, 0, 1]).tolist() == [[2], [1], [2]]
+  assert utils.merge_computed([None, None], [0, 1], arr) is arr
+  merged = utils.merge_computed([[5], None], [1], arr[:1])
+  assert merged[0] == [5] and merged[1].tolist() == [1]
+
+
+def test_response_body_matches_for_arrays_and_lists():
+  rows = [[0.5, 1.5], [2.5, 3.5]]
+  from_lists = utils.generate_resp_body(rows, "Float", ["a", "b"])
+  from_array = utils.generate_resp_body(
+    numpy.array(rows, dtype=numpy.float64), "Float", ["a", "b"]
+  )
+  assert from_lists == from_array
+  header, body = from_array.split(b"\n", 1)
+  assert json.loads(header)["shape"] == [2, 2]
+  assert numpy.frombuffer(body, dtype=numpy.float32).tolist() == [0.5, 1.5, 2.5, 3.5]
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from ersilia_pack.templates.hedging import gather_hedged
+
+
+def _runner(delays, log):
+  async def run(i, copy):
+    log.append((i, copy))
+    try:
+      await asyncio.sleep(delays.get((i, copy), 0.01))
+    except asyncio.CancelledError:
+      log.append((i, copy, "cancelled"))
+      raise
+    return f"{i}/{copy}"
+
+  return run
+
+
+def test_straggler_is_hedged_and_loser_cancelled():
+  log = []
+  run = _runner({(3, 0): 5.0}, log)
+  results = asyncio.run(gather_hedged(run, 4, quorum=0.75, multiplier=3))
+  assert results == ["0/0", "1/0", "2/0", "3/1"]
+  assert (3, 0, "cancelled") in log
+
+
+def test_no_hedge_without_idle_slot_or_straggler():
+  log = []
+  run = _runner({(1, 0): 0.2}, log)
+  results = asyncio.run(
+    gather_hedged(run, 2, can_hedge=lambda: False, quorum=0.5, multiplier=2)
+  )
+  assert results == ["0/0", "1/0"]
+  assert all(copy == 0 for _, copy, *_ in log)
+
+
+def test_failure_only_when_every_copy_fails():
+  async def run(i, copy):
+    await asyncio.sleep(0.5 if (i, copy) == (1, 0) else 0.01)
+    if copy == 0 and i == 1:
+      raise RuntimeError("slow and broken")
+    return i
+
+  assert asyncio.run(gather_hedged(run, 2, quorum=0.5, multiplier=2)) == [0, 1]
+
+  async def broken(i, copy):
+    raise RuntimeError("broken")
+
+  with pytest.raises(RuntimeError):
+    asyncio.run(gather_hedged(broken, 2))
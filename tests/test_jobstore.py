@@ -0,0 +1,129 @@
+import asyncio, os
+
+import pytest
+
+from ersilia_pack.templates import jobstore
+from ersilia_pack.templates.jobstore import DiskJobStore
+from ersilia_pack.templates.retry import RowError
+from ersilia_pack.templates.routers import job
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+  store = DiskJobStore(str(tmp_path / "jobs"))
+  monkeypatch.setattr(jobstore, "job_store", store)
+  return store
+
+
+def test_checkpoints_round_trip(store):
+  async def scenario():
+    await store.create("j1", {"job_id": "j1", "status": "pending"}, ["C", "N"])
+    await store.save_chunk("j1", 1, [RowError("boom")], ["score"])
+    await store.save_chunk("j1", 0, [["1.5"]], ["score"])
+    assert await store.inputs("j1") == ["C", "N"]
+    assert await store.chunks("j1") == {
+      0: ([["1.5"]], ["score"]),
+      1: ([RowError("boom")], ["score"]),
+    }
+    assert [s["job_id"] for s in await store.unfinished()] == ["j1"]
+    await store.finish("j1", [{"score": 1.5}])
+    assert sorted(await store.names("j1")) == ["result", "state"]
+    assert (await store.state("j1"))["status"] == "completed"
+    assert await store.unfinished() == []
+
+  asyncio.run(scenario())
+
+
+def test_claims_of_dead_owners_are_taken_over(store):
+  async def scenario():
+    assert await store.claim("j1")
+    assert await store.claim("j1")  # same process
+    await store.put("j1", "owner", b"999999999:0.0")
+    assert await store.claim("j1")
+
+  asyncio.run(scenario())
+
+
+def test_resumed_job_skips_finished_chunks(store, monkeypatch):
+  computed = []
+
+  async def fake_compute(model_id, data, tag, *args, **kwargs):
+    computed.append(list(data))
+    return [[f"{x}!"] for x in data], ["out"]
+
+  monkeypatch.setattr(job, "run_cached_or_compute", fake_compute)
+  monkeypatch.setattr(job, "JOB_CHUNK_SIZE", 2)
+  monkeypatch.setattr(job, "jobs", {"j1": {"status": "pending", "result": None}})
+  data = ["A", "B", "C", "D", "E"]
+
+  async def scenario():
+    await store.create("j1", {"job_id": "j1", "status": "pending"}, data)
+    await store.save_chunk("j1", 0, [["A!"], ["B!"]], ["out"])
+    await job.process_job(
+      "j1", "eos0abc", data, 2, 1, {"Output Type": ["String"]}, "records"
+    )
+
+  asyncio.run(scenario())
+  assert computed == [["C", "D"], ["E"]]
+  assert job.jobs["j1"]["status"] == "completed"
+  assert [r["out"] for r in job.jobs["j1"]["result"]] == ["A!", "B!", "C!", "D!", "E!"]
+  assert not any(n.startswith("chunk-") for n in os.listdir(store._path("j1")))
+
+
+def test_rescan_takes_over_jobs_once_their_owner_is_gone(store, monkeypatch):
+  computed = []
+
+  async def fake_compute(model_id, data, tag, *args, **kwargs):
+    computed.append(list(data))
+    return [[x] for x in data], ["out"]
+
+  async def fake_metadata():
+    return {"Identifier": "eos0abc", "Output Type": ["String"]}
+
+  monkeypatch.setattr(job, "run_cached_or_compute", fake_compute)
+  monkeypatch.setattr(job, "get_metadata", fake_metadata)
+  monkeypatch.setattr(job, "jobs", {"j1": {"status": "pending", "result": None}})
+  state = {
+    "job_id": "j1",
+    "status": "pending",
+    "orient": "records",
+    "min_workers": 1,
+    "max_workers": 2,
+    "priority": "batch",
+  }
+
+  async def scenario():
+    await store.create("j1", state, ["A"])
+    alive = jobstore.process_token(os.getppid()).encode()
+    await store.put("j1", "owner", alive)
+    await job.process_job("j1", "eos0abc", ["A"], 2, 1, {}, "records")
+    assert "j1" not in job.jobs and computed == []
+    await job.resume_jobs()
+    assert computed == []
+    await store.put("j1", "owner", b"999999999:0.0")
+    await job.resume_jobs()
+    for _ in range(100):
+      if job.jobs["j1"]["status"] == "completed":
+        break
+      await asyncio.sleep(0.01)
+
+  asyncio.run(scenario())
+  assert computed == [["A"]]
+  assert job.jobs["j1"]["status"] == "completed"
+
+
+def test_heartbeat_renews_the_claim(store, monkeypatch):
+  renewed = []
+
+  async def renew(job_id):
+    renewed.append(job_id)
+
+  monkeypatch.setattr(store, "renew", renew)
+
+  async def scenario():
+    task = asyncio.ensure_future(job._heartbeat(store, "j1", interval=0.01))
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+  asyncio.run(scenario())
+  assert len(renewed) >= 2 and set(renewed) == {"j1"}
@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ersilia_pack.templates.batcher import MicroBatcher
+
+
+@pytest.fixture
+def executor():
+  executor = ThreadPoolExecutor(max_workers=2)
+  yield executor
+  executor.shutdown()
+
+
+def test_concurrent_requests_share_one_batch(executor):
+  calls = []
+
+  def run_batch(key, inputs, deadline, cancelled):
+    calls.append(list(inputs))
+    return executor.submit(lambda: ([[len(x)] for x in inputs], ["length"]))
+
+  batcher = MicroBatcher(run_batch, max_batch_size=6, max_wait_time=5)
+  requests = [["C", "CC"], ["CCC"], ["CCCC", "CCCCC", "CCCCCC"]]
+  futures = [batcher.submit("run", r) for r in requests]
+  results = [f.result(timeout=5) for f in futures]
+  batcher.close()
+
+  assert calls == [["C", "CC", "CCC", "CCCC", "CCCCC", "CCCCCC"]]
+  assert results[0] == ([[1], [2]], ["length"])
+  assert results[1] == ([[3]], ["length"])
+  assert results[2] == ([[4], [5], [6]], ["length"])
+
+
+def test_wait_window_flushes_partial_batch(executor):
+  done = threading.Event()
+
+  def run_batch(key, inputs, deadline, cancelled):
+    done.set()
+    return executor.submit(lambda: ([[x] for x in inputs], ["value"]))
+
+  batcher = MicroBatcher(run_batch, max_batch_size=100, max_wait_time=0.05)
+  future = batcher.submit("run", ["C"])
+  assert future.result(timeout=5) == ([["C"]], ["value"])
+  assert done.is_set()
+  batcher.close()
+
+
+def test_batch_failure_reaches_every_request(executor):
+  def run_batch(key, inputs, deadline, cancelled):
+    return executor.submit(lambda: 1 / 0)
+
+  batcher = MicroBatcher(run_batch, max_batch_size=2, max_wait_time=5)
+  futures = [batcher.submit("run", ["C"]), batcher.submit("run", ["CC"])]
+  for future in futures:
+    with pytest.raises(ZeroDivisionError):
+      future.result(timeout=5)
+  batcher.close()
+
+
+def test_batch_runs_until_its_last_deadline_and_last_cancel(executor):
+  limits = []
+
+  def run_batch(key, inputs, deadline, cancelled):
+    limits.append((deadline, cancelled))
+    return executor.submit(lambda: ([[x] for x in inputs], ["value"]))
+
+  batcher = MicroBatcher(run_batch, max_batch_size=2, max_wait_time=5)
+  first, second = threading.Event(), threading.Event()
+  futures = [
+    batcher.submit("run", ["C"], deadline=5.0, cancelled=first),
+    batcher.submit("run", ["CC"], deadline=10.0, cancelled=second),
+  ]
+  for future in futures:
+    future.result(timeout=5)
+  batcher.close()
+
+  ((deadline, cancelled),) = limits
+  assert deadline == 10.0
+  first.set()
+  assert not cancelled.is_set()
+  second.set()
+  assert cancelled.is_set()
+
+
+def test_failed_batch_is_retried_per_request(executor):
+  calls = []
+
+  def run_batch(key, inputs, deadline, cancelled):
+    calls.append(list(inputs))
+
+    def run():
+      if "bad" in inputs:
+        raise RuntimeError("Model exited with code 1")
+      return [[x] for x in inputs], ["value"]
+
+    return executor.submit(run)
+
+  batcher = MicroBatcher(run_batch, max_batch_size=3, max_wait_time=5)
+  good = batcher.submit("run", ["C", "CC"])
+  bad = batcher.submit("run", ["bad"])
+  assert good.result(timeout=5) == ([["C"], ["CC"]], ["value"])
+  with pytest.raises(RuntimeError):
+    bad.result(timeout=5)
+  batcher.close()
+  assert calls[0] == ["C", "CC", "bad"]
+  assert sorted(calls[1:]) == [["C", "CC"], ["bad"]]
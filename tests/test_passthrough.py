@@ -0,0 +1,67 @@
+import asyncio, json, os
+
+import numpy
+
+from ersilia_pack.templates import utils
+from ersilia_pack.templates.passthrough import BinFilesResponse, bin_passthrough
+
+
+def _write_bin(path, arr, columns):
+  meta = {"shape": list(arr.shape), "dtype": arr.dtype.str, "columns": columns}
+  with open(path, "wb") as f:
+    f.write((json.dumps(meta) + "\n").encode("utf-8"))
+    f.write(arr.tobytes())
+  return str(path), len(arr)
+
+
+def _chunks(tmp_path, dtype=numpy.float32):
+  a = numpy.arange(6, dtype=dtype).reshape(2, 3)
+  b = numpy.arange(6, 9, dtype=dtype).reshape(1, 3)
+  files = [
+    _write_bin(tmp_path / "output-0.bin", a, ["x", "y", "z"]),
+    _write_bin(tmp_path / "output-1.bin", b, ["x", "y", "z"]),
+  ]
+  return files, numpy.concatenate([a, b])
+
+
+def _send(response, extensions=None):
+  messages = []
+
+  async def send(message):
+    messages.append(message)
+
+  scope = {"type": "http", "extensions": extensions or {}}
+  asyncio.run(response(scope, None, send))
+  return messages
+
+
+def test_body_matches_in_memory_response(tmp_path):
+  files, arr = _chunks(tmp_path)
+  header_line, parts = bin_passthrough(files, numpy.float32)
+  response = BinFilesResponse(header_line, parts)
+  messages = _send(response)
+  body = b"".join(m["body"] for m in messages[1:])
+  assert body == utils.generate_resp_body(arr, "Float", ["x", "y", "z"])
+  assert int(response.headers["content-length"]) == len(body)
+  assert not any(os.path.exists(path) for path, _ in files)
+
+
+def test_zero_copy_send_when_server_supports_it(tmp_path):
+  files, _ = _chunks(tmp_path)
+  header_line, parts = bin_passthrough(files, numpy.float32)
+  messages = _send(
+    BinFilesResponse(header_line, parts), {"http.response.zerocopysend": {}}
+  )
+  zerocopy = [m for m in messages if m["type"] == "http.response.zerocopysend"]
+  assert [(m["offset"], m["count"]) for m in zerocopy] == [
+    (parts[0][1], 24),
+    (parts[1][1], 12),
+  ]
+
+
+def test_mismatched_dtype_is_not_passed_through(tmp_path):
+  files, arr = _chunks(tmp_path, dtype=numpy.float64)
+  assert bin_passthrough(files, numpy.float32) is None
+  results, header = utils.load_bin_files(files)
+  assert results.tolist() == arr.tolist() and header == ["x", "y", "z"]
+  assert not any(os.path.exists(path) for path, _ in files)
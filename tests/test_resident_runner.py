@@ -0,0 +1,169 @@
+import asyncio, subprocess, sys, time
+
+import pytest
+
+from ersilia_pack.templates import pool, runner, utils
+from ersilia_pack.templates.runner import (
+  AsyncResidentRunner,
+  ResidentRunner,
+  ResidentRunnerError,
+)
+
+RESIDENT_PY = """
+import json, sys, time
+
+print("model loaded")
+sys.stdout.flush()
+for line in sys.stdin:
+  request = json.loads(line)
+  with open(request["input"]) as f:
+    rows = f.read().splitlines()[1:]
+  if "hang" in rows:
+    time.sleep(60)
+  if "boom" in rows:
+    print(json.dumps({"status": "error", "detail": "boom"}), flush=True)
+    continue
+  with open(request["output"], "w") as f:
+    f.write("length\\n")
+    for row in rows:
+      f.write(f"{len(row)}\\n")
+  print(json.dumps({"status": "ok"}), flush=True)
+"""
+
+
+@pytest.fixture
+def entrypoint(tmp_path):
+  script = tmp_path / "resident.py"
+  script.write_text(RESIDENT_PY)
+  sh = tmp_path / "run.sh"
+  sh.write_text(f'exec {sys.executable} {script} "$@"\n')
+  return str(sh)
+
+
+def _write_input(path, rows):
+  path.write_text("\n".join(["input"] + rows) + "\n")
+
+
+def test_resident_runner_serves_several_batches(entrypoint, tmp_path):
+  runner = ResidentRunner(entrypoint)
+  try:
+    pid = runner.pid
+    for i, rows in enumerate([["C", "CCO"], ["CCCC"]]):
+      input_f = tmp_path / f"input-{i}.csv"
+      output_f = tmp_path / f"output-{i}.csv"
+      _write_input(input_f, rows)
+      runner.run(str(input_f), str(output_f))
+      lines = output_f.read_text().splitlines()
+      assert lines == ["length"] + [str(len(r)) for r in rows]
+    assert runner.pid == pid
+    assert runner.is_alive()
+  finally:
+    runner.close()
+  assert not runner.is_alive()
+
+
+def test_resident_runner_reports_errors(entrypoint, tmp_path):
+  runner = ResidentRunner(entrypoint)
+  try:
+    input_f = tmp_path / "input.csv"
+    _write_input(input_f, ["boom"])
+    with pytest.raises(ResidentRunnerError, match="boom"):
+      runner.run(str(input_f), str(tmp_path / "output.csv"))
+    assert runner.is_alive()
+  finally:
+    runner.close()
+
+
+def test_hung_resident_runner_is_killed_after_the_timeout(entrypoint, tmp_path):
+  runner = ResidentRunner(entrypoint)
+  try:
+    input_f = tmp_path / "input.csv"
+    _write_input(input_f, ["hang"])
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+      runner.run(str(input_f), str(tmp_path / "output.csv"), timeout=0.5)
+    assert time.monotonic() - start < 10
+    assert not runner.is_alive()
+  finally:
+    runner.close()
+
+
+def test_async_resident_runner_serves_concurrent_batches(entrypoint, tmp_path):
+  batches = [["C", "CCO"], ["CCCC"], ["CC", "C", "CCCCC"]]
+
+  async def main():
+    runner = await AsyncResidentRunner.start(entrypoint)
+    try:
+      jobs = []
+      for i, rows in enumerate(batches):
+        input_f = tmp_path / f"input-{i}.csv"
+        _write_input(input_f, rows)
+        jobs.append(runner.run(str(input_f), str(tmp_path / f"output-{i}.csv")))
+      await asyncio.gather(*jobs)
+      assert runner.is_alive()
+    finally:
+      await runner.close()
+    assert not runner.is_alive()
+
+  asyncio.run(main())
+  for i, rows in enumerate(batches):
+    lines = (tmp_path / f"output-{i}.csv").read_text().splitlines()
+    assert lines == ["length"] + [str(len(r)) for r in rows]
+
+
+def test_async_resident_runner_reports_errors(entrypoint, tmp_path):
+  input_f = tmp_path / "input.csv"
+  _write_input(input_f, ["boom"])
+
+  async def main():
+    runner = await AsyncResidentRunner.start(entrypoint)
+    try:
+      with pytest.raises(ResidentRunnerError, match="boom"):
+        await runner.run(str(input_f), str(tmp_path / "output.csv"))
+      assert runner.is_alive()
+    finally:
+      await runner.close()
+
+  asyncio.run(main())
+
+
+def test_idle_runners_default_to_the_worker_budget(monkeypatch):
+  monkeypatch.setattr(utils, "scheduler", None)
+  monkeypatch.setattr(utils, "worker_budget", lambda: 12)
+  monkeypatch.setattr(runner, "worker_slots", runner.worker_slots)
+  monkeypatch.setattr(pool, "worker_slots", pool.worker_slots)
+  monkeypatch.setattr(pool, "worker_cpus", pool.worker_cpus)
+  monkeypatch.setattr(runner, "RESIDENT_MAX_IDLE", 0)
+  utils.get_scheduler()
+  assert runner.max_idle_runners() == 12
+  monkeypatch.setattr(runner, "RESIDENT_MAX_IDLE", 3)
+  assert runner.max_idle_runners() == 3
+
+
+def test_interrupted_run_does_not_return_the_runner(entrypoint, tmp_path, monkeypatch):
+  runners = []
+
+  def acquire():
+    runners.append(ResidentRunner(entrypoint))
+    return runners[-1]
+
+  monkeypatch.setattr(runner, "_idle_runners", [])
+  monkeypatch.setattr(runner, "acquire_runner", acquire)
+  input_f, output_f = tmp_path / "input.csv", str(tmp_path / "output.csv")
+  try:
+    _write_input(input_f, ["boom"])
+    with pytest.raises(ResidentRunnerError):
+      runner.run_resident(str(input_f), output_f)
+    assert runner._idle_runners == runners
+
+    def interrupt(resident, cpus):
+      raise KeyboardInterrupt
+
+    runner._idle_runners.clear()
+    monkeypatch.setattr(runner, "_bind_runner", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+      runner.run_resident(str(input_f), output_f)
+    assert runner._idle_runners == [] and not runners[-1].is_alive()
+  finally:
+    for r in runners:
+      r.close()
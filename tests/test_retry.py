@@ -0,0 +1,60 @@
+import asyncio, subprocess
+
+import pytest
+
+from ersilia_pack.templates import utils
+from ersilia_pack.templates.retry import Bisector, RowError
+
+
+def _model(bad, runs):
+  def run(items, key):
+    runs.append(key)
+    if any(item in bad for item in items):
+      raise subprocess.CalledProcessError(1, ["bash", "run.sh"])
+    return [[f"{item}!"] for item in items], ["out"]
+
+  return run
+
+
+def test_bad_inputs_are_isolated():
+  runs = []
+  results, header = Bisector().run(_model({"X"}, runs), ["C", "X", "N", "O"])
+  assert results == [["C!"], RowError("Model exited with code 1"), ["N!"], ["O!"]]
+  assert header == ["out"]
+  assert runs == ["", "a", "aa", "ab", "b"]
+
+
+def test_async_bisection_matches_sync():
+  run = _model({"X", "O"}, [])
+
+  async def run_async(items, key):
+    return run(items, key)
+
+  results, _ = asyncio.run(Bisector().run_async(run_async, ["C", "X", "N", "O"]))
+  assert results == Bisector().run(run, ["C", "X", "N", "O"])[0]
+  assert [isinstance(r, RowError) for r in results] == [False, True, False, True]
+
+
+def test_retries_are_bounded():
+  with pytest.raises(subprocess.CalledProcessError):
+    Bisector(max_runs=2).run(_model({"C", "N", "O"}, []), ["C", "N", "O"])
+
+
+def test_failed_rows_get_an_error_field():
+  results = [["1.0"], RowError("Model exited with code 1")]
+  records = utils.orient_to_json(results, ["score"], ["C", "X"], "records", ["Float"])
+  assert records == [
+    {"score": 1.0},
+    {"score": None, "error": "Model exited with code 1"},
+  ]
+  split = utils.orient_to_json(results, ["score"], ["C", "X"], "split", ["Float"])
+  assert split["data"] == [[1.0], [None]]
+  assert split["errors"] == [None, "Model exited with code 1"]
+
+
+def test_failed_rows_are_cached_only_as_negative_entries(monkeypatch):
+  error = RowError("Model exited with code 1")
+  assert utils._cache_loads(utils._cache_dumps(error)) == error
+  assert not utils._cacheable(error)
+  monkeypatch.setattr(utils, "NEGATIVE_CACHE", True)
+  assert utils._cacheable(error)
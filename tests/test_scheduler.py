@@ -0,0 +1,176 @@
+import asyncio, threading, time
+
+import pytest
+
+from ersilia_pack.templates.pool import WorkerPool
+from ersilia_pack.templates.scheduler import WorkerScheduler, current_lane, lane
+
+
+def test_slots_never_exceed_budget_and_waiters_queue():
+  scheduler = WorkerScheduler(2)
+  lease = scheduler.lease(4)
+  lease.acquire()
+  lease.acquire()
+  waiter = threading.Thread(target=lease.acquire)
+  waiter.start()
+  waiter.join(0.05)
+  assert waiter.is_alive()
+  assert scheduler.stats()["in_use"] == 2
+  assert scheduler.stats()["queued"] == 1
+  lease.release()
+  waiter.join(1)
+  assert not waiter.is_alive()
+  stats = scheduler.stats()
+  assert (stats["budget"], stats["limit"], stats["in_use"], stats["queued"]) == (2, 2, 2, 0)
+
+
+def test_freed_slot_goes_to_request_holding_fewest():
+  scheduler = WorkerScheduler(2)
+  greedy, fresh = scheduler.lease(2), scheduler.lease(2)
+  greedy.acquire()
+  greedy.acquire()
+  order = []
+  second = threading.Thread(target=lambda: (greedy.acquire(), order.append("greedy")))
+  second.start()
+  time.sleep(0.02)
+  first = threading.Thread(target=lambda: (fresh.acquire(), order.append("fresh")))
+  first.start()
+  time.sleep(0.02)
+  greedy.release()
+  first.join(1)
+  assert order == ["fresh"]
+  assert second.is_alive()
+  fresh.release()
+  second.join(1)
+  assert order == ["fresh", "greedy"]
+
+
+def test_lease_is_capped_at_its_want():
+  scheduler = WorkerScheduler(4)
+  lease = scheduler.lease(1)
+  lease.acquire()
+  waiter = threading.Thread(target=lease.acquire)
+  waiter.start()
+  waiter.join(0.05)
+  assert waiter.is_alive()
+  lease.release()
+  waiter.join(1)
+  assert scheduler.stats()["in_use"] == 1
+
+
+def test_limit_backs_off_on_slow_runs_and_recovers():
+  scheduler = WorkerScheduler(8, backoff=0.5, tolerance=2.0)
+  scheduler.observe("m", 10, 1.0)
+  assert scheduler.stats()["limit"] == 8
+  scheduler.observe("m", 10, 3.0)
+  assert scheduler.stats()["limit"] == 4
+  # A burst of slow runs from the same overload only backs off once.
+  scheduler.observe("m", 10, 3.0)
+  assert scheduler.stats()["limit"] == 4
+  # Runs of another size have their own baseline.
+  scheduler.observe("m", 1000, 50.0)
+  assert scheduler.stats()["limit"] == 4
+
+  lease = scheduler.lease(8)
+  for _ in range(4):
+    lease.acquire()
+  scheduler.observe("m", 10, 1.0)
+  assert scheduler.stats()["limit"] == pytest.approx(4.25)
+  for _ in range(4):
+    lease.release()
+  scheduler.observe("m", 10, 1.0)
+  assert scheduler.stats()["limit"] == pytest.approx(4.25)
+
+
+def _acquire_in_order(leases, names, order):
+  threads = []
+  for lease, name in zip(leases, names):
+    thread = threading.Thread(target=lambda l=lease, n=name: (l.acquire(), order.append(n)))
+    thread.start()
+    threads.append(thread)
+    time.sleep(0.02)
+  return threads
+
+
+def test_interactive_lane_preempts_bulk_at_chunk_boundary():
+  scheduler = WorkerScheduler(2, weights={"interactive": 8, "batch": 2, "background": 1})
+  bulk = scheduler.lease(2, lane="batch")
+  bulk.acquire()
+  bulk.acquire()
+  order = []
+  background, interactive = scheduler.lease(1, lane="background"), scheduler.lease(1)
+  threads = _acquire_in_order(
+    [background, bulk, interactive], ["background", "batch", "interactive"], order
+  )
+  assert scheduler.stats()["lanes"]["batch"] == {"in_use": 2, "queued": 1}
+  bulk.release()
+  time.sleep(0.02)
+  assert order == ["interactive"]
+  # With no slots held, batch's next share (1/2) is below background's (1/1).
+  bulk.release()
+  time.sleep(0.02)
+  assert order == ["interactive", "batch"]
+  interactive.release()
+  for thread in threads:
+    thread.join(1)
+  assert order == ["interactive", "batch", "background"]
+
+
+def test_bulk_lane_uses_idle_capacity():
+  scheduler = WorkerScheduler(3)
+  bulk = scheduler.lease(3, lane="background")
+  for _ in range(3):
+    bulk.acquire()
+  assert scheduler.stats()["lanes"]["background"]["in_use"] == 3
+
+
+def test_lease_defaults_to_context_lane():
+  scheduler = WorkerScheduler(1)
+  assert scheduler.lease().lane == "interactive"
+  with lane("batch"):
+    assert current_lane.get() == "batch"
+    assert scheduler.lease().lane == "batch"
+  assert scheduler.lease().lane == "interactive"
+
+
+def test_cancelled_async_waiter_does_not_leak_slot():
+  scheduler = WorkerScheduler(1)
+
+  async def main():
+    holder = scheduler.lease(1)
+    await holder.acquire_async()
+    task = asyncio.ensure_future(scheduler.lease(1).acquire_async())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+      await task
+    holder.release()
+    async with scheduler.lease(1).slot_async():
+      assert scheduler.stats()["in_use"] == 1
+
+  asyncio.run(main())
+  assert scheduler.stats()["in_use"] == 0
+  assert scheduler.stats()["queued"] == 0
+
+
+def test_pool_map_takes_slots_through_gate():
+  scheduler = WorkerScheduler(1)
+  pool = WorkerPool(max_workers=4, preload=[])
+  peak, lock = [0], threading.Lock()
+
+  def work(x):
+    with lock:
+      peak[0] = max(peak[0], scheduler.stats()["in_use"])
+    time.sleep(0.01)
+    return x
+
+  try:
+    results = list(
+      pool.map(work, range(6), threads=True, gate=scheduler.lease(4))
+    )
+  finally:
+    pool.shutdown()
+  assert results == list(range(6))
+  assert peak[0] == 1
+  time.sleep(0.01)
+  assert scheduler.stats()["in_use"] == 0
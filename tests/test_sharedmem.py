@@ -0,0 +1,48 @@
+import numpy
+import pytest
+
+from ersilia_pack.templates import utils
+from ersilia_pack.templates.pool import WorkerPool
+from ersilia_pack.templates.sharedmem import SharedResults, write_rows
+
+
+def _fill(handle, rows, value):
+  write_rows(handle, rows, numpy.full((len(rows), handle[1][1]), value))
+  return len(rows)
+
+
+@pytest.fixture
+def pool():
+  pool = WorkerPool(max_workers=2, start_method="fork", preload=[])
+  yield pool
+  pool.shutdown()
+
+
+def test_workers_fill_parent_array_in_place(pool):
+  with SharedResults((5, 3), "f8") as shared:
+    rows = [range(0, 2), [4, 2], [3]]
+    counts = list(
+      pool.map(_fill, [shared.handle] * 3, rows, [1.5, 2.5, 3.5])
+    )
+    assert counts == [2, 2, 1]
+    assert shared.array[:, 0].tolist() == [1.5, 1.5, 2.5, 3.5, 2.5]
+    assert shared.array.shape == (5, 3)
+
+
+def test_empty_results_are_allowed():
+  with SharedResults((0, 2048), "i8") as shared:
+    assert shared.array.tolist() == []
+
+
+@pytest.mark.parametrize(
+  "shared, async_execution, expected",
+  [(True, False, True), (True, True, False), (False, False, False)],
+)
+def test_shared_results_are_opt_in_for_the_sync_pool(
+  monkeypatch, shared, async_execution, expected
+):
+  monkeypatch.setattr(utils, "SHARED_RESULTS", shared)
+  monkeypatch.setattr(utils, "ASYNC_EXECUTION", async_execution)
+  monkeypatch.setattr(utils, "load_csv_data", lambda path: (["a", "b"], []))
+  layout = utils.shared_result_layout({"Output Type": ["Float"]}, "heavy")
+  assert (layout is not None) is expected
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from ersilia_pack.templates.chunking import ChunkCostModel
+from ersilia_pack.templates.default import StrategyEnum
+from ersilia_pack.templates.strategy import StrategyPlan, StrategySelector
+
+
+def _selector(fixed, per_item, exploration=0.0):
+  costs = ChunkCostModel(decay=1.0)
+  for n in [10, 100, 1000]:
+    costs.record("m", n, fixed + per_item * n)
+  return StrategySelector(costs=costs, exploration=exploration, rng=random.Random(0))
+
+
+def _observe(selector, strategy, workers, n, overhead):
+  plan = StrategyPlan(strategy, workers, None)
+  for size in [n, 2 * n]:
+    run = selector.run_time("m", strategy, size, workers)
+    selector.observe("m", plan, size, run + overhead)
+
+
+def test_no_plan_until_run_cost_is_known():
+  selector = StrategySelector(costs=ChunkCostModel())
+  assert selector.predict("m", 100, 4) == []
+  assert selector.choose("m", 100, 4) is None
+
+
+def test_startup_bound_model_runs_sequentially():
+  selector = _selector(fixed=5.0, per_item=0.0001)
+  _observe(selector, StrategyEnum.THREADS, 4, 100, 0.5)
+  _observe(selector, StrategyEnum.PROCESSES, 4, 100, 0.5)
+  plan = selector.choose("m", 100, 4)
+  assert plan.strategy == StrategyEnum.SEQUENTIAL
+  assert plan.seconds == pytest.approx(5.01)
+
+
+def test_item_bound_model_uses_every_worker():
+  selector = _selector(fixed=0.1, per_item=0.5)
+  plans = selector.predict("m", 1000, 4)
+  assert plans[0].workers == 4
+  assert plans[0].strategy != StrategyEnum.SEQUENTIAL
+  assert plans[-1].strategy == StrategyEnum.SEQUENTIAL
+
+
+def test_observed_overhead_changes_the_choice():
+  selector = _selector(fixed=0.1, per_item=0.5)
+  _observe(selector, StrategyEnum.THREADS, 4, 1000, 30.0)
+  _observe(selector, StrategyEnum.PROCESSES, 4, 1000, 1.0)
+  assert selector.choose("m", 1000, 4).strategy == StrategyEnum.PROCESSES
+  _observe(selector, StrategyEnum.PROCESSES, 4, 1000, 60.0)
+  assert selector.choose("m", 1000, 4).strategy == StrategyEnum.THREADS
+
+
+def test_respects_workers_and_strategies():
+  selector = _selector(fixed=0.1, per_item=0.5)
+  plans = selector.predict(
+    "m", 1000, 3, min_workers=2, strategies=(StrategyEnum.SEQUENTIAL, StrategyEnum.THREADS)
+  )
+  assert {plan.strategy for plan in plans} == {StrategyEnum.THREADS}
+  assert {plan.workers for plan in plans} == {2, 3}
+
+
+def test_exploration_tries_other_strategies():
+  selector = _selector(fixed=0.1, per_item=0.5, exploration=0.5)
+  chosen = {selector.choose("m", 1000, 4).strategy for _ in range(50)}
+  assert chosen == set(StrategyEnum)
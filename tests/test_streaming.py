@@ -0,0 +1,57 @@
+import asyncio, json
+
+from ersilia_pack.templates import utils
+from ersilia_pack.templates.chunking import contiguous_rows
+
+METADATA = {"Identifier": "eos0test", "Output Type": ["Integer"]}
+
+
+def _fake_chunks(monkeypatch, chunks, num_workers):
+  rows = contiguous_rows(len(chunk) for chunk in chunks)
+  monkeypatch.setattr(utils, "plan_chunks", lambda *args: (num_workers, chunks, rows))
+
+  async def run_in_slot(chunk, chunk_idx, base_tag, model_id, task_type, lease=None):
+    await asyncio.sleep(0.05 * (len(chunks) - chunk_idx))
+    return [[len(x)] for x in chunk], ["length"]
+
+  monkeypatch.setattr(utils, "run_in_slot", run_in_slot)
+
+
+def _collect(ordered):
+  async def main():
+    lines = []
+    async for block in utils.stream_ndjson(
+      [], "tag", 4, 1, METADATA, "simple", ordered=ordered
+    ):
+      lines.extend(json.loads(x) for x in block.decode().splitlines())
+    return lines
+
+  return asyncio.run(main())
+
+
+def test_stream_in_input_order(monkeypatch):
+  _fake_chunks(monkeypatch, [["C", "CC"], ["CCC"], ["CCCC"]], num_workers=3)
+  lines = _collect(ordered=True)
+  assert [line["index"] for line in lines] == [0, 1, 2, 3]
+  assert lines[1] == {"index": 1, "input": "CC", "output": {"length": 2}}
+
+
+def test_stream_in_completion_order(monkeypatch):
+  _fake_chunks(monkeypatch, [["C", "CC"], ["CCC"], ["CCCC"]], num_workers=3)
+  lines = _collect(ordered=False)
+  assert [line["index"] for line in lines] == [3, 2, 0, 1]
+  assert lines[0]["input"] == "CCCC"
+
+
+def test_stream_reports_failures_as_last_line(monkeypatch):
+  _fake_chunks(monkeypatch, [["C"], ["CC"]], num_workers=1)
+
+  async def run_in_slot(chunk, chunk_idx, *args, **kwargs):
+    if chunk_idx == 1:
+      raise RuntimeError("run.sh failed")
+    return [[1]], ["length"]
+
+  monkeypatch.setattr(utils, "run_in_slot", run_in_slot)
+  lines = _collect(ordered=True)
+  assert lines[0]["index"] == 0
+  assert "error" in lines[-1]
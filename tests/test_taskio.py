@@ -0,0 +1,84 @@
+import os, socket, subprocess, time
+
+from ersilia_pack.templates import taskio
+from ersilia_pack.templates.taskio import ChunkInput, sweep_stale_files
+
+
+def _write_lines(n):
+  def write(path):
+    with open(path, "w") as f:
+      for i in range(n):
+        f.write(f"C{i}\n")
+
+  return write
+
+
+def test_fifo_streams_input_to_reader(tmp_path):
+  path, out = str(tmp_path / "input-0.csv"), tmp_path / "copy.csv"
+  feed = ChunkInput(path, _write_lines(100000), fifo=True)
+  feed.open()
+  try:
+    subprocess.run(f"cat {path} > {out}", shell=True, check=True)
+  finally:
+    feed.close()
+  assert out.read_text().count("\n") == 100000
+  assert feed.error is None
+
+
+def test_fifo_writer_is_released_when_model_never_reads(tmp_path):
+  feed = ChunkInput(str(tmp_path / "input-0.csv"), _write_lines(100000), fifo=True)
+  feed.open()
+  start = time.monotonic()
+  feed.close()
+  assert time.monotonic() - start < 5
+
+
+def test_plain_input_is_written_up_front(tmp_path):
+  path = tmp_path / "input-0.csv"
+  ChunkInput(str(path), _write_lines(3), fifo=False).open()
+  assert path.read_text() == "C0\nC1\nC2\n"
+
+
+def test_sweep_removes_only_stale_task_files(tmp_path, monkeypatch):
+  live = tmp_path / "ersilia-live"
+  live.mkdir()
+  monkeypatch.setattr(taskio, "temp_folder", lambda: str(live))
+  stale, fresh, other = live / "output-a.csv", live / "input-b.csv", live / "notes.txt"
+  for path in (stale, fresh, other):
+    path.write_text("x")
+  old = time.time() - 100
+  for path in (stale, other):
+    os.utime(path, (old, old))
+
+  removed = sweep_stale_files([str(live)], max_age=50)
+  assert removed == 1
+  assert not stale.exists() and fresh.exists() and other.exists()
+
+
+def test_sweep_removes_folders_of_dead_owners_only(tmp_path):
+  host = socket.gethostname()
+  owners = {
+    "ersilia-dead": f"{host} {os.getpid()}:0",  # pid reused by another process
+    "ersilia-idle": f"{host} {taskio.process_token(os.getpid())}",
+    "ersilia-remote": f"elsewhere {os.getpid()}:0",
+    "ersilia-unmarked": None,
+  }
+  old = time.time() - 100
+  for name, owner in owners.items():
+    (tmp_path / name).mkdir()
+    if owner is not None:
+      (tmp_path / name / taskio.OWNER_MARKER).write_text(owner)
+    (tmp_path / name / "input-c.bin").write_text("x")
+    os.utime(tmp_path / name / "input-c.bin", (old, old))
+    os.utime(tmp_path / name, (old, old))
+
+  removed = sweep_stale_files([str(tmp_path / name) for name in owners], max_age=50)
+  assert removed == 1
+  assert not (tmp_path / "ersilia-dead").exists()
+  for name in ("ersilia-idle", "ersilia-remote", "ersilia-unmarked"):
+    assert (tmp_path / name / "input-c.bin").exists()
+
+
+def test_mark_owner_keeps_the_folder_alive(tmp_path):
+  taskio.mark_owner(str(tmp_path))
+  assert not taskio.owner_gone(str(tmp_path))
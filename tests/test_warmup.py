@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from ersilia_pack.templates import default, runner, warmup
+from ersilia_pack.templates.routers.metadata import compute_status
+
+
+@pytest.fixture
+def bundle(monkeypatch):
+  calls = []
+
+  async def fake_metadata():
+    return {"Identifier": "eos0abc"}
+
+  async def fake_compute(model_id, data, tag, *args):
+    calls.append((runner.current_api.get(), model_id, list(data), args[-1]))
+    return [["1"] for _ in data], ["out"]
+
+  monkeypatch.setattr(default, "ROOT_ENDPOINT_LOADED", False)
+  monkeypatch.setattr(warmup, "baseline", {})
+  monkeypatch.setattr(warmup, "warmup_error", None)
+  monkeypatch.setattr(warmup, "get_metadata", fake_metadata)
+  monkeypatch.setattr(warmup, "load_csv_data", lambda path: (["smiles"], [["C"], ["N"]]))
+  monkeypatch.setattr(warmup, "available_apis", lambda: ["calc", "run"])
+  monkeypatch.setattr(warmup, "run_cached_or_compute", fake_compute)
+  monkeypatch.setattr(warmup, "coordinator", None)
+  return calls
+
+
+def test_ready_only_after_every_api_ran(bundle):
+  assert compute_status() == "NOT_READY"
+  asyncio.run(warmup.warm_up())
+  assert compute_status() == "READY"
+  assert bundle == [
+    ("calc", "eos0abc:calc", ["C", "N"], False),
+    ("run", "eos0abc", ["C", "N"], False),
+  ]
+  status = warmup.warmup_status()
+  assert sorted(status["baseline"]) == ["calc", "run"]
+  assert status["baseline"]["run"]["items"] == 2 and status["error"] is None
+
+
+def test_failed_warm_up_stays_not_ready_and_retries(bundle, monkeypatch):
+  attempts = []
+
+  async def broken(*args):
+    attempts.append(1)
+    raise RuntimeError("model does not load")
+
+  monkeypatch.setattr(warmup, "run_cached_or_compute", broken)
+
+  async def main():
+    task = asyncio.ensure_future(warmup.warm_up(delay=0.01, max_delay=0.02))
+    await asyncio.sleep(0.2)
+    task.cancel()
+
+  asyncio.run(main())
+  assert compute_status() == "NOT_READY"
+  assert warmup.warmup_status()["error"] == "model does not load"
+  assert len(attempts) > 2
+
+
+def test_transient_failure_is_retried(bundle, monkeypatch):
+  fake_compute = warmup.run_cached_or_compute
+  failures = [RuntimeError("redis is still starting")]
+
+  async def flaky(*args):
+    if failures:
+      raise failures.pop()
+    return await fake_compute(*args)
+
+  monkeypatch.setattr(warmup, "run_cached_or_compute", flaky)
+  asyncio.run(warmup.warm_up(delay=0.01))
+  assert compute_status() == "READY"
+  assert warmup.warmup_status()["error"] is None
+
+
+class _Peers:
+  """A coordinator whose only peer reports `capacities` on successive probes."""
+
+  def __init__(self, capacities):
+    self.answers = list(capacities)
+
+  def capacities(self):
+    return {"peer": self.answers.pop(0)}
+
+
+def test_coordinator_is_ready_once_a_peer_is(bundle, monkeypatch):
+  monkeypatch.setattr(warmup, "coordinator", _Peers([None, None, 4.0]))
+  asyncio.run(warmup.warm_up(delay=0.01))
+  assert compute_status() == "READY"
+  assert bundle == []
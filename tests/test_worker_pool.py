@@ -0,0 +1,72 @@
+import os, threading, time
+
+import pytest
+
+from ersilia_pack.templates.default import temp_folder
+from ersilia_pack.templates.pool import WorkerPool
+from ersilia_pack.templates.runner import RunCancelled
+
+
+def _square(x):
+  return x * x
+
+
+def _sleep_and_return(x):
+  time.sleep(0.05 * (3 - x))
+  return x
+
+
+def _worker_temp_folder(_):
+  return temp_folder()
+
+
+@pytest.fixture
+def pool():
+  pool = WorkerPool(max_workers=2, start_method="fork", max_tasks=1, preload=[])
+  yield pool
+  pool.shutdown()
+
+
+def test_map_keeps_input_order(pool):
+  assert list(pool.map(_sleep_and_return, range(3))) == [0, 1, 2]
+  assert list(pool.map(_square, range(5), threads=True)) == [0, 1, 4, 9, 16]
+
+
+def test_pool_is_reused_and_recycled(pool):
+  list(pool.map(_square, range(2)))
+  assert pool.generation == 1
+  list(pool.map(_square, range(2)))
+  assert pool.generation == 2
+
+
+def test_map_respects_timeout(pool):
+  with pytest.raises(TimeoutError):
+    list(pool.map(time.sleep, [1], timeout=0.05))
+
+
+def test_cancelled_map_aborts_and_waits_for_running_tasks(pool):
+  cancelled, aborted = threading.Event(), threading.Event()
+  stopped = []
+
+  def task(x):
+    aborted.wait(5)
+    stopped.append(x)
+
+  threading.Timer(0.1, cancelled.set).start()
+  with pytest.raises(RunCancelled):
+    list(
+      pool.map(
+        task, range(4), threads=True, cancelled=cancelled, on_abort=aborted.set
+      )
+    )
+  assert aborted.is_set() and sorted(stopped) == [0, 1]
+
+
+def test_spawned_workers_share_the_server_temp_folder():
+  pool = WorkerPool(max_workers=1, start_method="spawn", preload=[])
+  try:
+    assert list(pool.map(os.getenv, ["ERSILIA_TEMP_FOLDER"])) == [None]
+    assert list(pool.map(_worker_temp_folder, [0])) == [temp_folder()]
+  finally:
+    pool.shutdown()
+  assert "ERSILIA_TEMP_FOLDER" not in os.environ